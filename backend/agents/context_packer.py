@@ -0,0 +1,164 @@
+import functools
+import math
+from typing import List, Optional, Union
+
+
+class TokenCounter:
+    """
+    Counts and cuts text in the tokens of a model: tiktoken for OpenAI-style
+    names or encodings, a Hugging Face tokenizer for hub ids, and ~4
+    characters per token when neither can be loaded.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.kind = "approx"
+        self._tokenizer = None
+        if name:
+            self._load(name)
+
+    def __repr__(self):
+        return f"<TokenCounter name='{self.name}' kind={self.kind}>"
+
+    def _load(self, name: str):
+        try:
+            import tiktoken
+
+            try:
+                self._tokenizer = tiktoken.encoding_for_model(name)
+            except KeyError:
+                self._tokenizer = tiktoken.get_encoding(name)
+            self.kind = "tiktoken"
+            return
+        except (ImportError, ValueError, KeyError):
+            pass
+        try:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(name)
+            self.kind = "huggingface"
+        except Exception as e:
+            print(f"[TokenCounter] No tokenizer for '{name}' ({e}), approximating")
+
+    def encode(self, text: str) -> list:
+        if self.kind == "tiktoken":
+            return self._tokenizer.encode(text, disallowed_special=())
+        if self.kind == "huggingface":
+            return self._tokenizer.encode(text, add_special_tokens=False)
+        return []
+
+    def count(self, text: str) -> int:
+        if self.kind == "approx":
+            return math.ceil(len(text) / 4)
+        return len(self.encode(text))
+
+    def head(self, text: str, max_tokens: int) -> str:
+        """The first `max_tokens` tokens of `text`."""
+        if self.kind == "approx":
+            return text[: max_tokens * 4]
+        return self._tokenizer.decode(self.encode(text)[:max_tokens])
+
+    def tail(self, text: str, max_tokens: int) -> str:
+        """The last `max_tokens` tokens of `text`."""
+        if max_tokens <= 0:
+            return ""
+        if self.kind == "approx":
+            return text[-max_tokens * 4 :]
+        return self._tokenizer.decode(self.encode(text)[-max_tokens:])
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(name: Optional[str] = None) -> TokenCounter:
+    """One TokenCounter (and loaded tokenizer) per name for the process."""
+    return TokenCounter(name)
+
+
+class ContextPacker:
+    """
+    Fits the variable part of a prompt (retrieved chunks, clinical notes)
+    into `budget` tokens of the answering model.
+
+    pack() keeps chunks in their retrieval rank, skips duplicates, truncates
+    the first chunk that no longer fits when at least `min_chunk_tokens`
+    remain, and drops the rest. pack_text() cuts a single long text in the
+    middle, keeping the head and the tail (`tail_ratio` of the budget), where
+    notes carry the diagnosis and the follow-up. Both return the packed text
+    and a report with the tokens before and after.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        tokenizer: Optional[str] = None,
+        min_chunk_tokens: int = 64,
+        tail_ratio: float = 0.3,
+        separator: str = "\n",
+    ):
+        self.budget = budget
+        self.counter = get_token_counter(tokenizer)
+        self.min_chunk_tokens = min_chunk_tokens
+        self.tail_ratio = tail_ratio
+        self.separator = separator
+
+    def __repr__(self):
+        return f"<ContextPacker budget={self.budget} tokenizer={self.counter.kind}>"
+
+    def _report(self, tokens_in: int, tokens_out: int, chunks_in: int, kept: int):
+        return {
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": tokens_in - tokens_out,
+            "chunks_in": chunks_in,
+            "chunks_kept": kept,
+        }
+
+    def pack(self, chunks: List[str]) -> tuple:
+        counts = [self.counter.count(chunk) for chunk in chunks]
+        separator_tokens = self.counter.count(self.separator)
+        kept, used, seen = [], 0, set()
+        for chunk, tokens in zip(chunks, counts):
+            if not chunk.strip() or chunk in seen:
+                continue
+            seen.add(chunk)
+            cost = tokens + (separator_tokens if kept else 0)
+            if used + cost <= self.budget:
+                kept.append(chunk)
+                used += cost
+                continue
+            remaining = self.budget - used - (separator_tokens if kept else 0)
+            if remaining >= self.min_chunk_tokens:
+                kept.append(self.counter.head(chunk, remaining))
+            break
+        text = self.separator.join(kept)
+        tokens_in = sum(counts) + separator_tokens * max(len(chunks) - 1, 0)
+        return text, self._report(
+            tokens_in, self.counter.count(text), len(chunks), len(kept)
+        )
+
+    def pack_text(self, text: str, marker: str = "\n[...]\n") -> tuple:
+        tokens_in = self.counter.count(text)
+        if tokens_in <= self.budget:
+            return text, self._report(tokens_in, tokens_in, 1, 1)
+        available = self.budget - self.counter.count(marker)
+        tail_tokens = int(available * self.tail_ratio)
+        packed = (
+            self.counter.head(text, available - tail_tokens)
+            + marker
+            + self.counter.tail(text, tail_tokens)
+        )
+        return packed, self._report(tokens_in, self.counter.count(packed), 1, 1)
+
+    def fit(self, context: Union[str, List[str]]) -> tuple:
+        """pack() for a list of chunks, pack_text() for a single text."""
+        if isinstance(context, str):
+            return self.pack_text(context)
+        return self.pack(list(context))
+
+
+def get_context_packer(
+    context_budget: Optional[int] = None, tokenizer: Optional[str] = None, **kwargs
+) -> Optional[ContextPacker]:
+    """Packer for a models.yaml entry; None when the model sets no context_budget."""
+    if not context_budget:
+        return None
+    return ContextPacker(context_budget, tokenizer=tokenizer, **kwargs)
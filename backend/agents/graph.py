@@ -1,5 +1,11 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import uuid
+from functools import partial
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, Optional
+from typing import TypedDict, Optional, Annotated
 from backend.agents.nodes import (
     symptom_node,
     ehr_node,
@@ -7,41 +13,235 @@ from backend.agents.nodes import (
     drug_node,
     treatment_node,
     inject_retrieved_context,
+    asymptom_node,
+    aehr_node,
+    aliterature_node,
+    adrug_node,
+    atreatment_node,
+    ainject_retrieved_context,
 )
+from backend.agents.templates import Runner
+from backend.agents.telemetry import span, annotate_span
 from langchain.schema import AIMessage
 
 
+def merge_state_value(current, update):
+    """
+    Reducer used for every AgentState key. Parallel nodes hand back their whole
+    view of the state, so an update only replaces the current value when it
+    actually carries one.
+    """
+    return current if update is None else update
+
+
+def merge_retrievals(current, update):
+    """Reducer for the per-run retrieval memo: keeps every node's searches."""
+    return {**(current or {}), **(update or {})}
+
+
 class AgentState(TypedDict):
-    symptoms: Optional[str]
-    question: Optional[str]
-    ehr_text: Optional[str]
-    medications: Optional[list[str]]
-    patient_profile: Optional[dict]
-    diagnosis: Optional[str]
-    summary: Optional[str]
-    literature_answer: Optional[str]
-    interaction_report: Optional[str]
-    treatment_plan: Optional[str]
-    context: Optional[str]
+    symptoms: Annotated[Optional[str], merge_state_value]
+    question: Annotated[Optional[str], merge_state_value]
+    ehr_text: Annotated[Optional[str], merge_state_value]
+    medications: Annotated[Optional[list[str]], merge_state_value]
+    patient_profile: Annotated[Optional[dict], merge_state_value]
+    diagnosis: Annotated[Optional[str], merge_state_value]
+    summary: Annotated[Optional[str], merge_state_value]
+    literature_answer: Annotated[Optional[str], merge_state_value]
+    interaction_report: Annotated[Optional[str], merge_state_value]
+    treatment_plan: Annotated[Optional[str], merge_state_value]
+    context: Annotated[Optional[str], merge_state_value]
+    # (query, k, filter) -> retrieved texts, shared by the nodes of one run
+    retrievals: Annotated[Optional[dict], merge_retrievals]
+
+
+# Node functions by graph node name, for sync (invoke) and async (ainvoke) graphs.
+SYNC_NODES = {
+    "symptom_checker": symptom_node,
+    "ehr_summarizer": ehr_node,
+    "literature_qa": literature_node,
+    "drug_checker": drug_node,
+    "treatment_planner": treatment_node,
+}
+ASYNC_NODES = {
+    "symptom_checker": asymptom_node,
+    "ehr_summarizer": aehr_node,
+    "literature_qa": aliterature_node,
+    "drug_checker": adrug_node,
+    "treatment_planner": atreatment_node,
+}
+
+# Upstream nodes each agent waits for when the graph runs in parallel mode.
+# Only drug_checker consumes another agent's output (the diagnosis).
+PARALLEL_DEPENDENCIES = {
+    "symptom_checker": ["inject_context"],
+    "ehr_summarizer": ["inject_context"],
+    "literature_qa": ["inject_context"],
+    "drug_checker": ["symptom_checker"],
+    "treatment_planner": ["inject_context"],
+}
+
+# Agents that are skipped (but still joined) when their input is missing.
+OPTIONAL_INPUTS = {
+    "symptom_checker": "symptoms",
+    "ehr_summarizer": "ehr_text",
+    "literature_qa": "question",
+}
+
+
+def _skip_without(key, node_fn):
+    if inspect.iscoroutinefunction(node_fn):
+
+        async def awrapped(state):
+            if state.get(key) is None:
+                return {}
+            return await node_fn(state)
+
+        return awrapped
+
+    def wrapped(state):
+        if state.get(key) is None:
+            return {}
+        return node_fn(state)
+
+    return wrapped
+
+
+def fingerprint_inputs(node_name: str, state: dict, reads: tuple, llm=None) -> str:
+    """Stable hash of the state keys a node reads (plus the model answering it)."""
+
+    def plain(value):
+        if hasattr(value, "content"):
+            return value.content
+        return serialize_state(value)
+
+    payload = {
+        "node": node_name,
+        "llm": list(Runner.describe_llm(llm)) if llm is not None else None,
+        "inputs": {key: plain(state.get(key)) for key in reads},
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _incremental(node_name, node_fn, reads, writes, agent_db, llm=None):
+    """
+    Reuses the stored output of a previous run when the node's inputs are
+    unchanged; otherwise runs the node and records its output for next time.
+    """
+
+    def lookup(state):
+        fingerprint = fingerprint_inputs(node_name, state, reads, llm)
+        cached = agent_db.get_node_output(node_name, fingerprint)
+        annotate_span(cache_hit=cached is not None, reused_output=cached is not None)
+        if cached is not None:
+            print(f"\u267b\ufe0f Inputs of {node_name} unchanged, reusing output")
+        return fingerprint, cached
+
+    def record(fingerprint, result):
+        agent_db.save_node_output(
+            node_name, fingerprint, serialize_state(result.get(writes))
+        )
+        return result
+
+    if inspect.iscoroutinefunction(node_fn):
+
+        async def awrapped(state):
+            # SQLite reads/writes block, so keep them off the event loop
+            fingerprint, cached = await asyncio.to_thread(lookup, state)
+            if cached is not None:
+                return {writes: deserialize_state(cached)}
+            return await asyncio.to_thread(record, fingerprint, await node_fn(state))
+
+        return awrapped
+
+    def wrapped(state):
+        fingerprint, cached = lookup(state)
+        if cached is not None:
+            return {writes: deserialize_state(cached)}
+        return record(fingerprint, node_fn(state))
+
+    return wrapped
+
+
+def _timed(node_name, node_fn, provider=None):
+    """Records a timing span (see backend.agents.telemetry) around a node."""
+    if inspect.iscoroutinefunction(node_fn):
+
+        async def awrapped(state):
+            with span(node_name, "node", provider=provider):
+                return await node_fn(state)
+
+        return awrapped
+
+    def wrapped(state):
+        with span(node_name, "node", provider=provider):
+            return node_fn(state)
+
+    return wrapped
 
 
 # -- Graph Definition --
-def build_graph(llm, retriever, **kwargs):
+def build_graph(
+    llm,
+    retriever,
+    parallel: bool = False,
+    asynchronous: bool = False,
+    agent_db=None,
+    checkpointer=None,
+    **kwargs,
+):
+    """
+    Builds the agent graph.
+
+    Args:
+        llm: LangChain chat model shared by all agents.
+        retriever (VectorStoreBase): Vector store used for context retrieval.
+        parallel (bool): Fan independent agents out concurrently and join them
+                         before END instead of running them as a chain.
+                         Every agent whose input is present runs, so unlike
+                         the chain (which routes a question straight to
+                         literature_qa) a question case also gets a
+                         diagnosis and EHR summary, and drug_checker then
+                         sees that diagnosis. Symptom-only cases produce the
+                         same outputs in both modes.
+        asynchronous (bool): Use the async nodes (Runner.arun_*); the compiled
+                             graph must then be driven with `ainvoke`.
+        agent_db (SqliteDB_Agent, optional): When given, agents whose declared
+                             inputs match a previous run reuse that output
+                             instead of calling the LLM again.
+        checkpointer (optional): LangGraph checkpointer (see
+                             SqliteDB_Agent.get_checkpointer) recording each
+                             node's output so runs can be resumed by run id.
+                             The sync SqliteSaver cannot back an async graph.
+        **kwargs: Forwarded to every node (embedding_model, index, ...).
+    """
+    if asynchronous and _sync_only(checkpointer):
+        raise ValueError(
+            f"{type(checkpointer).__name__} only supports invoke(); build the "
+            "async graph without a checkpointer or with an async saver."
+        )
+    # partial (not lambda) keeps async node functions detectable as coroutines
+    inject_fn = ainject_retrieved_context if asynchronous else inject_retrieved_context
+    nodes = {"inject_context": partial(inject_fn, vector_store=retriever, **kwargs)}
+    for name, node_fn in (ASYNC_NODES if asynchronous else SYNC_NODES).items():
+        nodes[name] = partial(node_fn, llm=llm, retriever=retriever, **kwargs)
+        if agent_db is not None:
+            nodes[name] = _incremental(
+                name, nodes[name], node_fn.reads, node_fn.writes, agent_db, llm
+            )
+    nodes = {
+        name: _timed(
+            name, node_fn, None if name == "inject_context" else Runner.provider_of(llm)
+        )
+        for name, node_fn in nodes.items()
+    }
+    if parallel:
+        return _build_parallel_graph(nodes, checkpointer=checkpointer)
+
     builder = StateGraph(AgentState)
-    builder.add_node(
-        "inject_context", lambda s: inject_retrieved_context(s, retriever, **kwargs)
-    )
-    builder.add_node(
-        "symptom_checker", lambda s: symptom_node(s, llm, retriever, **kwargs)
-    )
-    builder.add_node("ehr_summarizer", lambda s: ehr_node(s, llm, retriever, **kwargs))
-    builder.add_node(
-        "literature_qa", lambda s: literature_node(s, llm, retriever, **kwargs)
-    )
-    builder.add_node("drug_checker", lambda s: drug_node(s, llm, retriever, **kwargs))
-    builder.add_node(
-        "treatment_planner", lambda s: treatment_node(s, llm, retriever, **kwargs)
-    )
+    for name, node_fn in nodes.items():
+        builder.add_node(name, node_fn)
 
     builder.set_entry_point("inject_context")
     builder.add_conditional_edges(
@@ -59,7 +259,78 @@ def build_graph(llm, retriever, **kwargs):
     builder.add_edge("drug_checker", "treatment_planner")
     builder.add_edge("treatment_planner", END)
 
-    return builder.compile()
+    return builder.compile(checkpointer=checkpointer)
+
+
+def _build_parallel_graph(
+    nodes: dict, dependencies: dict = PARALLEL_DEPENDENCIES, checkpointer=None
+):
+    """
+    Wires nodes from their dependencies: every agent starts as soon as its
+    upstream nodes are done, and all leaf agents meet in a `join` node so the
+    run only reaches END once every branch has written its result.
+    """
+    builder = StateGraph(AgentState)
+    for name, node_fn in nodes.items():
+        if name in OPTIONAL_INPUTS:
+            node_fn = _skip_without(OPTIONAL_INPUTS[name], node_fn)
+        builder.add_node(name, node_fn)
+    builder.add_node("join", lambda s: {})
+
+    builder.set_entry_point("inject_context")
+    for name, upstream in dependencies.items():
+        builder.add_edge(upstream[0] if len(upstream) == 1 else upstream, name)
+
+    upstream_nodes = {dep for deps in dependencies.values() for dep in deps}
+    leaves = [name for name in dependencies if name not in upstream_nodes]
+    builder.add_edge(leaves, "join")
+    builder.add_edge("join", END)
+
+    return builder.compile(checkpointer=checkpointer)
+
+
+def _sync_only(checkpointer) -> bool:
+    if checkpointer is None:
+        return False
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    return isinstance(checkpointer, SqliteSaver)
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+def run_config(run_id: str) -> dict:
+    return {"configurable": {"thread_id": run_id}}
+
+
+def invoke_graph(graph, initial_state: dict, run_id: str = None):
+    """
+    Runs the graph under `run_id`. With a checkpointer attached, every
+    completed node is recorded under that id and a failed run can be
+    picked up again with resume_graph; the checkpoints of a run that
+    completes are deleted.
+    """
+    run_id = run_id or new_run_id()
+    final_state = graph.invoke(initial_state, config=run_config(run_id))
+    _forget_run(graph, run_id)
+    return final_state
+
+
+def resume_graph(graph, run_id: str):
+    """Resumes a failed or interrupted run from its last completed node."""
+    if graph.checkpointer is None:
+        raise ValueError("Resuming a run requires a graph built with a checkpointer.")
+    final_state = graph.invoke(None, config=run_config(run_id))
+    _forget_run(graph, run_id)
+    return final_state
+
+
+def _forget_run(graph, run_id: str):
+    # Checkpoints only serve resuming failed runs; finished ones would pile up
+    if graph.checkpointer is not None:
+        graph.checkpointer.delete_thread(run_id)
 
 
 def serialize_state(state):
@@ -73,3 +344,18 @@ def serialize_state(state):
         return obj
 
     return convert(state)
+
+
+def deserialize_state(state):
+    """Inverse of serialize_state: turns stored AI message dicts back into messages."""
+
+    def convert(obj):
+        if isinstance(obj, dict) and obj.get("type") == "ai" and "content" in obj:
+            return AIMessage(**{k: v for k, v in obj.items() if k != "type"})
+        elif isinstance(obj, list):
+            return [convert(item) for item in obj]
+        elif isinstance(obj, dict):
+            return {k: convert(v) for k, v in obj.items()}
+        return obj
+
+    return convert(state)
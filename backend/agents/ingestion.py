@@ -1,6 +1,8 @@
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
 from bs4 import BeautifulSoup
@@ -14,10 +16,7 @@ def read_text_file(file_path: str) -> str:
 
 
 def read_pdf_file(file_path: str) -> str:
-    reader = PdfReader(file_path)
-    return "\n".join(
-        page.extract_text() for page in reader.pages if page.extract_text()
-    )
+    return "\n".join(page for page in iter_pdf_pages(file_path) if page)
 
 
 def load_documents_from_folder(
@@ -28,9 +27,9 @@ def load_documents_from_folder(
     for ext in extensions:
         for file in Path(folder_path).rglob(f"*{ext}"):
             if ext == ".pdf":
-                content = read_text_file(str(file))
-            else:
                 content = read_pdf_file(str(file))
+            else:
+                content = read_text_file(str(file))
             docs.append(
                 {"text": content, "metadata": {"source": str(file), "extension": ext}}
             )
@@ -55,12 +54,21 @@ def scrape_url_firecrawl(url: str, api_key: str) -> Dict:
         return {}
 
 
-def extract_text_from_pdf(file_path: str) -> str:
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """Yields the text of each page, extracting one page at a time."""
     reader = PdfReader(file_path)
-    text = ""
     for page in reader.pages:
-        text += page.extract_text() or ""
-    return text
+        yield page.extract_text() or ""
+
+
+def iter_text_file(file_path: str, block_size: int = 1 << 16) -> Iterator[str]:
+    """Yields a text file in blocks of `block_size` characters."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        yield from iter(lambda: f.read(block_size), "")
+
+
+def extract_text_from_pdf(file_path: str) -> str:
+    return "".join(iter_pdf_pages(file_path))
 
 
 def extract_text_from_docx(file_path: str) -> str:
@@ -81,33 +89,76 @@ def extract_text_from_url(url: str) -> str:
         raise ValueError(f"Failed to extract text from URL: {url} — {e}")
 
 
-def extract_text(source: str) -> str:
+def iter_text(source: str) -> Iterator[str]:
+    """
+    Yields the text of `source` in segments (PDF pages, text file blocks) so
+    long documents never have to be held whole; URLs and .docx files come
+    as one segment.
+    """
     source_lower = source.lower()
 
     if source_lower.startswith("http://") or source_lower.startswith("https://"):
-        return extract_text_from_url(source)
+        yield extract_text_from_url(source)
     elif source_lower.endswith(".pdf"):
-        return extract_text_from_pdf(source)
+        yield from iter_pdf_pages(source)
     elif source_lower.endswith(".docx"):
-        return extract_text_from_docx(source)
+        yield extract_text_from_docx(source)
     elif source_lower.endswith(".txt"):
-        with open(source, "r", encoding="utf-8") as f:
-            return f.read()
+        yield from iter_text_file(source)
     else:
         raise ValueError(f"Unsupported file format or input source: {source}")
 
 
+def extract_text(source: str) -> str:
+    return "".join(iter_text(source))
+
+
+def iter_chunks(
+    segments: Iterable[str], chunk_size: int = 500, overlap: int = 50
+) -> Iterator[Tuple[int, str]]:
+    """
+    Streaming chunk_text: consumes text segments and yields (offset, chunk)
+    pairs, where offset is the chunk's character position in the whole text.
+    Only the unfinished tail (under chunk_size plus one segment) is buffered.
+    """
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size.")
+    buffer, buffer_start, start = "", 0, 0
+    for segment in segments:
+        buffer += segment
+        while buffer_start + len(buffer) >= start + chunk_size:
+            offset = start - buffer_start
+            yield start, buffer[offset : offset + chunk_size]
+            start += step
+        # Drop what no later chunk can reach
+        if start > buffer_start:
+            buffer = buffer[start - buffer_start :]
+            buffer_start = start
+    while start < buffer_start + len(buffer):
+        offset = start - buffer_start
+        yield start, buffer[offset : offset + chunk_size]
+        start += step
+
+
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list:
     """
     Splits text into overlapping chunks for embedding.
     """
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
+    return [chunk for _, chunk in iter_chunks([text], chunk_size, overlap)]
+
+
+def iter_document_chunks(
+    file_path: str, chunk_size: int = 300, overlap: int = 50
+) -> Iterator[Dict]:
+    """Yields the chunks of one file with their source, chunk_id and offset."""
+    filename = os.path.basename(file_path)
+    chunks = iter_chunks(iter_text(file_path), chunk_size, overlap)
+    for i, (offset, chunk) in enumerate(chunks):
+        yield {
+            "text": chunk,
+            "metadata": {"source": filename, "chunk_id": i, "offset": offset},
+        }
 
 
 def ingest_documents(
@@ -115,6 +166,7 @@ def ingest_documents(
 ) -> List[Dict]:
     """
     Ingests all .txt and .pdf files from a folder and returns list of chunks with metadata.
+    See ingest_documents_parallel for the multi-process version.
     """
     docs = []
     for filename in os.listdir(folder_path):
@@ -122,12 +174,134 @@ def ingest_documents(
             continue
         file_path = os.path.join(folder_path, filename)
         try:
-            content = extract_text(file_path)
-            chunks = chunk_text(content, chunk_size, overlap)
-            for i, chunk in enumerate(chunks):
-                docs.append(
-                    {"text": chunk, "metadata": {"source": filename, "chunk_id": i}}
-                )
+            docs.extend(list(iter_document_chunks(file_path, chunk_size, overlap)))
         except Exception as e:
             print(f"❌ Failed to read {filename}: {e}")
     return docs
+
+
+def _extract_and_chunk(file_path: str, chunk_size: int, overlap: int) -> List[Dict]:
+    """Worker task: the chunks of one file (runs in a pool process)."""
+    return list(iter_document_chunks(file_path, chunk_size, overlap))
+
+
+def ingest_documents_parallel(
+    folder_path: str,
+    chunk_size: int = 300,
+    overlap: int = 50,
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    batch_size: int = 256,
+    report_every: float = 5.0,
+) -> Iterator[List[Dict]]:
+    """
+    Same chunks as ingest_documents, extracted and chunked by a pool of
+    `workers` processes. At most `max_in_flight` files (default 4 per worker)
+    are queued at once, and chunks are yielded in batches of about
+    `batch_size` as files finish, in completion order, so they can be
+    embedded while the rest is still being read. Progress (files/s,
+    chunks/s) is printed every `report_every` seconds.
+    """
+    paths = [
+        os.path.join(folder_path, filename)
+        for filename in sorted(os.listdir(folder_path))
+        if filename.endswith((".txt", ".pdf"))
+    ]
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    start = last_report = time.perf_counter()
+    files_done = chunks_done = 0
+    batch = []
+
+    def report(final=False):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(
+            f"[Ingestion] {'Done: ' if final else ''}{files_done}/{len(paths)} files "
+            f"({files_done / elapsed:.1f} files/s), {chunks_done} chunks "
+            f"({chunks_done / elapsed:.1f} chunks/s)"
+        )
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending, queue = {}, iter(paths)
+        while True:
+            # Keep at most max_in_flight files submitted
+            while len(pending) < max_in_flight:
+                path = next(queue, None)
+                if path is None:
+                    break
+                future = pool.submit(_extract_and_chunk, path, chunk_size, overlap)
+                pending[future] = path
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                files_done += 1
+                try:
+                    chunks = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to read {os.path.basename(path)}: {e}")
+                    continue
+                chunks_done += len(chunks)
+                batch.extend(chunks)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                report()
+    if batch:
+        yield batch
+    report(final=True)
+
+
+def ingest_into_store(store, folder_path: str, **kwargs) -> int:
+    """
+    Streams ingest_documents_parallel batches into a vector store and saves
+    it once at the end; returns the number of chunks added.
+    """
+    added = 0
+    try:
+        for batch in ingest_documents_parallel(folder_path, **kwargs):
+            ids = store.add_documents(
+                [chunk["text"] for chunk in batch],
+                [chunk["metadata"] for chunk in batch],
+            )
+            added += len(ids or [])
+    finally:
+        store.flush()
+    return added
+
+
+def main():
+    import argparse
+
+    from backend.vector_db.clients import get_vector_store
+    from configs import settings
+
+    parser = argparse.ArgumentParser(
+        description="Ingest a folder of .txt/.pdf files into the configured vector store."
+    )
+    parser.add_argument("folder")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    store = get_vector_store(**settings["retriever"])
+    added = ingest_into_store(
+        store,
+        args.folder,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        batch_size=args.batch_size,
+    )
+    print(f"[Ingestion] Added {added} new chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,596 @@
 # from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-import pickle
+import atexit
+import bisect
+import json
 import os
-from typing import List, Dict
+import queue
+import threading
+import time
+from typing import List, Dict, Optional
+
+from backend.agents.memory_index import MemoryIndex
+from backend.vector_db.generations import (
+    next_generation,
+    read_current,
+    switch_generation,
+)
+from backend.vector_db.quantization import base_index
 
 # from configs.constants import EMBEDDING_MODEL_NAME, FAISS_STORE_PATH
 FAISS_STORE_PATH = "/data/faiss/"
 
 # embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-documents: List[str] = []
-metadata: List[Dict] = []
 
 
-def add_to_memory(text, source: str, tags: Dict = {}, **kwargs):
-    embedding_model = kwargs.get("embedding_model")
+class _TextColumn:
+    """
+    Variable-length UTF-8 strings packed into one byte buffer plus an offsets
+    array (entry i is data[offsets[i]:offsets[i + 1]]). Loaded entries stay in
+    the (possibly memory-mapped) base arrays; new ones go to an in-memory tail.
+    """
+
+    def __init__(self, offsets: np.ndarray = None, data: np.ndarray = None):
+        self._base_offsets = (
+            offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        )
+        self._base_data = data if data is not None else np.zeros(0, dtype=np.uint8)
+        self._base_len = len(self._base_offsets) - 1
+        self._tail_data = bytearray()
+        self._tail_offsets = [0]
+
+    def __len__(self):
+        return self._base_len + len(self._tail_offsets) - 1
+
+    def append(self, text: str):
+        self._tail_data += text.encode("utf-8")
+        self._tail_offsets.append(len(self._tail_data))
+
+    def __getitem__(self, i: int) -> str:
+        if i < self._base_len:
+            start, end = self._base_offsets[i], self._base_offsets[i + 1]
+            return bytes(self._base_data[start:end]).decode("utf-8")
+        i -= self._base_len
+        start, end = self._tail_offsets[i], self._tail_offsets[i + 1]
+        return bytes(self._tail_data[start:end]).decode("utf-8")
+
+    def take(self, rows) -> "_TextColumn":
+        """Returns an in-memory copy holding only `rows`, in order."""
+        column = _TextColumn()
+        for row in rows:
+            column.append(self[int(row)])
+        return column
+
+    def arrays(self) -> tuple:
+        """Returns the merged (offsets, data) arrays for saving."""
+        base_end = int(self._base_offsets[-1])
+        tail_offsets = np.asarray(self._tail_offsets[1:], dtype=np.int64) + base_end
+        offsets = np.concatenate([np.asarray(self._base_offsets), tail_offsets])
+        data = np.concatenate(
+            [
+                np.asarray(self._base_data),
+                np.frombuffer(bytes(self._tail_data), dtype=np.uint8),
+            ]
+        )
+        return offsets, data
+
+
+class _NumericColumn:
+    """Fixed-width column: a (possibly memory-mapped) base array plus an in-memory tail."""
+
+    def __init__(self, dtype, values: np.ndarray = None):
+        self.dtype = dtype
+        self._base = values if values is not None else np.zeros(0, dtype=dtype)
+        self._tail = []
+
+    def __len__(self):
+        return len(self._base) + len(self._tail)
+
+    def append(self, value):
+        self._tail.append(value)
+
+    def __getitem__(self, i: int):
+        if i < len(self._base):
+            return self._base[i].item()
+        return self._tail[i - len(self._base)]
+
+    def __setitem__(self, i: int, value):
+        if i < len(self._base):
+            self._base[i] = value
+        else:
+            self._tail[i - len(self._base)] = value
+
+    def index_of(self, value) -> int:
+        """Row holding `value` in a sorted column, or -1."""
+        row = int(np.searchsorted(self._base, value))
+        if row < len(self._base):
+            return row if self._base[row] == value else -1
+        row = bisect.bisect_left(self._tail, value)
+        if row < len(self._tail) and self._tail[row] == value:
+            return len(self._base) + row
+        return -1
+
+    def take(self, rows) -> "_NumericColumn":
+        return _NumericColumn(self.dtype, self.array()[rows])
+
+    def array(self) -> np.ndarray:
+        return np.concatenate(
+            [np.asarray(self._base), np.asarray(self._tail, dtype=self.dtype)]
+        )
+
+
+class MemoryStore:
+    """
+    Conversational agent memory: a FAISS index plus the texts and metadata of
+    its vectors, kept in compact arrays instead of lists of Python objects.
+
+    Texts and tags (as JSON) are packed into offsets+bytes buffers; sources are
+    stored as int32 codes into a small vocabulary and timestamps as float64.
+    save() writes the index and payload into a new generation directory and
+    then atomically repoints CURRENT at it, so a crash never leaves the two
+    out of sync. load() memory-maps both instead of deserializing them.
+
+    Every entry gets a stable id, used both as its FAISS id and to look it up
+    (rows are kept in id order). Entries can be deleted, expire after
+    `ttl_seconds`, and once more than `max_entries` are stored the least
+    recently ("lru") or least frequently ("lfu") retrieved ones are evicted,
+    in one batch down to `evict_to` of the cap so eviction doesn't run on
+    every add.
+    Deleted rows are dropped by compact(), which runs once they make up
+    `compact_ratio` of the store. Expiry, eviction and compaction run from
+    add() at most every `maintenance_interval` seconds, or whenever the store
+    is over its cap.
+    """
+
+    def __init__(
+        self,
+        dim: int = None,
+        index=None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        eviction: str = "lru",
+        evict_to: float = 0.9,
+        compact_ratio: float = 0.25,
+        maintenance_interval: float = 60.0,
+    ):
+        if index is None and dim is None:
+            raise ValueError("MemoryStore needs either an index or its dimension.")
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy '{eviction}'.")
+        if index is None:
+            index = MemoryIndex(dim, ivf_threshold=None)
+        elif not isinstance(index, MemoryIndex):
+            index = MemoryIndex(index.d, index=index, ivf_threshold=None)
+        self.index = index
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.eviction = eviction
+        self.evict_to = evict_to
+        self.compact_ratio = compact_ratio
+        self.maintenance_interval = maintenance_interval
+        self.ids = _NumericColumn(np.int64)
+        self.texts = _TextColumn()
+        self.tags = _TextColumn()
+        self.source_codes = _NumericColumn(np.int32)
+        self.created_at = _NumericColumn(np.float64)
+        self.last_access = _NumericColumn(np.float64)
+        self.hit_counts = _NumericColumn(np.int64)
+        self.sources: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self._deleted = set()
+        self._next_id = 0
+        self._last_maintenance = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.texts) - len(self._deleted)
+
+    def __contains__(self, entry_id: int):
+        return self._row(entry_id) >= 0
+
+    def __repr__(self):
+        return f"<MemoryStore entries={len(self)} index={self.index!r}>"
+
+    def _source_code(self, source: str) -> int:
+        if source not in self._source_ids:
+            self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return self._source_ids[source]
+
+    def _row(self, entry_id: int) -> int:
+        row = self.ids.index_of(entry_id)
+        return -1 if row < 0 or entry_id in self._deleted else row
+
+    def add(
+        self, texts: List[str], metas: List[Dict], vectors: np.ndarray
+    ) -> List[int]:
+        """Adds entries and returns their ids."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        now = time.time()
+        with self._lock:
+            ids = list(range(self._next_id, self._next_id + len(texts)))
+            self._next_id += len(texts)
+            self.index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+            for entry_id, text, meta in zip(ids, texts, metas):
+                self.ids.append(entry_id)
+                self.texts.append(text)
+                self.tags.append(json.dumps(meta.get("tags") or {}))
+                self.source_codes.append(self._source_code(meta.get("source")))
+                self.created_at.append(now)
+                self.last_access.append(now)
+                self.hit_counts.append(0)
+            if (
+                self.max_entries is not None and len(self) > self.max_entries
+            ) or time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+                self.maintain()
+        return ids
+
+    def get(self, entry_id: int) -> Dict:
+        row = self._row(entry_id)
+        if row < 0:
+            raise KeyError(f"No memory entry with id {entry_id}.")
+        return {
+            "id": entry_id,
+            "text": self.texts[row],
+            "metadata": {
+                "source": self.sources[self.source_codes[row]],
+                "tags": json.loads(self.tags[row]),
+                "created_at": self.created_at[row],
+            },
+        }
+
+    def search(self, query_vectors: np.ndarray, k: int = 3) -> List[List[Dict]]:
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        now = time.time()
+        with self._lock:
+            if len(self) == 0:
+                return [[] for _ in range(len(query_vectors))]
+            _, ids = self.index.search(query_vectors, k)
+            results = []
+            for row_ids in ids:
+                entries = []
+                for entry_id in row_ids:
+                    row = self._row(int(entry_id)) if entry_id >= 0 else -1
+                    if row < 0:
+                        continue
+                    self.last_access[row] = now
+                    self.hit_counts[row] += 1
+                    entries.append(self.get(int(entry_id)))
+                results.append(entries)
+            return results
+
+    def delete(self, ids) -> int:
+        """Deletes entries by id; returns how many existed."""
+        with self._lock:
+            ids = [i for i in {int(i) for i in ids} if self._row(i) >= 0]
+            self._deleted.update(ids)
+            self.index.remove_ids(ids)
+            return len(ids)
+
+    def _live_rows(self) -> np.ndarray:
+        alive = ~np.isin(self.ids.array(), np.fromiter(self._deleted, dtype="int64"))
+        return np.flatnonzero(alive)
+
+    def expire(self, now: float = None) -> int:
+        """Deletes entries older than `ttl_seconds`."""
+        if self.ttl_seconds is None:
+            return 0
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._live_rows()
+            expired = rows[self.created_at.array()[rows] < now - self.ttl_seconds]
+            return self.delete(self.ids.array()[expired])
+
+    def evict(self) -> int:
+        """
+        Once over `max_entries`, deletes the least recently/frequently used
+        entries down to `evict_to` of the cap.
+        """
+        with self._lock:
+            if self.max_entries is None or len(self) <= self.max_entries:
+                return 0
+            excess = len(self) - int(self.max_entries * self.evict_to)
+            rows = self._live_rows()
+            last_access = self.last_access.array()[rows]
+            if self.eviction == "lfu":
+                order = np.lexsort((last_access, self.hit_counts.array()[rows]))
+            else:
+                order = np.argsort(last_access, kind="stable")
+            return self.delete(self.ids.array()[rows[order[:excess]]])
+
+    def compact(self):
+        """Drops deleted rows from the columns and the index."""
+        with self._lock:
+            if not self._deleted:
+                return
+            self._compact_rows()
+            self.index.compact()
+
+    def _compact_rows(self):
+        rows = self._live_rows()
+        self.ids = self.ids.take(rows)
+        self.texts = self.texts.take(rows)
+        self.tags = self.tags.take(rows)
+        self.source_codes = self.source_codes.take(rows)
+        self.created_at = self.created_at.take(rows)
+        self.last_access = self.last_access.take(rows)
+        self.hit_counts = self.hit_counts.take(rows)
+        self._deleted = set()
+
+    def maintain(self):
+        """Runs expiry and eviction, then compacts if enough rows are deleted."""
+        with self._lock:
+            self._last_maintenance = time.monotonic()
+            expired, evicted = self.expire(), self.evict()
+            if expired or evicted:
+                print(f"[MemoryStore] Expired {expired} and evicted {evicted} entries")
+            if len(self._deleted) > self.compact_ratio * len(self.texts):
+                self.compact()
+            elif self.index.removed > self.compact_ratio * self.index.ntotal:
+                self.index.compact()
+
+    def save(self, path: str = FAISS_STORE_PATH):
+        current, generation = next_generation(path)
+        target = os.path.join(path, generation)
+
+        with self._lock:
+            # Write only live rows and vectors, so tombstones don't outlive a save
+            if self._deleted:
+                self._compact_rows()
+            self.index.compact(wait=True)
+            faiss.write_index(
+                self.index.faiss_index, os.path.join(target, "index.faiss")
+            )
+            text_offsets, text_data = self.texts.arrays()
+            tag_offsets, tag_data = self.tags.arrays()
+            np.save(os.path.join(target, "ids.npy"), self.ids.array())
+            np.save(os.path.join(target, "text_offsets.npy"), text_offsets)
+            np.save(os.path.join(target, "text_data.npy"), text_data)
+            np.save(os.path.join(target, "tag_offsets.npy"), tag_offsets)
+            np.save(os.path.join(target, "tag_data.npy"), tag_data)
+            np.save(os.path.join(target, "source_codes.npy"), self.source_codes.array())
+            np.save(os.path.join(target, "created_at.npy"), self.created_at.array())
+            np.save(os.path.join(target, "last_access.npy"), self.last_access.array())
+            np.save(os.path.join(target, "hit_counts.npy"), self.hit_counts.array())
+            with open(os.path.join(target, "sources.json"), "w") as f:
+                json.dump(self.sources, f)
+            with open(os.path.join(target, "meta.json"), "w") as f:
+                json.dump({"next_id": self._next_id}, f)
+
+        switch_generation(path, current, generation)
+
+    @classmethod
+    def load(
+        cls,
+        path: str = FAISS_STORE_PATH,
+        mmap: bool = True,
+        index_config: Dict = None,
+        **retention,
+    ) -> "MemoryStore":
+        """
+        Loads a saved store. `index_config` configures the MemoryIndex (see
+        memory_index.py) wrapping the saved index; `retention` takes the
+        ttl/eviction arguments of the constructor.
+        """
+        current = read_current(path)
+        if current is None:
+            raise FileNotFoundError(f"No saved memory found at '{path}'.")
+        source = os.path.join(path, current)
+        mmap_mode = "r" if mmap else None
+
+        def array(name, mmap_mode=mmap_mode):
+            return np.load(os.path.join(source, name), mmap_mode=mmap_mode)
+
+        def exists(name):
+            return os.path.exists(os.path.join(source, name))
+
+        index_path = os.path.join(source, "index.faiss")
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP if mmap else 0)
+        if mmap and isinstance(base_index(index), faiss.IndexIVF):
+            # Memory-mapped inverted lists are read-only; IVF tiers keep growing
+            index = faiss.read_index(index_path)
+        index = MemoryIndex(
+            index.d, index=index, **(index_config or {"ivf_threshold": None})
+        )
+        store = cls(index=index, **retention)
+        store.texts = _TextColumn(array("text_offsets.npy"), array("text_data.npy"))
+        store.tags = _TextColumn(array("tag_offsets.npy"), array("tag_data.npy"))
+        store.source_codes = _NumericColumn(np.int32, array("source_codes.npy"))
+        store.created_at = _NumericColumn(np.float64, array("created_at.npy"))
+        count = len(store.texts)
+        # Stores saved before entries had ids used row positions instead
+        ids = array("ids.npy") if exists("ids.npy") else np.arange(count)
+        store.ids = _NumericColumn(np.int64, ids)
+        # Usage stats are updated in place, so they are never memory-mapped
+        store.last_access = _NumericColumn(
+            np.float64,
+            (
+                array("last_access.npy", None)
+                if exists("last_access.npy")
+                else store.created_at.array()
+            ),
+        )
+        store.hit_counts = _NumericColumn(
+            np.int64,
+            (
+                array("hit_counts.npy", None)
+                if exists("hit_counts.npy")
+                else np.zeros(count, dtype=np.int64)
+            ),
+        )
+        with open(os.path.join(source, "sources.json")) as f:
+            store.sources = json.load(f)
+        store._source_ids = {name: i for i, name in enumerate(store.sources)}
+        store._next_id = int(ids[-1]) + 1 if count else 0
+        if exists("meta.json"):
+            with open(os.path.join(source, "meta.json")) as f:
+                store._next_id = json.load(f)["next_id"]
+        # Older saves kept the vectors of deleted entries in the index
+        if store.index.remove_ids(np.setdiff1d(store.index.ids(), ids)):
+            store.index.compact()
+        return store
+
+
+# Store used when callers only pass a bare FAISS `index` (legacy kwargs)
+_default_store: Optional[MemoryStore] = None
+_default_index = None
+_default_store_lock = threading.Lock()
+
+
+def get_memory_store(**kwargs) -> MemoryStore:
+    """Returns the `memory_store` kwarg, or the module store wrapping the `index` kwarg."""
+    global _default_store, _default_index
+    if kwargs.get("memory_store") is not None:
+        return kwargs["memory_store"]
     index = kwargs.get("index")
+    with _default_store_lock:
+        if _default_store is None or (
+            index is not None
+            and index is not _default_index
+            and index is not _default_store.index
+        ):
+            if index is None:
+                raise ValueError("Pass either memory_store or index.")
+            _default_store = MemoryStore(index=index)
+            _default_index = index
+        return _default_store
+
+
+def _store_batch(texts: List[str], metas: List[Dict], embedding_model, store):
+    vectors = embedding_model.encode(texts, batch_size=len(texts))
+    store.add(texts, metas, np.array(vectors).astype("float32"))
+
+
+def add_to_memory(text, source: str, tags: Dict = {}, **kwargs):
     if hasattr(text, "content"):
         text = text.content
-    vector = embedding_model.encode([text])
-    index.add(np.array(vector).astype("float32"))
-    documents.append(text)
-    metadata.append({"source": source, "tags": tags})
+    memory_writer = kwargs.get("memory_writer")
+    if memory_writer is not None:
+        memory_writer.submit(text, source, tags)
+        return
+    _store_batch(
+        [text],
+        [{"source": source, "tags": tags}],
+        kwargs.get("embedding_model"),
+        get_memory_store(**kwargs),
+    )
+
+
+class MemoryWriter:
+    """
+    Write-behind queue for add_to_memory.
+
+    Nodes only enqueue their text; a worker thread embeds queued texts in one
+    batch and adds them to the index in bulk. A batch is written once
+    `batch_size` texts are waiting, `flush_interval` seconds after the first
+    one arrived, on flush(), or at interpreter shutdown.
+    """
+
+    def __init__(
+        self,
+        embedding_model,
+        memory_store,
+        batch_size: int = 32,
+        flush_interval: float = 0.5,
+        max_queue_size: int = 10000,
+    ):
+        self.embedding_model = embedding_model
+        self.memory_store = memory_store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._worker = threading.Thread(
+            target=self._run, name="memory-writer", daemon=True
+        )
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, text: str, source: str, tags: Dict = None):
+        if self._closed:
+            raise RuntimeError("MemoryWriter is closed.")
+        self._queue.put((text, {"source": source, "tags": tags or {}}))
+
+    def flush(self):
+        """Blocks until every text submitted so far is in the index."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+            try:
+                _store_batch(
+                    [text for text, _ in batch],
+                    [meta for _, meta in batch],
+                    self.embedding_model,
+                    self.memory_store,
+                )
+            except Exception as e:
+                print(f"[MemoryWriter] Failed to write {len(batch)} entries: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def get_memory_writer(
+    embedding_model, memory_store, enabled: bool = False, **kwargs
+) -> Optional[MemoryWriter]:
+    """Builds the background memory writer from the `memory.writer` settings block."""
+    if not enabled:
+        return None
+    if not isinstance(memory_store, MemoryStore):
+        memory_store = get_memory_store(index=memory_store)
+    return MemoryWriter(embedding_model, memory_store, **kwargs)
 
 
 def retrieve_context(
     query: str, k: int = 3, embedding_model=None, **kwargs
 ) -> List[Dict]:
-    index = kwargs.get("index")
+    store = get_memory_store(**kwargs)
     query_vec = embedding_model.encode([query])
-    D, _ = index.search(np.array(query_vec).astype("float32"), k)
-    return [
-        {"text": documents[i], "metadata": metadata[i]}
-        for i in _[0]
-        if i < len(documents)
-    ]
+    return store.search(np.array(query_vec).astype("float32"), k)[0]
 
 
 def save_memory(path=FAISS_STORE_PATH, **kwargs):
-    index = kwargs.get("index")
-    os.makedirs(path, exist_ok=True)
-    faiss.write_index(index, os.path.join(path, "index.faiss"))
-    with open(os.path.join(path, "meta.pkl"), "wb") as f:
-        pickle.dump((documents, metadata), f)
-
-
-def load_memory(path=FAISS_STORE_PATH, **kwargs):
-    global documents, metadata
-    # index = kwargs.get("index")
-    # index = faiss.read_index(os.path.join(path, "index.faiss"))
-    with open(os.path.join(path, "meta.pkl"), "rb") as f:
-        documents, metadata = pickle.load(f)
+    get_memory_store(**kwargs).save(path)
+
+
+def load_memory(
+    path=FAISS_STORE_PATH,
+    mmap: bool = True,
+    index_config: Dict = None,
+    retention: Dict = None,
+    **kwargs,
+) -> MemoryStore:
+    """Loads a saved store and makes it the default one for index-only callers."""
+    global _default_store
+    store = MemoryStore.load(
+        path, mmap=mmap, index_config=index_config, **(retention or {})
+    )
+    with _default_store_lock:
+        _default_store = store
+    return store
@@ -0,0 +1,350 @@
+import math
+import threading
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from backend.vector_db.quantization import (
+    LOSSY_PRECISIONS,
+    base_index,
+    check_precision,
+    codec_of,
+    make_index,
+    min_training_size,
+    precision_of,
+    train_index,
+)
+
+
+class MemoryIndex:
+    """
+    FAISS index for agent memory that changes type as it grows.
+
+    It starts as an exact flat index and, once the vector count passes
+    `ivf_threshold` (then `hnsw_threshold`), is retrained into an IVF (then
+    HNSW) index on a background thread. Queries keep being served by the old
+    index during the rebuild; vectors added meanwhile are copied over before
+    the new index is swapped in. Set a threshold to None to skip that tier.
+
+    Vectors are kept under caller-chosen int64 ids (an IndexIDMap2 around the
+    tiered index), so ids stay valid across rebuilds. remove_ids() only
+    tombstones ids, which search() then skips; compact() drops them for good
+    by rebuilding the index from the live vectors in the background.
+
+    `nprobe` (IVF) and `ef_search` (HNSW) trade recall for query latency and
+    can be changed at any time with set_search_params().
+
+    `precision` ("float32", "float16", "int8" or "pq", see quantization.py)
+    sets how every tier stores its vectors. Quantizers that need training
+    start out as float32 and are rebuilt quantized once enough vectors exist;
+    later rebuilds keep that trained quantizer (only IVF centroids are
+    retrained), so quantization error does not pile up across rebuilds.
+    `rerank` optionally re-ranks quantized candidates on an exact float32
+    copy, which rebuilds then retrain from.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        ivf_threshold: Optional[int] = 50000,
+        hnsw_threshold: Optional[int] = None,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        hnsw_m: int = 32,
+        ef_construction: int = 40,
+        ef_search: int = 64,
+        background: bool = True,
+        precision: str = "float32",
+        pq_m: Optional[int] = None,
+        pq_nbits: int = 8,
+        rerank: bool = False,
+        rerank_k_factor: int = 4,
+        index=None,
+    ):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.hnsw_threshold = hnsw_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.background = background
+        self.precision = check_precision(precision)
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.rerank = rerank
+        self.rerank_k_factor = rerank_k_factor
+        self._lock = threading.RLock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._removed = set()
+        self._index = None
+        if index is None:
+            index = self._build(
+                self._target(0),
+                np.zeros((0, dim), dtype="float32"),
+                np.zeros(0, dtype="int64"),
+            )
+        self._index = (
+            index if isinstance(index, faiss.IndexIDMap2) else self._adopt(index)
+        )
+        self._apply_search_params(self._index)
+
+    def __repr__(self):
+        return (
+            f"<MemoryIndex tier={self.tier} precision={precision_of(self._index)} "
+            f"ntotal={self.ntotal} "
+            f"removed={len(self._removed)}>"
+        )
+
+    @property
+    def faiss_index(self):
+        """The FAISS index currently serving queries (e.g. for faiss.write_index)."""
+        return self._index
+
+    @property
+    def _inner(self):
+        return faiss.downcast_index(self._index.index)
+
+    @property
+    def ntotal(self) -> int:
+        """Number of stored vectors, including removed ones not yet compacted."""
+        return self._index.ntotal
+
+    @property
+    def removed(self) -> int:
+        return len(self._removed)
+
+    @property
+    def d(self) -> int:
+        return self.dim
+
+    @property
+    def tier(self) -> str:
+        return _tier_of(self._index)
+
+    @property
+    def state(self) -> tuple:
+        """(tier, precision) of the index serving queries."""
+        return self.tier, precision_of(self._index)
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._rebuild_thread is not None and self._rebuild_thread.is_alive()
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        with self._lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            self._apply_search_params(self._inner)
+
+    def ids(self) -> np.ndarray:
+        """Ids of every stored vector, including removed ones not yet compacted."""
+        with self._lock:
+            return faiss.vector_to_array(self._index.id_map)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        ids = np.ascontiguousarray(ids, dtype="int64")
+        with self._lock:
+            self._index.add_with_ids(vectors, ids)
+            target = self._target(self._index.ntotal)
+            if target != self.state and not self.rebuilding:
+                self._start_rebuild(target)
+
+    def remove_ids(self, ids) -> int:
+        """Tombstones `ids`; they stop showing up in search() straight away."""
+        with self._lock:
+            before = len(self._removed)
+            self._removed.update(int(i) for i in ids)
+            return len(self._removed) - before
+
+    def compact(self, wait: bool = False):
+        """
+        Rebuilds the index without the removed vectors, in the background
+        unless `wait` is set (then after any rebuild already running).
+        """
+        while True:
+            if wait:
+                self.wait_for_rebuild()
+            with self._lock:
+                if self.rebuilding:
+                    if wait:
+                        continue
+                    return
+                if not self._removed:
+                    return
+                target = self._target(self._index.ntotal - len(self._removed))
+                drop = frozenset(self._removed)
+                if wait:
+                    self._rebuild(target, drop)
+                else:
+                    self._start_rebuild(target, drop)
+                return
+
+    def search(self, query_vectors: np.ndarray, k: int):
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        with self._lock:
+            if not self._removed:
+                return self._index.search(query_vectors, k)
+            # Over-fetch so that k live results remain after skipping tombstones
+            fetch = min(k + len(self._removed), self._index.ntotal)
+            distances, ids = self._index.search(query_vectors, max(fetch, 1))
+            removed = np.fromiter(self._removed, dtype="int64")
+        out_distances = np.full((len(ids), k), np.inf, dtype="float32")
+        out_ids = np.full((len(ids), k), -1, dtype="int64")
+        for row, (row_distances, row_ids) in enumerate(zip(distances, ids)):
+            keep = (row_ids >= 0) & ~np.isin(row_ids, removed)
+            kept_ids, kept_distances = row_ids[keep][:k], row_distances[keep][:k]
+            out_ids[row, : len(kept_ids)] = kept_ids
+            out_distances[row, : len(kept_ids)] = kept_distances
+        return out_distances, out_ids
+
+    def wait_for_rebuild(self, timeout: float = None):
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _target(self, ntotal: int) -> tuple:
+        if self.hnsw_threshold is not None and ntotal >= self.hnsw_threshold:
+            tier = "hnsw"
+        elif self.ivf_threshold is not None and ntotal >= self.ivf_threshold:
+            tier = "ivf"
+        else:
+            tier = "flat"
+        trained = self._codec(self._index) is not None
+        if not trained and ntotal < self._training_size(tier, ntotal):
+            return tier, "float32"
+        return tier, self.precision
+
+    def _training_size(self, tier: str, ntotal: int) -> int:
+        return min_training_size(
+            self.precision, tier, self._nlist(ntotal), self.pq_nbits
+        )
+
+    def _nlist(self, ntotal: int) -> int:
+        # ~4*sqrt(n) lists, keeping at least ~39 training points per list
+        return self.nlist or max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+    def _start_rebuild(self, target: tuple, drop: frozenset = frozenset()):
+        if not self.background:
+            self._rebuild(target, drop)
+            return
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild, args=(target, drop), name="memory-index-rebuild"
+        )
+        self._rebuild_thread.daemon = True
+        self._rebuild_thread.start()
+
+    def _rebuild(self, target: tuple, drop: frozenset = frozenset()):
+        try:
+            with self._lock:
+                snapshot = self._index.ntotal
+                vectors = _reconstruct(self._inner, 0, snapshot)
+                ids = faiss.vector_to_array(self._index.id_map)[:snapshot].copy()
+            if drop:
+                keep = ~np.isin(ids, np.fromiter(drop, dtype="int64"))
+                vectors, ids = vectors[keep], ids[keep]
+            new_index = self._build(target, vectors, ids, self._codec(self._index))
+            with self._lock:
+                # Catch up with vectors added while we were training
+                if self._index.ntotal > snapshot:
+                    new_index.add_with_ids(
+                        _reconstruct(self._inner, snapshot, self._index.ntotal),
+                        faiss.vector_to_array(self._index.id_map)[snapshot:],
+                    )
+                self._apply_search_params(new_index)
+                self._index = new_index
+                self._removed -= drop
+            print(
+                f"[MemoryIndex] Rebuilt memory index as {'/'.join(target)} "
+                f"({len(ids)} vectors, {len(drop)} removed)"
+            )
+        except Exception as e:
+            print(
+                f"[MemoryIndex] Rebuild to {'/'.join(target)} failed, "
+                f"keeping {'/'.join(self.state)}: {e}"
+            )
+
+    def _adopt(self, index):
+        # Index saved without ids: its positions become the ids
+        vectors = _reconstruct(index, 0, index.ntotal)
+        ids = np.arange(index.ntotal, dtype="int64")
+        return self._build(self._target(index.ntotal), vectors, ids, self._codec(index))
+
+    def _codec(self, index):
+        # Lossy vectors are re-encoded with the quantizer that produced them;
+        # with rerank the reconstructed vectors are exact and can be retrained on
+        if (
+            index is None
+            or self.rerank
+            or self.precision not in LOSSY_PRECISIONS
+            or precision_of(index) != self.precision
+        ):
+            return None
+        return codec_of(index)
+
+    def _build(self, target: tuple, vectors: np.ndarray, ids: np.ndarray, codec=None):
+        tier, precision = target
+        if tier == "ivf" and len(ids) < 39:
+            tier = "flat"
+        if codec is not None:
+            precision = self.precision
+        elif len(ids) < self._training_size(tier, len(ids)):
+            precision = "float32"
+        inner = self._make_index(tier, precision, len(ids))
+        train_index(inner, vectors, codec)
+        index = faiss.IndexIDMap2(inner)
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+        return index
+
+    def _make_index(self, tier: str, precision: str, ntotal: int):
+        index = make_index(
+            self.dim,
+            precision,
+            tier,
+            nlist=self._nlist(ntotal),
+            hnsw_m=self.hnsw_m,
+            pq_m=self.pq_m,
+            pq_nbits=self.pq_nbits,
+            rerank=self.rerank,
+            rerank_k_factor=self.rerank_k_factor,
+            # Residual codes would tie the quantizer to this tier's centroids
+            by_residual=self.rerank,
+        )
+        if tier == "hnsw":
+            base_index(index).hnsw.efConstruction = self.ef_construction
+        return index
+
+    def _apply_search_params(self, index):
+        index = base_index(index)
+        if isinstance(index, faiss.IndexIVF):
+            index.nprobe = self.nprobe
+        elif isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.ef_search
+
+
+def _tier_of(index) -> str:
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def _reconstruct(index, start: int, end: int) -> np.ndarray:
+    if end <= start:
+        return np.zeros((0, index.d), dtype="float32")
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(start, end - start)
+
+
+def get_memory_index(dim: int, **kwargs) -> MemoryIndex:
+    """Builds the memory index from the `memory.index` settings block."""
+    return MemoryIndex(dim, **kwargs)
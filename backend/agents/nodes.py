@@ -1,20 +1,111 @@
+import asyncio
+import json
+
 from backend.agents.templates import Runner
 from backend.agents.memory import add_to_memory, retrieve_context
 from backend.vector_db.clients import VectorStoreBase
+from backend.agents.telemetry import annotate_span
+
+
+def node_io(reads: tuple, writes: str):
+    """Declares the state keys a node reads and the key it writes."""
+
+    def decorator(node_fn):
+        node_fn.reads = tuple(reads)
+        node_fn.writes = writes
+        return node_fn
+
+    return decorator
 
 
 def log_keys(state, node_name):
     print(f"\U0001f511 Keys in state at {node_name}: {list(state.keys())}")
 
 
+def cache_namespace(namespace: str, llm=None) -> str:
+    """Semantic cache namespace of a node, per answering model."""
+    if llm is None:
+        return namespace
+    provider, model, temperature = Runner.describe_llm(llm)
+    return f"{namespace}:{provider}/{model}@{temperature}"
+
+
+def literature_namespace(retriever: VectorStoreBase = None):
+    """
+    Cache namespace of literature answers, tied to the corpus version they
+    were grounded in. None (not cached) without a versioned corpus, e.g. for
+    answers drawn from agent memory, which changes on every run.
+    """
+    version = retriever.corpus_version() if retriever else None
+    return None if version is None else f"literature_qa@{version}"
+
+
+def cached_answer(namespace: str, text: str, llm=None, **kwargs):
+    """Looks the input up in the semantic cache passed as `semantic_cache`, if any."""
+    semantic_cache = kwargs.get("semantic_cache")
+    if not semantic_cache or namespace is None:
+        return None
+    answer = semantic_cache.lookup(cache_namespace(namespace, llm), text)
+    annotate_span(cache_hit=answer is not None, semantic_cache_hit=answer is not None)
+    return answer
+
+
+def cache_answer(namespace: str, text: str, answer, llm=None, **kwargs):
+    semantic_cache = kwargs.get("semantic_cache")
+    if semantic_cache and namespace is not None:
+        semantic_cache.store(cache_namespace(namespace, llm), text, answer)
+
+
+def retrieval_key(query: str, k: int = 3, filter: dict = None) -> str:
+    return json.dumps([query, k, filter], sort_keys=True, default=str)
+
+
+def retrieve_documents(
+    state, vector_store: VectorStoreBase, query: str, k: int = 3, filter: dict = None
+):
+    """
+    Texts of the top k documents for `query` (among those matching the
+    metadata `filter`), searched once per run: results are memoized in
+    state["retrievals"] so later nodes asking for the same (query, k, filter)
+    reuse them instead of embedding and searching again.
+    """
+    key = retrieval_key(query, k, filter)
+    retrievals = state.get("retrievals") or {}
+    if key not in retrievals:
+        documents = vector_store.similarity_search(query, k=k, filter=filter)
+        retrievals = {**retrievals, key: [doc.page_content for doc in documents]}
+        state["retrievals"] = retrievals
+    return retrievals[key]
+
+
+async def aretrieve_documents(
+    state, vector_store: VectorStoreBase, query: str, k: int = 3, filter: dict = None
+):
+    key = retrieval_key(query, k, filter)
+    retrievals = state.get("retrievals") or {}
+    if key not in retrievals:
+        documents = await asyncio.to_thread(
+            vector_store.similarity_search, query, k=k, filter=filter
+        )
+        retrievals = {**retrievals, key: [doc.page_content for doc in documents]}
+        state["retrievals"] = retrievals
+    return retrievals[key]
+
+
+@node_io(reads=("symptoms",), writes="diagnosis")
 def symptom_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     log_keys(state, "symptom_node")
-    diagnosis = Runner.run_symptom_checker(symptoms=state.get("symptoms"), llm=llm)
+    symptoms = state.get("symptoms")
+    diagnosis = cached_answer("symptom_checker", symptoms, llm, **kwargs)
+    if diagnosis is None:
+        diagnosis = Runner.run_symptom_checker(symptoms=symptoms, llm=llm)
+        cache_answer("symptom_checker", symptoms, diagnosis, llm, **kwargs)
     state["diagnosis"] = diagnosis
     add_to_memory(diagnosis, source="diagnosis", **kwargs)
     return state
 
 
+@node_io(reads=("ehr_text",), writes="summary")
 def ehr_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     log_keys(state, "ehr_node")
     summary = Runner.run_ehr_summarizer(ehr_text=state.get("ehr_text"), llm=llm)
@@ -23,20 +114,27 @@ def ehr_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     return state
 
 
+# The retrieved chunks are inputs too, so a changed corpus invalidates the answer
+@node_io(reads=("question", "retrievals"), writes="literature_answer")
 def literature_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     log_keys(state, "literature_node")
     question = state.get("question")
-    if retriever:
-        context_docs = retriever.similarity_search(question)
-        context = "\n".join([doc.page_content for doc in context_docs])
-    else:
-        context = "\n".join([r["text"] for r in retrieve_context(question)])
-    answer = Runner.run_literature_qa(question=question, llm=llm, context=context)
+    namespace = literature_namespace(retriever)
+    answer = cached_answer(namespace, question, llm, **kwargs)
+    if answer is None:
+        # Chunks are passed as a list so Runner can pack them into the budget
+        if retriever:
+            context = retrieve_documents(state, retriever, question)
+        else:
+            context = [r["text"] for r in retrieve_context(question, **kwargs)]
+        answer = Runner.run_literature_qa(question=question, llm=llm, context=context)
+        cache_answer(namespace, question, answer, llm, **kwargs)
     state["literature_answer"] = answer
     add_to_memory(answer, source="literature_qa", **kwargs)
     return state
 
 
+@node_io(reads=("medications", "diagnosis"), writes="interaction_report")
 def drug_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     log_keys(state, "drug_node")
     meds = state.get("medications")
@@ -52,6 +150,7 @@ def drug_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     return state
 
 
+@node_io(reads=("patient_profile",), writes="treatment_plan")
 def treatment_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
     log_keys(state, "treatment_node")
     plan = Runner.run_treatment_plan(profile=state.get("patient_profile"), llm=llm)
@@ -64,6 +163,96 @@ def inject_retrieved_context(state, vector_store: VectorStoreBase = None, **kwar
     query = state.get("question") or state.get("symptoms")
     if not query or not vector_store:
         return state
-    context = vector_store.similarity_search(query)
-    state["context"] = "\n".join([doc.page_content for doc in context])
+    state["context"] = "\n".join(retrieve_documents(state, vector_store, query))
+    return state
+
+
+# -- Async nodes: same behaviour, driven through Runner.arun_* so many cases
+# -- can share one event loop. Blocking embedding/search work runs in a thread.
+
+
+@node_io(reads=("symptoms",), writes="diagnosis")
+async def asymptom_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
+    log_keys(state, "symptom_node")
+    symptoms = state.get("symptoms")
+    diagnosis = await asyncio.to_thread(
+        cached_answer, "symptom_checker", symptoms, llm, **kwargs
+    )
+    if diagnosis is None:
+        diagnosis = await Runner.arun_symptom_checker(symptoms=symptoms, llm=llm)
+        await asyncio.to_thread(
+            cache_answer, "symptom_checker", symptoms, diagnosis, llm, **kwargs
+        )
+    state["diagnosis"] = diagnosis
+    await asyncio.to_thread(add_to_memory, diagnosis, source="diagnosis", **kwargs)
+    return state
+
+
+@node_io(reads=("ehr_text",), writes="summary")
+async def aehr_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
+    log_keys(state, "ehr_node")
+    summary = await Runner.arun_ehr_summarizer(ehr_text=state.get("ehr_text"), llm=llm)
+    state["summary"] = summary
+    await asyncio.to_thread(add_to_memory, summary, source="ehr_summary", **kwargs)
+    return state
+
+
+@node_io(reads=("question", "retrievals"), writes="literature_answer")
+async def aliterature_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
+    log_keys(state, "literature_node")
+    question = state.get("question")
+    namespace = await asyncio.to_thread(literature_namespace, retriever)
+    answer = await asyncio.to_thread(cached_answer, namespace, question, llm, **kwargs)
+    if answer is None:
+        if retriever:
+            context = await aretrieve_documents(state, retriever, question)
+        else:
+            context_docs = await asyncio.to_thread(retrieve_context, question, **kwargs)
+            context = [r["text"] for r in context_docs]
+        answer = await Runner.arun_literature_qa(
+            question=question, llm=llm, context=context
+        )
+        await asyncio.to_thread(
+            cache_answer, namespace, question, answer, llm, **kwargs
+        )
+    state["literature_answer"] = answer
+    await asyncio.to_thread(add_to_memory, answer, source="literature_qa", **kwargs)
+    return state
+
+
+@node_io(reads=("medications", "diagnosis"), writes="interaction_report")
+async def adrug_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
+    log_keys(state, "drug_node")
+    meds = state.get("medications")
+    if isinstance(meds, str):
+        meds = [m.strip() for m in meds.split(",") if m.strip()]
+    elif not isinstance(meds, list):
+        meds = []
+    report = await Runner.arun_drug_interactions(
+        meds=meds, llm=llm, patient_data=state.get("diagnosis", "")
+    )
+    state["interaction_report"] = report
+    await asyncio.to_thread(add_to_memory, report, source="drug_checker", **kwargs)
+    return state
+
+
+@node_io(reads=("patient_profile",), writes="treatment_plan")
+async def atreatment_node(state, llm, retriever: VectorStoreBase = None, **kwargs):
+    log_keys(state, "treatment_node")
+    plan = await Runner.arun_treatment_plan(
+        profile=state.get("patient_profile"), llm=llm
+    )
+    state["treatment_plan"] = plan
+    await asyncio.to_thread(add_to_memory, plan, source="treatment_plan", **kwargs)
+    return state
+
+
+async def ainject_retrieved_context(
+    state, vector_store: VectorStoreBase = None, **kwargs
+):
+    query = state.get("question") or state.get("symptoms")
+    if not query or not vector_store:
+        return state
+    context = await aretrieve_documents(state, vector_store, query)
+    state["context"] = "\n".join(context)
     return state
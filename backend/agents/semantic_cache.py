@@ -0,0 +1,109 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from backend.agents.telemetry import annotate_span
+
+
+class SemanticCache:
+    """
+    Answer cache for inputs that differ only in wording or order
+    ("cough, fever" vs "fever and a cough").
+
+    Inputs are normalized, embedded with the memory embedding model and kept
+    in a small cosine-similarity FAISS index per namespace (one per node).
+    A lookup returns the stored answer of the closest past input when its
+    similarity reaches `threshold`. Each namespace holds at most
+    `max_entries` inputs; the least recently used one is evicted first.
+    """
+
+    def __init__(self, embedding_model, threshold: float = 0.9, max_entries=1000):
+        self.embedding_model = embedding_model
+        self.dim = embedding_model.get_sentence_embedding_dimension()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._namespaces = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = re.sub(r"[^\w\s]", " ", str(text).lower())
+        return " ".join(text.split())
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.array(
+            self.embedding_model.encode([self.normalize(text)]), dtype="float32"
+        )
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _namespace(self, name: str) -> dict:
+        if name not in self._namespaces:
+            self._namespaces[name] = {
+                "index": faiss.IndexIDMap(faiss.IndexFlatIP(self.dim)),
+                "entries": OrderedDict(),
+            }
+        return self._namespaces[name]
+
+    def lookup(self, namespace: str, text: str):
+        """Returns the cached answer for a similar input, or None on a miss."""
+        if not text:
+            return None
+        vector = self._embed(text)
+        with self._lock:
+            space = self._namespace(namespace)
+            if space["index"].ntotal == 0:
+                self.misses += 1
+                return None
+            scores, ids = space["index"].search(vector, 1)
+            score, entry_id = float(scores[0][0]), int(ids[0][0])
+            if entry_id < 0 or score < self.threshold:
+                self.misses += 1
+                return None
+            space["entries"].move_to_end(entry_id)
+            cached_text, answer = space["entries"][entry_id]
+            self.hits += 1
+        # Audit trail on the node's span: which past input answered this one
+        annotate_span(semantic_similarity=round(score, 4), semantic_match=cached_text)
+        return answer
+
+    def store(self, namespace: str, text: str, answer):
+        if not text:
+            return
+        vector = self._embed(text)
+        with self._lock:
+            space = self._namespace(namespace)
+            entry_id = self._next_id
+            self._next_id += 1
+            space["index"].add_with_ids(vector, np.array([entry_id], dtype="int64"))
+            space["entries"][entry_id] = (text, answer)
+            while len(space["entries"]) > self.max_entries:
+                evicted_id, _ = space["entries"].popitem(last=False)
+                space["index"].remove_ids(np.array([evicted_id], dtype="int64"))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": {
+                name: len(space["entries"]) for name, space in self._namespaces.items()
+            },
+        }
+
+
+def get_semantic_cache(
+    embedding_model, enabled: bool = False, **kwargs
+) -> Optional[SemanticCache]:
+    """Builds the semantic cache from the `cache.semantic` settings block."""
+    if not enabled:
+        return None
+    return SemanticCache(embedding_model, **kwargs)
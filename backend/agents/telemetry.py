@@ -0,0 +1,104 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Recorder collecting the spans of the current graph run (see record_spans).
+# LangGraph copies the caller's context into node threads/tasks, so every
+# node of a run reports to the same recorder.
+_current_recorder = contextvars.ContextVar("span_recorder", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanRecorder:
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+
+@contextmanager
+def record_spans():
+    """Collects every span opened while the block runs, e.g. around graph.invoke."""
+    recorder = SpanRecorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str, provider: Optional[str] = None, **attributes):
+    """
+    Times the block and records it with the active recorder, if any.
+
+    The yielded dict can be filled in while the block runs (token counts,
+    cache status); `kind` is "node" for graph nodes and "llm" for Runner calls.
+    """
+    data = {
+        "name": name,
+        "kind": kind,
+        "provider": provider,
+        "started_at": time.time(),
+        "duration_ms": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "cache_hit": None,
+        "attributes": attributes,
+    }
+    parent = _current_span.get()
+    token = _current_span.set(data)
+    start = time.perf_counter()
+    try:
+        yield data
+    finally:
+        data["duration_ms"] = (time.perf_counter() - start) * 1000
+        _current_span.reset(token)
+        if parent is not None:
+            _roll_up(parent, data)
+        recorder = _current_recorder.get()
+        if recorder is not None:
+            recorder.record(data)
+
+
+def _roll_up(parent: dict, child: dict):
+    # A node span reports the tokens and cache status of the LLM calls inside it
+    for key in ("prompt_tokens", "completion_tokens"):
+        if child[key] is not None:
+            parent[key] = (parent[key] or 0) + child[key]
+    # Any cached call inside makes the parent a (partial) cache hit
+    if child["cache_hit"] is not None:
+        parent["cache_hit"] = bool(parent["cache_hit"] or child["cache_hit"])
+
+
+def annotate_span(**fields):
+    """Updates the innermost open span; known keys are set, others go to attributes."""
+    data = _current_span.get()
+    if data is None:
+        return
+    for key, value in fields.items():
+        if key in data and key != "attributes":
+            data[key] = value
+        else:
+            data["attributes"][key] = value
+
+
+def token_usage(response) -> dict:
+    """Extracts prompt/completion token counts from an LLM response, when reported."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return {
+            "prompt_tokens": usage.get("input_tokens"),
+            "completion_tokens": usage.get("output_tokens"),
+        }
+    metadata = getattr(response, "response_metadata", None) or {}
+    usage = metadata.get("token_usage") or metadata.get("usage") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", usage.get("input_tokens")),
+        "completion_tokens": usage.get("completion_tokens", usage.get("output_tokens")),
+    }
@@ -1,3 +1,10 @@
+import asyncio
+import threading
+
+from backend.agents.telemetry import annotate_span, span, token_usage
+from backend.llm.identity import describe_llm, provider_of
+from backend.llm.limiter import ProcessLimiter
+
 symptom_prompt_template = """
 You are a diagnostic medical assistant.
 
@@ -113,31 +120,175 @@ def treatment_prompt(profile: dict) -> str:  # NOQA
     )
 
 
+def _as_text(value) -> str:
+    """Text of a prompt input: a message's content, anything else as str()."""
+    content = getattr(value, "content", value)
+    return content if isinstance(content, str) else str(content)
+
+
 class Runner:
+    # Max number of in-flight async LLM calls per provider (see configure_concurrency)
+    concurrency_limits = {"default": 8}
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+    # Optional PromptCache consulted before every LLM call (see configure_cache)
+    cache = None
+    # Optional ContextPacker fitting context and notes into the model's budget
+    context_packer = None
+
+    @classmethod
+    def configure_cache(cls, cache=None):
+        """Installs (or with None, removes) the prompt cache used by run_*/arun_*."""
+        cls.cache = cache
+
+    @classmethod
+    def configure_context_packer(cls, packer=None):
+        """Installs (or with None, removes) the packer applied to long prompt inputs."""
+        cls.context_packer = packer
+
+    @classmethod
+    def _pack(cls, name: str, context) -> str:
+        """
+        Fits retrieved chunks (a list) or a long text into the context budget
+        and reports the tokens saved on the current span.
+        """
+        # Upstream outputs (e.g. the diagnosis) may be chat messages, not text
+        if isinstance(context, (list, tuple)):
+            context = [_as_text(chunk) for chunk in context]
+        elif context is not None:
+            context = _as_text(context)
+        packer = cls.context_packer
+        if packer is None or not context:
+            return context if isinstance(context, str) else "\n".join(context or [])
+        text, report = packer.fit(context)
+        annotate_span(
+            context_tokens=report["tokens_out"],
+            context_tokens_saved=report["tokens_saved"],
+        )
+        if report["tokens_saved"] > 0:
+            print(
+                f"[ContextPacker] {name}: {report['tokens_in']} -> "
+                f"{report['tokens_out']} tokens ({report['chunks_kept']}/"
+                f"{report['chunks_in']} chunks kept)"
+            )
+        return text
+
+    @classmethod
+    def configure_concurrency(cls, limits: dict = None):
+        """
+        Sets the per-provider limits used by the arun_* coroutines, e.g.
+        {"default": 8, "groq": 4}. Providers without an entry use "default".
+        Limits hold for the whole process, across threads and event loops.
+        """
+        cls.concurrency_limits = {"default": 8, **(limits or {})}
+        with cls._limiters_lock:
+            cls._limiters = {}
+
+    provider_of = staticmethod(provider_of)
+    describe_llm = staticmethod(describe_llm)
+
+    @classmethod
+    def _limiter(cls, llm) -> ProcessLimiter:
+        # One limiter per provider for the whole process, shared by every
+        # session's thread and event loop
+        provider = cls.provider_of(llm)
+        with cls._limiters_lock:
+            if provider not in cls._limiters:
+                limit = cls.concurrency_limits.get(
+                    provider, cls.concurrency_limits["default"]
+                )
+                cls._limiters[provider] = ProcessLimiter(limit)
+            return cls._limiters[provider]
+
+    @classmethod
+    def _invoke(cls, llm, prompt: str, name: str = "llm"):
+        cache = cls.cache
+        key = cache.key_for(llm, prompt) if cache else None
+        with span(name, "llm", provider=cls.provider_of(llm)) as timing:
+            if key:
+                cached = cache.get(key)
+                timing["cache_hit"] = cached is not None
+                if cached is not None:
+                    timing.update(prompt_tokens=0, completion_tokens=0)
+                    return cached
+            response = llm.invoke(prompt)
+            timing.update(token_usage(response))
+        if key:
+            cache.put(key, response, llm=llm)
+        return response
+
+    @classmethod
+    async def _ainvoke(cls, llm, prompt: str, name: str = "llm"):
+        cache = cls.cache
+        key = cache.key_for(llm, prompt) if cache else None
+        with span(name, "llm", provider=cls.provider_of(llm)) as timing:
+            if key:
+                # SQLite reads and writes stay off the event loop
+                cached = await asyncio.to_thread(cache.get, key)
+                timing["cache_hit"] = cached is not None
+                if cached is not None:
+                    timing.update(prompt_tokens=0, completion_tokens=0)
+                    return cached
+            async with cls._limiter(llm):
+                response = await llm.ainvoke(prompt)
+            timing.update(token_usage(response))
+        if key:
+            await asyncio.to_thread(cache.put, key, response, llm=llm)
+        return response
+
     @staticmethod
     def run_symptom_checker(symptoms: str, llm) -> str:
         prompt = symptom_prompt(symptoms=symptoms)
-        return llm.invoke(prompt)
+        return Runner._invoke(llm, prompt, name="symptom_checker")
 
     @staticmethod
     def run_ehr_summarizer(ehr_text: str, llm) -> str:
-        prompt = ehr_summary_prompt(ehr_text)
-        return llm.invoke(prompt)
+        prompt = ehr_summary_prompt(Runner._pack("ehr_summarizer", ehr_text))
+        return Runner._invoke(llm, prompt, name="ehr_summarizer")
 
     @staticmethod
-    def run_literature_qa(question: str, llm, context: str = "") -> str:
-        prompt = literature_qa_prompt(question, context)
-        return llm.invoke(prompt)
+    def run_literature_qa(question: str, llm, context="") -> str:
+        prompt = literature_qa_prompt(question, Runner._pack("literature_qa", context))
+        return Runner._invoke(llm, prompt, name="literature_qa")
 
     @staticmethod
     def run_drug_interactions(meds: list, llm, patient_data: str = "") -> str:
-        prompt = drug_interaction_prompt(meds, patient_data)
-        return llm.invoke(prompt)
+        prompt = drug_interaction_prompt(
+            meds, Runner._pack("drug_interactions", patient_data)
+        )
+        return Runner._invoke(llm, prompt, name="drug_interactions")
 
     @staticmethod
     def run_treatment_plan(profile: dict, llm) -> str:
         prompt = treatment_prompt(profile)
-        return llm.invoke(prompt)
+        return Runner._invoke(llm, prompt, name="treatment_plan")
+
+    @staticmethod
+    async def arun_symptom_checker(symptoms: str, llm) -> str:
+        prompt = symptom_prompt(symptoms=symptoms)
+        return await Runner._ainvoke(llm, prompt, name="symptom_checker")
+
+    @staticmethod
+    async def arun_ehr_summarizer(ehr_text: str, llm) -> str:
+        prompt = ehr_summary_prompt(Runner._pack("ehr_summarizer", ehr_text))
+        return await Runner._ainvoke(llm, prompt, name="ehr_summarizer")
+
+    @staticmethod
+    async def arun_literature_qa(question: str, llm, context="") -> str:
+        prompt = literature_qa_prompt(question, Runner._pack("literature_qa", context))
+        return await Runner._ainvoke(llm, prompt, name="literature_qa")
+
+    @staticmethod
+    async def arun_drug_interactions(meds: list, llm, patient_data: str = "") -> str:
+        prompt = drug_interaction_prompt(
+            meds, Runner._pack("drug_interactions", patient_data)
+        )
+        return await Runner._ainvoke(llm, prompt, name="drug_interactions")
+
+    @staticmethod
+    async def arun_treatment_plan(profile: dict, llm) -> str:
+        prompt = treatment_prompt(profile)
+        return await Runner._ainvoke(llm, prompt, name="treatment_plan")
 
     @staticmethod
     def run(runner_name: str, llm, **kwargs):
@@ -155,3 +306,20 @@ class Runner:
                 f"Error: Invalid runner name '{runner_name}'. Available runners are: {valid_runners}"
             )
         return runner_func(llm=llm, **kwargs)
+
+    @staticmethod
+    async def arun(runner_name: str, llm, **kwargs):
+        runner_map = {
+            "symptom_checker": Runner.arun_symptom_checker,
+            "ehr_summarizer": Runner.arun_ehr_summarizer,
+            "literature_qa": Runner.arun_literature_qa,
+            "drug_interactions": Runner.arun_drug_interactions,
+            "treatment_plan": Runner.arun_treatment_plan,
+        }
+        runner_func = runner_map.get(runner_name)
+        if not runner_func:
+            valid_runners = ", ".join(runner_map.keys())
+            raise NotImplementedError(
+                f"Error: Invalid runner name '{runner_name}'. Available runners are: {valid_runners}"
+            )
+        return await runner_func(llm=llm, **kwargs)
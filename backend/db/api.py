@@ -7,10 +7,12 @@ from typing import Optional
 
 
 class SqliteDB_Agent:
-    def __init__(self, db_folder, db_name):
+    def __init__(self, db_folder, db_name, max_node_outputs: Optional[int] = 10000):
         db_name = db_name + ".db" if not db_name.endswith(".db") else db_name
         self.db_path = os.path.join(db_folder, db_name)
+        self.max_node_outputs = max_node_outputs
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._checkpointer = None
 
     def __repr__(self):
         return f"<SqliteDB path='{self.db_path}'>"
@@ -18,6 +20,20 @@ class SqliteDB_Agent:
     def get_connection(self) -> sqlite3.Connection:
         return sqlite3.connect(self.db_path)
 
+    def get_checkpointer(self):
+        """
+        LangGraph checkpointer persisting graph runs in this database, so a
+        failed or interrupted run can resume from its last completed node.
+        The saver is synchronous: build_graph rejects it for async graphs.
+        """
+        if self._checkpointer is None:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._checkpointer = SqliteSaver(conn)
+            self._checkpointer.setup()
+        return self._checkpointer
+
     def create_table(self):
         with self.get_connection() as conn:
             cursor = conn.cursor()
@@ -35,9 +51,44 @@ class SqliteDB_Agent:
                 )
             """
             )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS node_outputs (
+                    node TEXT,
+                    fingerprint TEXT,
+                    timestamp TEXT,
+                    output TEXT,
+                    PRIMARY KEY (node, fingerprint)
+                )
+            """
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_node_outputs_timestamp "
+                "ON node_outputs (timestamp)"
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS run_spans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id INTEGER,
+                    name TEXT,
+                    kind TEXT,
+                    provider TEXT,
+                    started_at REAL,
+                    duration_ms REAL,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    cache_hit INTEGER,
+                    attributes TEXT
+                )
+            """
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_run_spans_run ON run_spans (run_id)"
+            )
             conn.commit()
 
-    def save_run(self, initial_state: dict, final_state: dict):
+    def save_run(self, initial_state: dict, final_state: dict) -> int:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
@@ -56,6 +107,129 @@ class SqliteDB_Agent:
                 ),
             )
             conn.commit()
+            return cursor.lastrowid
+
+    def save_spans(self, run_id: int, spans: list[dict]):
+        """Stores the timing spans recorded during a run (see telemetry.record_spans)."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """
+                INSERT INTO run_spans (run_id, name, kind, provider, started_at, duration_ms,
+                                       prompt_tokens, completion_tokens, cache_hit, attributes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [
+                    (
+                        run_id,
+                        s["name"],
+                        s["kind"],
+                        s.get("provider"),
+                        s.get("started_at"),
+                        s.get("duration_ms"),
+                        s.get("prompt_tokens"),
+                        s.get("completion_tokens"),
+                        None if s.get("cache_hit") is None else int(s["cache_hit"]),
+                        json.dumps(s.get("attributes") or {}, default=str),
+                    )
+                    for s in spans
+                ],
+            )
+            conn.commit()
+
+    def get_spans(self, run_id: int) -> list[dict]:
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT * FROM run_spans WHERE run_id = ? ORDER BY started_at",
+                (run_id,),
+            )
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in rows]
+
+    def get_span_stats(self, kind: str = "node") -> list[dict]:
+        """
+        Latency and token statistics per span name (agent), e.g. for the
+        Analytics page: calls, p50/p95/mean latency, tokens and cache hit rate.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT name, duration_ms, prompt_tokens, completion_tokens, cache_hit
+                FROM run_spans WHERE kind = ? AND duration_ms IS NOT NULL
+            """,
+                (kind,),
+            )
+            rows = cursor.fetchall()
+
+        by_name = {}
+        for name, duration, prompt_tokens, completion_tokens, cache_hit in rows:
+            by_name.setdefault(name, []).append(
+                (duration, prompt_tokens, completion_tokens, cache_hit)
+            )
+
+        def percentile(values, q):
+            index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+            return values[index]
+
+        stats = []
+        for name, entries in sorted(by_name.items()):
+            durations = sorted(e[0] for e in entries)
+            cache_flags = [e[3] for e in entries if e[3] is not None]
+            stats.append(
+                {
+                    "name": name,
+                    "calls": len(entries),
+                    "p50_ms": percentile(durations, 0.50),
+                    "p95_ms": percentile(durations, 0.95),
+                    "mean_ms": sum(durations) / len(durations),
+                    "prompt_tokens": sum(e[1] or 0 for e in entries),
+                    "completion_tokens": sum(e[2] or 0 for e in entries),
+                    "cache_hit_rate": (
+                        sum(cache_flags) / len(cache_flags) if cache_flags else None
+                    ),
+                }
+            )
+        return stats
+
+    def save_node_output(self, node: str, fingerprint: str, output):
+        """
+        Stores a node's (serialized) output under the fingerprint of its inputs,
+        keeping only the `max_node_outputs` most recently written outputs.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO node_outputs (node, fingerprint, timestamp, output)
+                VALUES (?, ?, ?, ?)
+            """,
+                (node, fingerprint, datetime.utcnow().isoformat(), json.dumps(output)),
+            )
+            if self.max_node_outputs is not None:
+                cursor.execute(
+                    """
+                    DELETE FROM node_outputs WHERE rowid IN (
+                        SELECT rowid FROM node_outputs
+                        ORDER BY timestamp DESC, rowid DESC LIMIT -1 OFFSET ?
+                    )
+                """,
+                    (self.max_node_outputs,),
+                )
+            conn.commit()
+
+    def get_node_output(self, node: str, fingerprint: str):
+        """Returns the stored output for these inputs, or None if never computed."""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT output FROM node_outputs WHERE node = ? AND fingerprint = ?",
+                (node, fingerprint),
+            )
+            row = cursor.fetchone()
+            return json.loads(row[0]) if row else None
 
     def get_all_runs(self) -> list[dict]:
         with self.get_connection() as conn:
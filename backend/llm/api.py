@@ -114,7 +114,13 @@ def load_llm_langchain(
         # Add other common parameters from model_specific_config if you define them
         # e.g., "max_tokens": model_specific_config.get("max_tokens"),
     }
-    keys_to_exclude = ["model_identifier", "api_key_env_var"]
+    # context_budget / tokenizer configure prompt packing, not the client
+    keys_to_exclude = [
+        "model_identifier",
+        "api_key_env_var",
+        "context_budget",
+        "tokenizer",
+    ]
     init_kwargs.update(
         {k: v for k, v in model_specific_config.items() if k not in keys_to_exclude}
     )
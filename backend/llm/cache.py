@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from backend.llm.identity import describe_llm
+from langchain_core.messages import (
+    BaseMessage,
+    messages_from_dict,
+    messages_to_dict,
+)
+
+
+class PromptCache:
+    """
+    Persistent prompt -> response cache for LLM calls.
+
+    Entries are keyed on (provider, model_identifier, temperature, prompt hash)
+    and stored in a local SQLite file. The table is bounded to `max_entries`
+    with least-recently-used eviction, and entries older than `ttl_seconds`
+    are treated as misses. Only calls at or below `max_temperature` are cached
+    since sampled outputs are not reproducible.
+    """
+
+    def __init__(
+        self,
+        local_path: str,
+        db_name: str = "prompt_cache",
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        max_temperature: float = 0.0,
+    ):
+        db_name = db_name + ".db" if not db_name.endswith(".db") else db_name
+        self.db_path = os.path.join(local_path, db_name)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.create_table()
+
+    def __repr__(self):
+        return f"<PromptCache path='{self.db_path}' max_entries={self.max_entries}>"
+
+    def get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+    def create_table(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS prompt_cache (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    model TEXT,
+                    temperature REAL,
+                    response TEXT,
+                    created_at REAL,
+                    last_access REAL
+                )
+            """
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_prompt_cache_access "
+                "ON prompt_cache (last_access)"
+            )
+            conn.commit()
+
+    describe_llm = staticmethod(describe_llm)
+
+    def key_for(self, llm, prompt: str) -> Optional[str]:
+        """Cache key for this call, or None when the call is not cacheable."""
+        provider, model, temperature = self.describe_llm(llm)
+        if temperature is None or temperature > self.max_temperature:
+            return None
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps([provider, model, temperature, prompt_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT response, created_at FROM prompt_cache WHERE key = ?", (key,)
+            )
+            row = cursor.fetchone()
+            if row and self.ttl_seconds and row[1] < now - self.ttl_seconds:
+                cursor.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                row = None
+            if row:
+                cursor.execute(
+                    "UPDATE prompt_cache SET last_access = ? WHERE key = ?",
+                    (now, key),
+                )
+            conn.commit()
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return _deserialize_response(row[0]) if row else None
+
+    def put(self, key: str, response, llm=None):
+        provider, model, temperature = (
+            self.describe_llm(llm) if llm is not None else (None, None, None)
+        )
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO prompt_cache
+                    (key, provider, model, temperature, response, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    key,
+                    provider,
+                    model,
+                    temperature,
+                    _serialize_response(response),
+                    now,
+                    now,
+                ),
+            )
+            if self.ttl_seconds:
+                cursor.execute(
+                    "DELETE FROM prompt_cache WHERE created_at < ?",
+                    (now - self.ttl_seconds,),
+                )
+            cursor.execute(
+                """
+                DELETE FROM prompt_cache WHERE key IN (
+                    SELECT key FROM prompt_cache
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """,
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    def clear(self):
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM prompt_cache")
+            conn.commit()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self.get_connection() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+def _serialize_response(response) -> str:
+    if isinstance(response, BaseMessage):
+        return json.dumps({"kind": "message", "value": messages_to_dict([response])})
+    return json.dumps({"kind": "text", "value": response})
+
+
+def _deserialize_response(payload: str):
+    data = json.loads(payload)
+    if data["kind"] == "message":
+        return messages_from_dict(data["value"])[0]
+    return data["value"]
+
+
+def get_prompt_cache(enabled: bool = False, **kwargs) -> Optional[PromptCache]:
+    """Builds the prompt cache from the `cache.prompt` settings block."""
+    if not enabled:
+        return None
+    return PromptCache(**kwargs)
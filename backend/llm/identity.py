@@ -0,0 +1,20 @@
+# Providers recognised when picking a concurrency limit or cache key for an LLM client.
+KNOWN_PROVIDERS = ("openai", "anthropic", "groq", "together", "ollama", "huggingface")
+
+
+def provider_of(llm) -> str:
+    llm_type = str(getattr(llm, "_llm_type", type(llm).__name__)).lower()
+    for provider in KNOWN_PROVIDERS:
+        if provider in llm_type:
+            return provider
+    return "default"
+
+
+def describe_llm(llm) -> tuple:
+    """Returns (provider, model_identifier, temperature) for an LLM client."""
+    model = (
+        getattr(llm, "model_name", None)
+        or getattr(llm, "model", None)
+        or type(llm).__name__
+    )
+    return provider_of(llm), str(model), getattr(llm, "temperature", None)
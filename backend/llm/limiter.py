@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class ProcessLimiter:
+    """
+    Counting semaphore shared by every thread and event loop of the process.
+
+    asyncio.Semaphore belongs to a single event loop, but each Streamlit
+    session runs its own asyncio.run() in its own thread, so per-loop limits
+    multiply with the number of sessions. Here slots are counted under a
+    threading.Lock; an async waiter parks on a future of its own loop and is
+    woken with call_soon_threadsafe, so waiting costs no thread. Slots are
+    handed out first come, first served.
+    """
+
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError(f"Concurrency limit must be at least 1, got {limit}.")
+        self.limit = limit
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"<ProcessLimiter limit={self.limit} active={self._active} "
+            f"waiting={len(self._waiters)}>"
+        )
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # Already handed a slot: give it back (a cancelled future is
+            # released by _grant instead)
+            if not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    # The slot passes straight to the waiter, so _active is unchanged
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    continue  # its event loop has been closed
+            self._active -= 1
+
+    def _grant(self, future):
+        if future.done():
+            self.release()
+        else:
+            future.set_result(None)
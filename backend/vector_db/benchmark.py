@@ -0,0 +1,191 @@
+"""
+Embedding backend benchmark.
+
+Compares embedding backends on the same texts: bulk throughput (ingestion),
+single-query latency (retrieval) and how far the vectors drift from the
+PyTorch ones that existing indexes were built with.
+
+With --search it instead measures vector store query throughput of
+similarity_search_batch at several batch sizes, over an in-memory FAISS
+store holding the texts.
+
+    python -m backend.vector_db.benchmark --texts data/docs/*.txt
+    python -m backend.vector_db.benchmark --backends torch onnx onnx:avx2 --threads 4
+    python -m backend.vector_db.benchmark --search --search-batch-sizes 1 16 256
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from backend.vector_db.embedding_service import (
+    DEFAULT_EMBEDDING_MODEL,
+    get_embedding_service,
+)
+
+SAMPLE_TEXTS = [
+    "Patient reports persistent cough with fatigue for two weeks.",
+    "High fever, body aches and a sore throat since yesterday.",
+    "Metformin is first-line therapy for type 2 diabetes.",
+    "Warfarin interacts with aspirin and increases bleeding risk.",
+    "Chest X-ray shows mild inflammation in the lower left lobe.",
+    "Blood pressure 150/95, recommend lifestyle changes and follow-up.",
+    "MRI of the lumbar spine shows a herniated disc at L4-L5.",
+    "Allergic to penicillin; prescribe azithromycin instead.",
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def benchmark_backend(
+    service,
+    texts: List[str],
+    batch_size: int = 32,
+    queries: int = 50,
+    reference: Optional[np.ndarray] = None,
+) -> tuple:
+    """Returns the timing row and the vectors of `texts`."""
+    service.encode(texts[:batch_size])  # warm-up (model load, graph init)
+
+    start = time.perf_counter()
+    vectors = service.encode(texts, batch_size=batch_size)
+    bulk_seconds = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:queries]:
+        start = time.perf_counter()
+        service.encode([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    row = {
+        "texts_per_s": len(texts) / bulk_seconds,
+        "query_p50_ms": _percentile(latencies, 50),
+        "query_p95_ms": _percentile(latencies, 95),
+    }
+    if reference is not None:
+        cosine = np.sum(vectors * reference, axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        row["max_abs_diff"] = float(np.max(np.abs(vectors - reference)))
+        row["min_cosine"] = float(np.min(cosine))
+    return row, vectors
+
+
+def benchmark_embeddings(
+    texts: List[str],
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    backends=("torch", "onnx"),
+    threads: Optional[int] = None,
+    batch_size: int = 32,
+    queries: int = 50,
+) -> List[dict]:
+    """
+    Runs every backend ("torch", "onnx" or "onnx:<quantize>") over `texts`;
+    the first one is the reference the others' vectors are compared with.
+    """
+    rows, reference = [], None
+    for spec in backends:
+        backend, _, quantize = spec.partition(":")
+        service = get_embedding_service(
+            model_name, backend=backend, quantize=quantize or None, threads=threads
+        )
+        row, vectors = benchmark_backend(
+            service, texts, batch_size=batch_size, queries=queries, reference=reference
+        )
+        if reference is None:
+            reference = vectors
+        rows.append({"backend": spec, **row})
+    return rows
+
+
+def benchmark_search(
+    store, queries: List[str], batch_sizes=(1, 16, 256), k: int = 3
+) -> List[dict]:
+    """Query throughput of `store.similarity_search_batch` per batch size."""
+    store.similarity_search_batch(queries[: max(batch_sizes)], k=k)  # warm-up
+    rows = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batch_size):
+            store.similarity_search_batch(queries[offset : offset + batch_size], k=k)
+        seconds = time.perf_counter() - start
+        rows.append(
+            {
+                "batch_size": batch_size,
+                "queries_per_s": len(queries) / seconds,
+                "ms_per_query": seconds * 1000 / len(queries),
+            }
+        )
+    return rows
+
+
+def _read_texts(paths: List[str], repeat: int) -> List[str]:
+    texts = []
+    for path in paths:
+        content = Path(path).read_text(encoding="utf-8", errors="ignore")
+        texts.extend(line.strip() for line in content.splitlines() if line.strip())
+    return (texts or SAMPLE_TEXTS) * repeat
+
+
+def _print_rows(rows: List[dict]):
+    header = sorted({name for row in rows for name in row}, key=list(rows[-1]).index)
+    print(" | ".join(f"{name:>14}" for name in header))
+    for row in rows:
+        print(
+            " | ".join(
+                (
+                    f"{row[name]:>14.4f}"
+                    if isinstance(row.get(name), float)
+                    else f"{row.get(name, '-')!s:>14}"
+                )
+                for name in header
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark.")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument(
+        "--texts", nargs="*", default=[], help="Text files, one passage per line"
+    )
+    parser.add_argument("--repeat", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument(
+        "--search", action="store_true", help="Benchmark batched vector search"
+    )
+    parser.add_argument(
+        "--search-batch-sizes", nargs="+", type=int, default=[1, 16, 256]
+    )
+    args = parser.parse_args()
+
+    texts = _read_texts(args.texts, args.repeat)
+    print(f"[Benchmark] {len(texts)} texts, model {args.model}")
+    if args.search:
+        from backend.vector_db.clients import get_vector_store
+
+        store = get_vector_store("faiss", embedding_model=args.model)
+        store.add_documents(list(dict.fromkeys(texts)))
+        rows = benchmark_search(store, texts, batch_sizes=args.search_batch_sizes)
+    else:
+        rows = benchmark_embeddings(
+            texts,
+            model_name=args.model,
+            backends=args.backends,
+            threads=args.threads,
+            batch_size=args.batch_size,
+            queries=args.queries,
+        )
+    _print_rows(rows)
+
+
+if __name__ == "__main__":
+    main()
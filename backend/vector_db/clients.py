@@ -1,79 +1,604 @@
 # from langchain.vectorstores import Chroma, FAISS
 from langchain_community.vectorstores import Chroma, FAISS
 
-# from langchain.embeddings import HuggingFaceEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from backend.vector_db.embedding_service import get_embedding_service
+from backend.vector_db.filters import (
+    MetadataIndex,
+    matches,
+    search_subset,
+    to_chroma_where,
+)
+from backend.vector_db.generations import (
+    next_generation,
+    read_current,
+    switch_generation,
+)
+from backend.vector_db.lexical import get_bm25_index
+from backend.vector_db.reranker import get_reranker
+from backend.vector_db.quantization import (
+    check_precision,
+    make_index,
+    min_training_size,
+    precision_of,
+)
 from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+import atexit
+import hashlib
 import os
+import pickle
+import faiss
+from pydantic import ConfigDict
 
 """
 💡 Vector Store Options (RAG-friendly)
 Store	|| Persistence	|| Performance	|| Comments
 Chroma	|| Yes	        || Fast	        || Easy to use, great for dev.
-FAISS	|| No (in-mem)	|| Very fast	|| Lightweight, local only.
+FAISS	|| Optional	|| Very fast	|| Lightweight, local only.
+Hybrid	|| As wrapped	|| Fast	        || BM25 + either store above, RRF-fused.
 Qdrant	|| Yes	        || High	        || Suitable for prod use.
 Weaviate||	Yes	        || High	        || Advanced, good ecosystem.
 """
 
 
+def content_id(text: str) -> str:
+    """Id of a document in every store: the sha256 of its text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_key(document: Document) -> str:
+    """A returned document's store id: its `id` when set, else its content id."""
+    return getattr(document, "id", None) or content_id(document.page_content)
+
+
 class VectorStoreBase(ABC):
     @abstractmethod
     def add_documents(self, docs: list[str], metadata: list[dict] = None):
+        """Adds documents not stored yet; returns the content ids of those added."""
         pass
 
     @abstractmethod
-    def similarity_search(self, query: str, k: int = 3) -> list[str]:
+    def get_documents(self, ids: list[str]) -> list[Document]:
+        """Fetches stored documents by id (missing ids are skipped)."""
         pass
 
+    @abstractmethod
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[list[Document]]:
+        """Every stored document, in lists of up to `batch_size`."""
+        pass
+
+    @abstractmethod
+    def similarity_search(
+        self, query: str, k: int = 3, filter: dict = None
+    ) -> list[Document]:
+        """Top k documents for `query`, among those whose metadata match
+        `filter` (see backend.vector_db.filters)."""
+        pass
+
+    def similarity_search_batch(
+        self, queries: list[str], k: int = 3, filter: dict = None
+    ) -> list[list[Document]]:
+        """similarity_search for many queries at once; one result list per query."""
+        return [self.similarity_search(query, k=k, filter=filter) for query in queries]
+
+    def flush(self):
+        """Persists documents added since the last flush (no-op if written through)."""
+        pass
+
+    def corpus_version(self) -> Optional[str]:
+        """Token that changes whenever documents are added, or None if unknown."""
+        return None
+
     @abstractmethod
     def as_retriever(self, k: int = 3):
         pass
 
 
 class ChromaVectorStore(VectorStoreBase):
-    def __init__(self, persist_dir: str, embedding_model: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        persist_dir: str,
+        embedding_model: str = "all-MiniLM-L6-v2",
+        embedding_cache=None,
+        device: str = None,
+    ):
         if not persist_dir:
             raise ValueError("persist_dir must be a valid path.")
         os.makedirs(persist_dir, exist_ok=True)
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+        self.embeddings = get_embedding_service(
+            embedding_model, device=device, embedding_cache=embedding_cache
+        )
         self.store = Chroma(
             persist_directory=persist_dir,
             embedding_function=self.embeddings,
         )
 
     def add_documents(self, docs, metadata=None):
-        self.store.add_texts(docs, metadatas=metadata)
+        metadata = metadata or [{} for _ in docs]
+        ids = [content_id(text) for text in docs]
+        seen = set(self.store.get(ids=ids, include=[])["ids"]) if ids else set()
+        new = []
+        for i, doc_id in enumerate(ids):
+            if doc_id not in seen:
+                seen.add(doc_id)
+                new.append(i)
+        if not new:
+            return []
+        self.store.add_texts(
+            [docs[i] for i in new],
+            metadatas=[metadata[i] for i in new],
+            ids=[ids[i] for i in new],
+        )
+        return [ids[i] for i in new]
 
-    def similarity_search(self, query, k=3):
-        return self.store.similarity_search(query, k=k)
+    def get_documents(self, ids):
+        found = self.store.get(ids=list(ids), include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(id=doc_id, page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(
+                found["ids"], found["documents"], found["metadatas"]
+            )
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def iter_documents(self, batch_size=1000):
+        offset = 0
+        while True:
+            found = self.store.get(
+                include=["documents", "metadatas"], limit=batch_size, offset=offset
+            )
+            if not found["ids"]:
+                return
+            yield [
+                Document(id=doc_id, page_content=text, metadata=meta or {})
+                for doc_id, text, meta in zip(
+                    found["ids"], found["documents"], found["metadatas"]
+                )
+            ]
+            offset += len(found["ids"])
+
+    def corpus_version(self):
+        # Documents are only ever added, so their count identifies the corpus
+        return str(self.store._collection.count())
+
+    def similarity_search(self, query, k=3, filter=None):
+        return self.store.similarity_search(query, k=k, filter=to_chroma_where(filter))
+
+    def similarity_search_batch(self, queries, k=3, filter=None):
+        if not queries:
+            return []
+        # One forward pass for all queries and one collection query for all vectors
+        found = self.store._collection.query(
+            query_embeddings=self.embeddings.encode(list(queries)).tolist(),
+            n_results=k,
+            where=to_chroma_where(filter),
+            include=["documents", "metadatas"],
+        )
+        return [
+            [
+                Document(id=doc_id, page_content=text, metadata=meta or {})
+                for doc_id, text, meta in zip(doc_ids, texts, metas)
+            ]
+            for doc_ids, texts, metas in zip(
+                found["ids"], found["documents"], found["metadatas"]
+            )
+        ]
 
     def as_retriever(self, k=3):
         return self.store.as_retriever(search_kwargs={"k": k})
 
 
 class FAISSVectorStore(VectorStoreBase):
-    def __init__(self, embedding_model: str = "all-MiniLM-L6-v2"):
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
-        self.store = FAISS.from_texts([], self.embeddings)
+    """
+    FAISS store that grows one index in place.
+
+    Documents are embedded `batch_size` at a time and appended to the index;
+    the docstore is keyed by a content id (sha256 of the text), so a document
+    that is already stored is neither embedded nor added again. With a
+    `persist_dir` the index and docstore are saved by flush() (and at exit)
+    into a new generation directory switched in atomically (see
+    generations.py), and loaded on startup; `mmap=True` maps the saved index
+    instead of reading it into memory.
+
+    `precision` stores vectors as float32, float16, int8 or PQ codes (see
+    quantization.py). int8 and PQ need training: the store starts exact
+    (float32) and is retrained at `precision` once it holds enough documents.
+    `rerank` re-ranks quantized candidates on exact vectors.
+
+    Metadata values are indexed by position (MetadataIndex), so a filtered
+    search hands FAISS a bitmap of the matching vectors instead of
+    over-fetching and discarding results.
+    """
+
+    def __init__(
+        self,
+        persist_dir: str = None,
+        embedding_model: str = "all-MiniLM-L6-v2",
+        batch_size: int = 64,
+        mmap: bool = False,
+        embedding_cache=None,
+        device: str = None,
+        precision: str = "float32",
+        pq_m: int = None,
+        pq_nbits: int = 8,
+        rerank: bool = False,
+        rerank_k_factor: int = 4,
+    ):
+        self.persist_dir = persist_dir
+        self.batch_size = batch_size
+        self.precision = check_precision(precision)
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.rerank = rerank
+        self.rerank_k_factor = rerank_k_factor
+        self.embeddings = get_embedding_service(
+            embedding_model, device=device, embedding_cache=embedding_cache
+        )
+        self._dirty = False
+        source = self._saved_dir()
+        if source:
+            self.store = self._load(source, mmap)
+        else:
+            dim = self.embeddings.get_sentence_embedding_dimension()
+            trainable = min_training_size(precision, pq_nbits=pq_nbits) > 0
+            self.store = FAISS(
+                embedding_function=self.embeddings,
+                index=self._make_index(dim, "float32" if trainable else precision),
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={},
+            )
+        self._ids = set(self.store.index_to_docstore_id.values())
+        if persist_dir:
+            atexit.register(self.flush)
+        self.metadata_index = MetadataIndex()
+        positions = sorted(self.store.index_to_docstore_id)
+        self.metadata_index.add(
+            positions,
+            [
+                getattr(self.store.docstore.search(doc_id), "metadata", None)
+                for doc_id in map(self.store.index_to_docstore_id.get, positions)
+            ],
+        )
 
     def add_documents(self, docs, metadata=None):
-        new_store = FAISS.from_texts(docs, self.embeddings)
-        self.store.merge_from(new_store)
+        metadata = metadata or [{} for _ in docs]
+        texts, metas, ids = [], [], []
+        for text, meta in zip(docs, metadata):
+            doc_id = content_id(text)
+            if doc_id in self._ids or doc_id in ids:
+                continue
+            texts.append(text)
+            metas.append(meta)
+            ids.append(doc_id)
+        if not texts:
+            return []
+
+        first_position = self.store.index.ntotal
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start : start + self.batch_size]
+            vectors = self.embeddings.encode(batch)
+            self.store.add_embeddings(
+                list(zip(batch, vectors)),
+                metadatas=metas[start : start + self.batch_size],
+                ids=ids[start : start + self.batch_size],
+            )
+        self._ids.update(ids)
+        self.metadata_index.add(range(first_position, first_position + len(ids)), metas)
+        self._quantize()
+        self._dirty = True
+        return ids
+
+    def _make_index(self, dim: int, precision: str):
+        return make_index(
+            dim,
+            precision,
+            pq_m=self.pq_m,
+            pq_nbits=self.pq_nbits,
+            rerank=self.rerank,
+            rerank_k_factor=self.rerank_k_factor,
+        )
+
+    def _quantize(self):
+        # Retrains an exact index at `precision` once there are enough vectors;
+        # positions are kept, so the docstore mapping stays valid
+        index = self.store.index
+        if self.precision == "float32" or precision_of(index) != "float32":
+            return
+        if index.ntotal < min_training_size(self.precision, pq_nbits=self.pq_nbits):
+            return
+        vectors = index.reconstruct_n(0, index.ntotal)
+        quantized = self._make_index(index.d, self.precision)
+        quantized.train(vectors)
+        quantized.add(vectors)
+        self.store.index = quantized
+        print(
+            f"[FAISSVectorStore] Trained {self.precision} index on "
+            f"{index.ntotal} vectors"
+        )
+
+    def flush(self):
+        if self._dirty and self.persist_dir:
+            self.save()
+
+    def save(self, persist_dir: str = None):
+        persist_dir = persist_dir or self.persist_dir
+        current, generation = next_generation(persist_dir)
+        target = os.path.join(persist_dir, generation)
+        faiss.write_index(self.store.index, os.path.join(target, "index.faiss"))
+        with open(os.path.join(target, "index.pkl"), "wb") as f:
+            pickle.dump((self.store.docstore, self.store.index_to_docstore_id), f)
+        switch_generation(persist_dir, current, generation)
+        if persist_dir == self.persist_dir:
+            self._dirty = False
+
+    def _saved_dir(self):
+        if not self.persist_dir:
+            return None
+        current = read_current(self.persist_dir)
+        if current:
+            return os.path.join(self.persist_dir, current)
+        # Stores saved before generations kept the files at the top level
+        if os.path.exists(os.path.join(self.persist_dir, "index.faiss")):
+            return self.persist_dir
+        return None
+
+    def _load(self, source: str, mmap: bool = False):
+        io_flags = faiss.IO_FLAG_MMAP if mmap else 0
+        index = faiss.read_index(os.path.join(source, "index.faiss"), io_flags)
+        with open(os.path.join(source, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        print(f"[FAISSVectorStore] Loaded {index.ntotal} vectors from {source}")
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+
+    def get_documents(self, ids):
+        documents = []
+        for doc_id in ids:
+            document = self.store.docstore.search(doc_id)
+            if isinstance(document, Document):
+                documents.append(document)
+        return documents
+
+    def iter_documents(self, batch_size=1000):
+        positions = sorted(self.store.index_to_docstore_id)
+        for start in range(0, len(positions), batch_size):
+            yield self.get_documents(
+                [
+                    self.store.index_to_docstore_id[position]
+                    for position in positions[start : start + batch_size]
+                ]
+            )
+
+    def corpus_version(self):
+        return str(self.store.index.ntotal)
+
+    def similarity_search(self, query, k=3, filter=None):
+        if not filter:
+            return self.store.similarity_search(query, k=k)
+        return self.similarity_search_batch([query], k=k, filter=filter)[0]
 
-    def similarity_search(self, query, k=3):
-        return self.store.similarity_search(query, k=k)
+    def similarity_search_batch(self, queries, k=3, filter=None):
+        if not queries:
+            return []
+        if filter:
+            mask = self.metadata_index.mask(filter, self.store.index.ntotal)
+            if not mask.any():
+                return [[] for _ in queries]
+        # One forward pass for all queries and one 2-D index search
+        vectors = self.embeddings.encode(list(queries))
+        if filter:
+            _, found = search_subset(self.store.index, vectors, k, mask)
+        else:
+            _, found = self.store.index.search(vectors, k)
+        return [
+            self.get_documents(
+                [self.store.index_to_docstore_id[i] for i in row if i >= 0]
+            )
+            for row in found
+        ]
 
     def as_retriever(self, k=3):
         return self.store.as_retriever(search_kwargs={"k": k})
 
 
-def get_vector_store(store_type: str = "chroma", **kwargs) -> VectorStoreBase:
+class HybridVectorStore(VectorStoreBase):
+    """
+    Dense store plus a BM25 index over the same documents.
+
+    Ingestion writes to both. similarity_search fetches `candidates * k`
+    results from each and fuses them with reciprocal-rank fusion
+    (score = sum of 1 / (rrf_k + rank)), so exact drug names, gene symbols
+    and lab codes found by BM25 reach the top k alongside semantic matches.
+    The BM25 index is saved to `persist_dir/bm25.npz` by flush() (and at
+    exit); when none is saved yet, it is built from the documents already in
+    the dense store.
+    """
+
+    def __init__(
+        self,
+        dense: VectorStoreBase,
+        persist_dir: str = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        rrf_k: int = 60,
+        candidates: int = 4,
+    ):
+        self.dense = dense
+        self.path = os.path.join(persist_dir, "bm25.npz") if persist_dir else None
+        self.lexical = get_bm25_index(self.path, k1=k1, b=b)
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self._dirty = False
+        if len(self.lexical) == 0:
+            self._backfill()
+        if self.path:
+            atexit.register(self.flush)
+
+    def _backfill(self):
+        # Documents stored while hybrid search was off have no BM25 postings
+        added = 0
+        for documents in self.dense.iter_documents():
+            self.lexical.add(
+                [document_key(document) for document in documents],
+                [document.page_content for document in documents],
+            )
+            added += len(documents)
+        if added:
+            print(f"[HybridVectorStore] Indexed {added} stored documents for BM25")
+            self._dirty = True
+
+    def add_documents(self, docs, metadata=None):
+        ids = self.dense.add_documents(docs, metadata)
+        if ids:
+            texts = {content_id(text): text for text in docs}
+            self.lexical.add(ids, [texts[doc_id] for doc_id in ids])
+            self._dirty = True
+        return ids
+
+    def get_documents(self, ids):
+        return self.dense.get_documents(ids)
+
+    def iter_documents(self, batch_size=1000):
+        return self.dense.iter_documents(batch_size)
+
+    def flush(self):
+        self.dense.flush()
+        if self._dirty and self.path:
+            self.lexical.save(self.path)
+        self._dirty = False
+
+    def corpus_version(self):
+        return self.dense.corpus_version()
+
+    def similarity_search(self, query, k=3, filter=None):
+        return self.similarity_search_batch([query], k=k, filter=filter)[0]
+
+    def similarity_search_batch(self, queries, k=3, filter=None):
+        fetch_k = max(k * self.candidates, k)
+        dense = self.dense.similarity_search_batch(queries, k=fetch_k, filter=filter)
+        return [
+            self._fuse(query, documents, k, fetch_k, filter)
+            for query, documents in zip(queries, dense)
+        ]
+
+    def _fuse(self, query, dense, k, fetch_k, filter=None):
+        lexical = self.lexical.search(query, k=fetch_k)
+
+        documents = {document_key(document): document for document in dense}
+        if filter:
+            # BM25 holds no metadata: check its candidates against the filter
+            missing = [doc_id for doc_id, _ in lexical if doc_id not in documents]
+            for document in self.dense.get_documents(missing):
+                documents[document_key(document)] = document
+            lexical = [
+                (doc_id, score)
+                for doc_id, score in lexical
+                if doc_id in documents and matches(documents[doc_id].metadata, filter)
+            ]
+
+        scores = {}
+        for rank, document in enumerate(dense):
+            doc_id = document_key(document)
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+        for rank, (doc_id, _) in enumerate(lexical):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        top = sorted(scores, key=scores.get, reverse=True)[:k]
+        missing = [doc_id for doc_id in top if doc_id not in documents]
+        if missing:
+            for document in self.dense.get_documents(missing):
+                documents[document_key(document)] = document
+        return [documents[doc_id] for doc_id in top if doc_id in documents]
+
+    def as_retriever(self, k=3):
+        return StoreRetriever(store=self, k=k)
+
+
+class RerankingVectorStore(VectorStoreBase):
+    """
+    Wraps a store with a cross-encoder stage: similarity_search fetches
+    `candidates` results from the wrapped store and keeps the k the reranker
+    scores best, or the first k if it runs out of its time budget.
+    """
+
+    def __init__(self, store: VectorStoreBase, reranker, candidates: int = 50):
+        self.store = store
+        self.reranker = reranker
+        self.candidates = candidates
+
+    def add_documents(self, docs, metadata=None):
+        return self.store.add_documents(docs, metadata)
+
+    def get_documents(self, ids):
+        return self.store.get_documents(ids)
+
+    def iter_documents(self, batch_size=1000):
+        return self.store.iter_documents(batch_size)
+
+    def flush(self):
+        self.store.flush()
+
+    def corpus_version(self):
+        return self.store.corpus_version()
+
+    def similarity_search(self, query, k=3, filter=None):
+        return self.similarity_search_batch([query], k=k, filter=filter)[0]
+
+    def similarity_search_batch(self, queries, k=3, filter=None):
+        candidates = self.store.similarity_search_batch(
+            queries, k=max(self.candidates, k), filter=filter
+        )
+        return [
+            self.reranker.rerank(query, documents, top_n=k)
+            for query, documents in zip(queries, candidates)
+        ]
+
+    def as_retriever(self, k=3):
+        return StoreRetriever(store=self, k=k)
+
+
+class StoreRetriever(BaseRetriever):
+    """LangChain retriever over a hybrid or reranking store."""
+
+    store: VectorStoreBase
+    k: int = 3
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.store.similarity_search(query, k=self.k)
+
+
+def get_vector_store(
+    store_type: str = "chroma", hybrid: dict = None, reranker: dict = None, **kwargs
+) -> VectorStoreBase:
     if store_type == "chroma":
-        return ChromaVectorStore(**kwargs)
+        store = ChromaVectorStore(**kwargs)
     elif store_type == "faiss":
-        return FAISSVectorStore(**kwargs)
+        store = FAISSVectorStore(**kwargs)
     else:
         raise ValueError(f"Unsupported store type: {store_type}")
+    hybrid = dict(hybrid or {})
+    if hybrid.pop("enabled", False):
+        store = HybridVectorStore(
+            store, persist_dir=kwargs.get("persist_dir"), **hybrid
+        )
+    reranker = dict(reranker or {})
+    candidates = reranker.pop("candidates", 50)
+    cross_encoder = get_reranker(**reranker)
+    if cross_encoder is not None:
+        store = RerankingVectorStore(store, cross_encoder, candidates=candidates)
+    return store
 
 
 def get_vector_retriever(store_type="chroma", k=3, **kwargs):
@@ -81,11 +606,8 @@ def get_vector_retriever(store_type="chroma", k=3, **kwargs):
     return store
 
 
-def get_embeddings_model(model_name=None):
-    from sentence_transformers import SentenceTransformer
-
-    model_name = (
-        "sentence-transformers/all-MiniLM-L6-v2" if not model_name else model_name
+def get_embeddings_model(model_name=None, embedding_cache=None, device=None):
+    """Embedding service for agent memory; shares the model loaded for the retriever."""
+    return get_embedding_service(
+        model_name, device=device, embedding_cache=embedding_cache
     )
-    global_embedding_model_for_memory = SentenceTransformer(model_name)
-    return global_embedding_model_for_memory
@@ -0,0 +1,313 @@
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of text embeddings.
+
+    Entries are keyed on (model name, sha256 of the whitespace-normalized
+    text). Vectors are stored as float16 rows of one memory-mapped file per
+    model, and an SQLite table maps each key to its row. Cached vectors are
+    returned as float32 (rounded through float16 on a miss too, so hits and
+    misses agree).
+
+    New entries are buffered and written `write_batch` at a time (and by
+    flush(), also called at exit), so a run of single-query misses shares one
+    msync and one commit. With `max_entries` each model's rows form a ring:
+    once full, new entries reuse the oldest rows and their keys are dropped.
+    Rows are claimed under an exclusive SQLite transaction, so processes
+    sharing `local_path` never hand out the same row. Old keys are deleted
+    before their row is reused and new keys are committed only after their
+    vectors are flushed, so a crash can lose entries but never point a key at
+    the wrong vector.
+    """
+
+    def __init__(
+        self,
+        local_path: str,
+        db_name: str = "embedding_cache",
+        initial_capacity: int = 4096,
+        max_entries: Optional[int] = None,
+        write_batch: int = 64,
+    ):
+        db_name = db_name + ".db" if not db_name.endswith(".db") else db_name
+        self.local_path = local_path
+        self.db_path = os.path.join(local_path, db_name)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.initial_capacity = initial_capacity
+        self.max_entries = max_entries
+        self.write_batch = max(1, write_batch)
+        self.hits = 0
+        self.misses = 0
+        self._vectors = {}
+        self._rows = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.create_table()
+        # Registered before the stores and memory writer that embed through
+        # this cache, so it runs after their own exit hooks
+        atexit.register(self.flush)
+
+    def __repr__(self):
+        return f"<EmbeddingCache path='{self.db_path}' models={list(self._rows)}>"
+
+    def get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+    def create_table(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embedding_models (
+                    model TEXT PRIMARY KEY,
+                    dim INTEGER,
+                    rows INTEGER
+                )
+                """
+            )
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    row INTEGER
+                )
+                """
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_row ON embeddings (model, row)"
+            )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(str(text).split())
+
+    def key_for(self, model: str, text: str) -> str:
+        payload = f"{model}\x00{self.normalize(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _vector_path(self, model: str) -> str:
+        name = hashlib.sha256(model.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.local_path, f"embeddings-{name}.f16")
+
+    def _open(self, model: str, dim: int = None) -> Optional[np.memmap]:
+        if model in self._vectors:
+            return self._vectors[model]
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT dim, rows FROM embedding_models WHERE model = ?", (model,)
+            ).fetchone()
+            if row is None:
+                if dim is None:
+                    return None
+                conn.execute(
+                    "INSERT OR IGNORE INTO embedding_models (model, dim, rows) "
+                    "VALUES (?, ?, 0)",
+                    (model, dim),
+                )
+                row = (dim, 0)
+        dim, rows = row
+        path = self._vector_path(model)
+        if os.path.exists(path) and os.path.getsize(path) >= 2 * dim:
+            vectors = self._map(model, dim)
+        else:
+            capacity = max(self.initial_capacity, rows)
+            if self.max_entries:
+                capacity = min(capacity, self.max_entries)
+            vectors = np.memmap(
+                path, dtype=np.float16, mode="w+", shape=(capacity, dim)
+            )
+        self._vectors[model] = vectors
+        self._rows[model] = rows
+        return vectors
+
+    def _map(self, model: str, dim: int) -> np.memmap:
+        # Maps the whole file, which other processes may have grown
+        path = self._vector_path(model)
+        capacity = os.path.getsize(path) // (2 * dim)
+        self._vectors[model] = np.memmap(
+            path, dtype=np.float16, mode="r+", shape=(capacity, dim)
+        )
+        return self._vectors[model]
+
+    def _reserve(self, model: str, count: int) -> tuple:
+        """
+        Claims the next `count` rows of `model` (growing its file if needed)
+        and drops the keys of any row reused; returns (vectors, rows).
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            conn.execute("BEGIN EXCLUSIVE")
+            (written,) = conn.execute(
+                "SELECT rows FROM embedding_models WHERE model = ?", (model,)
+            ).fetchone()
+            rows = np.arange(written, written + count)
+            if self.max_entries:
+                rows %= self.max_entries
+                if written + count > self.max_entries:
+                    conn.executemany(
+                        "DELETE FROM embeddings WHERE model = ? AND row = ?",
+                        [(model, int(row)) for row in rows],
+                    )
+            vectors = self._grow(model, int(rows.max()) + 1)
+            conn.execute(
+                "UPDATE embedding_models SET rows = ? WHERE model = ?",
+                (written + count, model),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._rows[model] = written + count
+        return vectors, rows
+
+    def _grow(self, model: str, needed: int) -> np.memmap:
+        # Only called inside _reserve's exclusive transaction, so concurrent
+        # processes cannot shrink each other's files
+        dim = self._dim(model)
+        vectors = self._vectors[model]
+        if needed > len(vectors):
+            vectors = self._map(model, dim)
+        if needed <= len(vectors):
+            return vectors
+        capacity = len(vectors)
+        while capacity < needed:
+            capacity *= 2
+        if self.max_entries:
+            capacity = max(min(capacity, self.max_entries), needed)
+        vectors.flush()
+        del vectors
+        with open(self._vector_path(model), "r+b") as f:
+            f.truncate(capacity * dim * 2)
+        return self._map(model, dim)
+
+    def _dim(self, model: str) -> int:
+        return self._vectors[model].shape[1]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Returns the cached vector of each text, or None where it is missing."""
+        keys = [self.key_for(model, text) for text in texts]
+        with self._lock:
+            pending = self._pending.get(model, {})
+            vectors = self._open(model)
+            rows = {}
+            stored_keys = [key for key in keys if key not in pending]
+            if vectors is not None and stored_keys:
+                with self.get_connection() as conn:
+                    # Stay below SQLite's bound-parameter limit
+                    for start in range(0, len(stored_keys), 500):
+                        chunk = stored_keys[start : start + 500]
+                        placeholders = ",".join("?" * len(chunk))
+                        rows.update(
+                            conn.execute(
+                                f"SELECT key, row FROM embeddings WHERE key IN ({placeholders})",
+                                chunk,
+                            ).fetchall()
+                        )
+                if rows and max(rows.values()) >= len(vectors):
+                    # Written by another process after its file grew
+                    vectors = self._map(model, self._dim(model))
+            results = []
+            for key in keys:
+                if key in pending:
+                    results.append(pending[key].astype(np.float32))
+                elif key in rows:
+                    results.append(np.asarray(vectors[rows[key]], dtype=np.float32))
+                else:
+                    results.append(None)
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(keys) - found
+            return results
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """Buffers new entries; they are written once `write_batch` are pending."""
+        vectors = np.asarray(vectors, dtype=np.float16)
+        with self._lock:
+            pending = self._pending.setdefault(model, {})
+            for text, vector in zip(texts, vectors):
+                pending.setdefault(self.key_for(model, text), vector)
+            if len(pending) >= self.write_batch:
+                self._write(model)
+
+    def flush(self):
+        """Writes every buffered entry to disk."""
+        with self._lock:
+            for model in list(self._pending):
+                self._write(model)
+
+    def _write(self, model: str):
+        entries = self._pending.pop(model, None)
+        if not entries:
+            return
+        if self.max_entries:
+            # A ring cannot hold more than max_entries: keep the newest
+            entries = dict(list(entries.items())[-self.max_entries :])
+        stacked = np.stack(list(entries.values()))
+        self._open(model, dim=stacked.shape[1])
+        stored, rows = self._reserve(model, len(entries))
+        stored[rows] = stacked
+        stored.flush()
+        with self.get_connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, row) VALUES (?, ?, ?)",
+                [(key, model, int(row)) for key, row in zip(entries, rows)],
+            )
+
+    def embed(
+        self, model: str, texts: List[str], encode: Callable[[List[str]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Returns float32 embeddings for `texts`, calling `encode` once with only
+        the distinct texts that are not cached yet.
+        """
+        texts = list(texts)
+        results = self.get_many(model, texts)
+        missing = list(
+            dict.fromkeys(
+                text for text, vector in zip(texts, results) if vector is None
+            )
+        )
+        if missing:
+            encoded = np.asarray(encode(missing), dtype=np.float16)
+            self.put_many(model, missing, encoded)
+            fresh = dict(zip(missing, encoded.astype(np.float32)))
+            results = [
+                fresh[text] if vector is None else vector
+                for text, vector in zip(texts, results)
+            ]
+        if not results:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack(results)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": {
+                model: min(rows, self.max_entries or rows)
+                + len(self._pending.get(model, {}))
+                for model, rows in self._rows.items()
+            },
+        }
+
+
+def get_embedding_cache(enabled: bool = False, **kwargs) -> Optional[EmbeddingCache]:
+    """Builds the embedding cache from the `cache.embeddings` settings block."""
+    if not enabled:
+        return None
+    return EmbeddingCache(**kwargs)
@@ -0,0 +1,142 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+class EmbeddingScheduler:
+    """
+    Coalesces concurrent embedding requests into shared forward passes.
+
+    Callers (Streamlit sessions, graph nodes) submit their texts and block on
+    a future; a worker thread drains the queue until `max_batch_size` texts
+    are pending or `max_wait_ms` has passed since the first one arrived,
+    encodes them in one call per distinct set of encode options, and hands
+    each caller its slice of the result. After close() (e.g. at interpreter
+    exit, possibly before other shutdown hooks still embedding) requests are
+    encoded inline in the calling thread.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[..., np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 10000,
+    ):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._requests = 0
+        self._wait_ms = 0.0
+        self._max_queue_depth = 0
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-scheduler", daemon=True
+        )
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, texts: List[str], **kwargs) -> Future:
+        future = Future()
+        with self._submit_lock:
+            queued = not self._closed
+            if queued:
+                self._queue.put((list(texts), kwargs, future, time.perf_counter()))
+        if not queued:
+            try:
+                future.set_result(self.encode(list(texts), **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def embed(self, texts: List[str], **kwargs) -> np.ndarray:
+        return self.submit(texts, **kwargs).result()
+
+    def close(self):
+        """Encodes the requests already queued, then stops the worker."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch, size = [item], len(item[0])
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while size < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: list):
+        started = time.perf_counter()
+        # Requests with different encode options cannot share a forward pass
+        groups = {}
+        for request in batch:
+            options = {k: v for k, v in request[1].items() if k != "batch_size"}
+            groups.setdefault(repr(sorted(options.items())), []).append(request)
+        for requests in groups.values():
+            texts = [text for request in requests for text in request[0]]
+            options = {k: v for k, v in requests[0][1].items() if k != "batch_size"}
+            try:
+                vectors = self.encode(texts, batch_size=self.max_batch_size, **options)
+            except Exception as e:
+                for _, _, future, _ in requests:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_texts, _, future, _ in requests:
+                future.set_result(vectors[start : start + len(request_texts)])
+                start += len(request_texts)
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._items += sum(len(request[0]) for request in batch)
+            self._wait_ms += sum((started - request[3]) * 1000 for request in batch)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "requests": self._requests,
+                "items": self._items,
+                "mean_batch_size": self._items / self._batches if self._batches else 0,
+                "mean_wait_ms": self._wait_ms / self._requests if self._requests else 0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+            }
+
+
+def get_embedding_scheduler(
+    encode: Callable[..., np.ndarray], enabled: bool = False, **kwargs
+) -> Optional[EmbeddingScheduler]:
+    """Builds a scheduler from the `embeddings.scheduler` settings block."""
+    if not enabled:
+        return None
+    return EmbeddingScheduler(encode, **kwargs)
@@ -0,0 +1,238 @@
+import os
+import threading
+from typing import List, Optional, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.vector_db.embedding_scheduler import get_embedding_scheduler
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ("torch", "onnx")
+
+# One resident SentenceTransformer per (model, device, backend, quantize,
+# threads), shared by services
+_models = {}
+_models_lock = threading.Lock()
+
+
+def normalize_model_name(model_name: str = None) -> str:
+    """Maps short names ("all-MiniLM-L6-v2") to their hub id, as SentenceTransformer does."""
+    model_name = model_name or DEFAULT_EMBEDDING_MODEL
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def _load_model(
+    model_name: str,
+    device: Optional[str],
+    backend: str = "torch",
+    quantize: Optional[str] = None,
+    threads: Optional[int] = None,
+    onnx_dir: str = "data/onnx/",
+):
+    key = (model_name, device, backend, quantize, threads)
+    with _models_lock:
+        if key not in _models:
+            from sentence_transformers import SentenceTransformer
+
+            print(
+                f"[EmbeddingService] Loading {model_name} ({backend}"
+                f"{'-' + quantize if quantize else ''}) on {device or 'auto'}"
+            )
+            if backend == "onnx":
+                _models[key] = _load_onnx_model(
+                    model_name, device, quantize, threads, onnx_dir
+                )
+            else:
+                _models[key] = SentenceTransformer(model_name, device=device)
+        return _models[key]
+
+
+def _load_onnx_model(
+    model_name: str,
+    device: Optional[str],
+    quantize: Optional[str],
+    threads: Optional[int],
+    onnx_dir: str,
+):
+    """
+    Loads `model_name` on ONNX Runtime (CPU). With `quantize` ("avx2",
+    "avx512", "avx512_vnni" or "arm64") the exported model is dynamically
+    quantized to int8 weights once and kept under `onnx_dir`.
+    """
+    import onnxruntime as ort
+    from sentence_transformers import (
+        SentenceTransformer,
+        export_dynamic_quantized_onnx_model,
+    )
+
+    session_options = ort.SessionOptions()
+    if threads:
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+    model_kwargs = {
+        "provider": "CPUExecutionProvider",
+        "session_options": session_options,
+    }
+    if not quantize:
+        return SentenceTransformer(
+            model_name, device=device, backend="onnx", model_kwargs=model_kwargs
+        )
+
+    export_path = os.path.join(onnx_dir, model_name.replace("/", "__"))
+    file_name = f"onnx/model_qint8_{quantize}.onnx"
+    if not os.path.exists(os.path.join(export_path, file_name)):
+        print(f"[EmbeddingService] Exporting {model_name} to {export_path}")
+        exported = SentenceTransformer(model_name, device=device, backend="onnx")
+        exported.save(export_path)
+        export_dynamic_quantized_onnx_model(exported, quantize, export_path)
+    return SentenceTransformer(
+        export_path,
+        device=device,
+        backend="onnx",
+        model_kwargs={**model_kwargs, "file_name": file_name},
+    )
+
+
+class EmbeddingService(Embeddings):
+    """
+    The embedding model used by the vector stores and agent memory.
+
+    It is a LangChain Embeddings (embed_documents / embed_query) for the vector
+    stores and exposes the SentenceTransformer-style encode() returning a
+    float32 numpy batch for memory and the semantic cache. All services for
+    the same (model, device) share one loaded model, and with an
+    `embedding_cache` every call goes through it.
+
+    `backend="onnx"` runs the model on ONNX Runtime with `threads` intra-op
+    threads instead of PyTorch, optionally with int8 weights (`quantize`).
+    ONNX fp32 vectors match the torch ones within float tolerance, so they
+    share cache entries and existing indexes; quantized ones are cached apart.
+
+    Once configure_scheduler() is called, cache misses of all services on a
+    model are coalesced by one shared EmbeddingScheduler instead of each
+    running its own small forward pass.
+    """
+
+    scheduler_config: Optional[dict] = None
+    _schedulers = {}
+    _schedulers_lock = threading.Lock()
+
+    @classmethod
+    def configure_scheduler(cls, config: Optional[dict]):
+        """Sets the `embeddings.scheduler` settings used by every service."""
+        cls.scheduler_config = config
+
+    @classmethod
+    def scheduler_stats(cls) -> dict:
+        return {
+            f"{model}@{device or 'auto'}/{backend}": scheduler.stats()
+            for (model, device, backend, *_), scheduler in cls._schedulers.items()
+            if scheduler is not None
+        }
+
+    def __init__(
+        self,
+        model_name: str = None,
+        device: Optional[str] = None,
+        embedding_cache=None,
+        batch_size: int = 32,
+        backend: str = "torch",
+        quantize: Optional[str] = None,
+        threads: Optional[int] = None,
+        onnx_dir: str = "data/onnx/",
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported embedding backend '{backend}'.")
+        self.model_name = normalize_model_name(model_name)
+        self.device = device
+        self.embedding_cache = embedding_cache
+        self.batch_size = batch_size
+        self.backend = backend
+        self.quantize = quantize if backend == "onnx" else None
+        self.threads = threads
+        self.onnx_dir = onnx_dir
+
+    def __repr__(self):
+        return (
+            f"<EmbeddingService model='{self.model_name}' device={self.device} "
+            f"backend={self.backend}>"
+        )
+
+    @property
+    def _key(self) -> tuple:
+        return (self.model_name, self.device, self.backend, self.quantize, self.threads)
+
+    @property
+    def model(self):
+        return _load_model(*self._key, onnx_dir=self.onnx_dir)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def scheduler(self):
+        if not self.scheduler_config:
+            return None
+        key = self._key
+        with self._schedulers_lock:
+            if key not in self._schedulers:
+                self._schedulers[key] = get_embedding_scheduler(
+                    self._forward, **self.scheduler_config
+                )
+            return self._schedulers[key]
+
+    def _forward(self, texts: List[str], **kwargs) -> np.ndarray:
+        kwargs.setdefault("batch_size", self.batch_size)
+        kwargs["convert_to_numpy"] = True
+        return np.asarray(self.model.encode(texts, **kwargs), dtype=np.float32)
+
+    def _encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        scheduler = self.scheduler
+        if scheduler is None:
+            return self._forward(texts, **kwargs)
+        return scheduler.embed(texts, **kwargs)
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        """Embeds a text or a list of texts into a float32 array."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), np.float32)
+        if self.embedding_cache is None:
+            vectors = self._encode(texts, **kwargs)
+        else:
+            model_key = self.model_name
+            if self.quantize:
+                model_key += f"|onnx-{self.quantize}"
+            if kwargs.get("normalize_embeddings"):
+                model_key += "|normalized"
+            vectors = self.embedding_cache.embed(
+                model_key, texts, lambda batch: self._encode(batch, **kwargs)
+            )
+        return vectors[0] if single else vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode(text).tolist()
+
+
+def get_embedding_service(
+    model_name: Union[str, dict] = None,
+    device: Optional[str] = None,
+    embedding_cache=None,
+    **kwargs,
+) -> EmbeddingService:
+    """
+    Returns a service on the shared model instance for `model_name`, which is
+    either a model id or a `retriever.embedding_model` mapping with `name`,
+    `backend`, `quantize`, `threads` and `onnx_dir` keys.
+    """
+    if isinstance(model_name, dict):
+        kwargs = {**model_name, **kwargs}
+        model_name = kwargs.pop("name", None)
+    return EmbeddingService(
+        model_name, device=device, embedding_cache=embedding_cache, **kwargs
+    )
@@ -0,0 +1,149 @@
+"""
+Metadata filters for similarity search.
+
+A filter maps metadata keys to a value, a list of accepted values or a range
+({"$gt" / "$gte" / "$lt" / "$lte": bound}); all keys must match:
+
+    {"source": "guidelines.pdf"}
+    {"extension": [".pdf", ".md"], "chunk_id": {"$lt": 10}}
+
+Chroma evaluates filters natively (to_chroma_where). FAISSVectorStore keeps a
+MetadataIndex of index positions per metadata value and hands FAISS a bitmap
+of the matching positions, so a filtered query only scans those vectors.
+"""
+
+import operator
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from backend.vector_db.quantization import base_index
+
+RANGE_OPERATORS = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+
+
+def _is_range(condition) -> bool:
+    return isinstance(condition, dict)
+
+
+def _accepts(condition, value) -> bool:
+    if _is_range(condition):
+        try:
+            return all(
+                RANGE_OPERATORS[op](value, bound) for op, bound in condition.items()
+            )
+        except TypeError:  # value not comparable with the bound
+            return False
+    if isinstance(condition, (list, tuple, set)):
+        return value in condition
+    return value == condition
+
+
+def check_filter(filter: Optional[dict]) -> Optional[dict]:
+    for key, condition in (filter or {}).items():
+        if _is_range(condition) and not set(condition) <= set(RANGE_OPERATORS):
+            raise ValueError(
+                f"Unsupported operator in filter on '{key}': {list(condition)}, "
+                f"expected {list(RANGE_OPERATORS)}."
+            )
+    return filter
+
+
+def matches(metadata: dict, filter: Optional[dict]) -> bool:
+    """Evaluates `filter` against one document's metadata."""
+    return all(
+        key in metadata and _accepts(condition, metadata[key])
+        for key, condition in (filter or {}).items()
+    )
+
+
+def to_chroma_where(filter: Optional[dict]) -> Optional[dict]:
+    """Translates a filter into a Chroma `where` clause."""
+    if not filter:
+        return None
+    clauses = []
+    for key, condition in check_filter(filter).items():
+        if _is_range(condition):
+            clauses.extend({key: {op: bound}} for op, bound in condition.items())
+        elif isinstance(condition, (list, tuple, set)):
+            clauses.append({key: {"$in": list(condition)}})
+        else:
+            clauses.append({key: {"$eq": condition}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class MetadataIndex:
+    """
+    Index positions of stored documents per (metadata key, value), so a filter
+    resolves to the set of matching positions without touching the documents.
+    """
+
+    def __init__(self):
+        self.postings = {}  # key -> value -> list of positions
+
+    def __len__(self):
+        return sum(len(values) for values in self.postings.values())
+
+    def add(self, positions, metadatas):
+        for position, metadata in zip(positions, metadatas):
+            for key, value in (metadata or {}).items():
+                try:
+                    postings = self.postings.setdefault(key, {})
+                    postings.setdefault(value, []).append(position)
+                except TypeError:  # unhashable values (lists, dicts) aren't indexed
+                    continue
+
+    def mask(self, filter: dict, ntotal: int) -> np.ndarray:
+        """Boolean array over index positions, True where `filter` matches."""
+        selected = np.ones(ntotal, dtype=bool)
+        for key, condition in check_filter(filter).items():
+            key_mask = np.zeros(ntotal, dtype=bool)
+            for value, positions in self.postings.get(key, {}).items():
+                if _accepts(condition, value):
+                    key_mask[np.asarray(positions, dtype=np.int64)] = True
+            selected &= key_mask
+        return selected
+
+
+def search_subset(index, queries: np.ndarray, k: int, mask: np.ndarray) -> tuple:
+    """
+    k-NN of `queries` restricted to the positions set in `mask`, returned as
+    FAISS (distances, positions) with -1 padding.
+    """
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    base = base_index(index)
+    if isinstance(base, faiss.IndexPQ):
+        # PQ search takes no id selector: decode and scan just the subset,
+        # padding to k the way FAISS does
+        positions = np.flatnonzero(mask)
+        distances = np.full((len(queries), k), np.finfo("float32").max, "float32")
+        found = np.full((len(queries), k), -1, dtype="int64")
+        n = min(k, len(positions))
+        if n:
+            distances[:, :n], subset = faiss.knn(
+                queries, index.reconstruct_batch(positions), n
+            )
+            found[:, :n] = positions[subset]
+        return distances, found
+
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+    if isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    elif isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        base_params = params
+        params = faiss.IndexRefineSearchParameters(
+            k_factor=index.k_factor, base_index_params=base_params
+        )
+    return index.search(queries, k, params=params)
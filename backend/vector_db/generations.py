@@ -0,0 +1,42 @@
+"""
+Generation directories for stores saved as several files.
+
+Each save writes a fresh `gen-N` directory next to the previous one and then
+replaces the CURRENT pointer file, which names the live generation, in a
+single os.replace. A crash mid-save leaves CURRENT on the last complete
+generation, so readers never see files from two different saves.
+"""
+
+import os
+import shutil
+from typing import Optional
+
+
+def read_current(path: str) -> Optional[str]:
+    """Name of the live generation under `path`, or None if never saved."""
+    pointer = os.path.join(path, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return f.read().strip() or None
+
+
+def next_generation(path: str) -> tuple:
+    """(current generation, new generation directory) for the next save."""
+    os.makedirs(path, exist_ok=True)
+    current = read_current(path)
+    generation = f"gen-{int(current.split('-')[1]) + 1 if current else 0}"
+    os.makedirs(os.path.join(path, generation), exist_ok=True)
+    return current, generation
+
+
+def switch_generation(path: str, current: Optional[str], generation: str):
+    """Points CURRENT at `generation` atomically, then drops `current`."""
+    tmp_pointer = os.path.join(path, "CURRENT.tmp")
+    with open(tmp_pointer, "w") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, os.path.join(path, "CURRENT"))
+    if current and current != generation:
+        shutil.rmtree(os.path.join(path, current), ignore_errors=True)
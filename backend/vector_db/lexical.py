@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+# Keeps drug names, gene symbols and lab codes (CYP2C19, HbA1c, IL-6, 5.2mmol/L)
+# as single tokens instead of splitting them on digits or dashes.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[\-\./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the documents of a vector store.
+
+    Postings are kept as compressed sparse rows: for term t, documents
+    doc_ids[offsets[t]:offsets[t + 1]] (int32) with term frequencies tfs
+    (int32), plus a document-length array, so the index stays a handful of
+    flat numpy arrays however large the corpus gets. Documents are identified
+    by the vector store's content ids. add() only tokenizes into a delta
+    segment, which is spliced into the arrays in one linear pass at the next
+    search() or save(), so bulk ingestion stays linear in the corpus size.
+    save()/load() use a single .npz swapped in atomically.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.int32)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.doc_keys = np.zeros(0, dtype="S64")
+        self._pending = _empty_segment()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._merge()
+            return len(self.doc_lengths)
+
+    def __repr__(self):
+        return f"<BM25Index docs={len(self)} terms={len(self.terms)} postings={len(self.doc_ids)}>"
+
+    def add(self, keys: List[str], texts: List[str]):
+        """Tokenizes `texts` into the delta segment (merged by _merge)."""
+        with self._lock:
+            first_doc = len(self.doc_lengths) + sum(
+                len(lengths) for lengths in self._pending["doc_lengths"]
+            )
+            term_ids, doc_ids, tfs, lengths = [], [], [], []
+            for i, text in enumerate(texts):
+                tokens = tokenize(text)
+                lengths.append(len(tokens))
+                counts = {}
+                for token in tokens:
+                    term = self.terms.setdefault(token, len(self.terms))
+                    counts[term] = counts.get(term, 0) + 1
+                term_ids.extend(counts)
+                tfs.extend(counts.values())
+                doc_ids.extend([first_doc + i] * len(counts))
+            pending = self._pending
+            pending["term_ids"].append(np.asarray(term_ids, np.int64))
+            pending["doc_ids"].append(np.asarray(doc_ids, np.int32))
+            pending["tfs"].append(np.asarray(tfs, np.int32))
+            pending["doc_lengths"].append(np.asarray(lengths, np.int32))
+            pending["doc_keys"].append(np.asarray(keys, dtype="S64"))
+
+    def _merge(self):
+        # Splices the delta segment into the postings in one linear pass: new
+        # documents have the highest ids, so each term's new postings go right
+        # after its existing ones. Caller holds the lock.
+        pending = self._pending
+        if not pending["doc_keys"]:
+            return
+        term_ids = np.concatenate(pending["term_ids"])
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        old_terms = len(self.offsets) - 1
+        positions = self.offsets[np.minimum(term_ids + 1, old_terms)]
+        self.doc_ids = np.insert(
+            self.doc_ids, positions, np.concatenate(pending["doc_ids"])[order]
+        )
+        self.tfs = np.insert(self.tfs, positions, np.concatenate(pending["tfs"])[order])
+        counts = np.bincount(term_ids, minlength=len(self.terms))
+        counts[:old_terms] += np.diff(self.offsets)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.doc_lengths = np.concatenate([self.doc_lengths, *pending["doc_lengths"]])
+        self.doc_keys = np.concatenate([self.doc_keys, *pending["doc_keys"]])
+        self._pending = _empty_segment()
+
+    def search(self, query: str, k: int = 10) -> List[tuple]:
+        """Returns up to k (content id, score) pairs, best first."""
+        with self._lock:
+            self._merge()
+            n_docs = len(self.doc_lengths)
+            if n_docs == 0:
+                return []
+            avg_length = max(float(self.doc_lengths.mean()), 1.0)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / avg_length)
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for token in set(tokenize(query)):
+                term = self.terms.get(token)
+                if term is None:
+                    continue
+                start, end = self.offsets[term], self.offsets[term + 1]
+                docs, tfs = self.doc_ids[start:end], self.tfs[start:end]
+                df = end - start
+                idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [
+                (self.doc_keys[i].decode("ascii"), float(scores[i])) for i in candidates
+            ]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            self._merge()
+            terms = sorted(self.terms, key=self.terms.get)
+            tmp_path = path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs,
+                doc_lengths=self.doc_lengths,
+                doc_keys=self.doc_keys,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "BM25Index":
+        data = np.load(path)
+        index = cls(**kwargs)
+        terms = bytes(data["terms"]).decode("utf-8")
+        index.terms = {
+            term: i for i, term in enumerate(terms.split("\n") if terms else [])
+        }
+        index.offsets = data["offsets"]
+        index.doc_ids = data["doc_ids"]
+        index.tfs = data["tfs"]
+        index.doc_lengths = data["doc_lengths"]
+        index.doc_keys = data["doc_keys"]
+        return index
+
+
+def _empty_segment() -> dict:
+    keys = ("term_ids", "doc_ids", "tfs", "doc_lengths", "doc_keys")
+    return {key: [] for key in keys}
+
+
+def get_bm25_index(path: Optional[str] = None, **kwargs) -> BM25Index:
+    """Loads the index saved at `path`, or starts an empty one."""
+    if path and os.path.exists(path):
+        return BM25Index.load(path, **kwargs)
+    return BM25Index(**kwargs)
@@ -0,0 +1,291 @@
+"""
+Storage precision for FAISS indexes.
+
+💡 Precision options (384-dim MiniLM vectors)
+Precision || Bytes/vector || Training || Comments
+float32   || 1536         || No       || Exact.
+float16   || 768          || No       || Scalar quantizer, near-exact.
+int8      || 384          || Yes      || Scalar quantizer, per-dimension ranges.
+pq        || pq_m         || Yes      || Product quantizer, 2^pq_nbits codes per sub-vector.
+
+With `rerank=True` the quantized index is wrapped in an IndexRefineFlat: it
+fetches `rerank_k_factor * k` candidates and re-ranks them on exact vectors,
+which brings recall back at the cost of keeping a float32 copy. Without it,
+codec_of() / train_index() carry a trained quantizer over to a new index so
+rebuilding never re-trains on already quantized vectors.
+
+Run `python -m backend.vector_db.quantization <index.faiss>` for a recall@k
+vs memory report on a saved index (e.g. the FAISSVectorStore persist_dir).
+"""
+
+import argparse
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8", "pq")
+# Precisions whose reconstructed vectors drift from the originals
+LOSSY_PRECISIONS = ("int8", "pq")
+_SQ_TYPES = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def check_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"Unsupported precision '{precision}', expected one of {PRECISIONS}."
+        )
+    return precision
+
+
+def pq_subquantizers(dim: int, pq_m: Optional[int] = None) -> int:
+    """Largest divisor of `dim` not above `pq_m` (default: one per 8 dimensions)."""
+    pq_m = min(pq_m or max(1, dim // 8), dim)
+    while dim % pq_m:
+        pq_m -= 1
+    return pq_m
+
+
+def min_training_size(
+    precision: str, tier: str = "flat", nlist: int = 1, pq_nbits: int = 8
+) -> int:
+    """Vectors needed before an index of this precision and tier can be trained."""
+    needed = 0
+    if precision == "int8":
+        needed = 1
+    elif precision == "pq":
+        # k-means needs ~39 points per centroid for a usable codebook
+        needed = 39 * 2**pq_nbits
+    if tier == "ivf":
+        needed = max(needed, nlist)
+    return needed
+
+
+def make_index(
+    dim: int,
+    precision: str = "float32",
+    tier: str = "flat",
+    nlist: int = 1,
+    hnsw_m: int = 32,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = 8,
+    rerank: bool = False,
+    rerank_k_factor: int = 4,
+    by_residual: bool = True,
+):
+    """
+    Builds an empty flat / IVF / HNSW index storing vectors at `precision`.
+    `by_residual=False` makes quantized IVF codes independent of the coarse
+    centroids, so their quantizer can be reused by other tiers.
+    """
+    check_precision(precision)
+    if tier == "hnsw":
+        if precision == "float32":
+            index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        elif precision == "pq":
+            index = faiss.IndexHNSWPQ(
+                dim, pq_subquantizers(dim, pq_m), hnsw_m, pq_nbits
+            )
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[precision], hnsw_m)
+    elif tier == "ivf":
+        quantizer = faiss.IndexFlatL2(dim)
+        if precision == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        elif precision == "pq":
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist, pq_subquantizers(dim, pq_m), pq_nbits
+            )
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dim, nlist, _SQ_TYPES[precision]
+            )
+        if precision != "float32":
+            index.by_residual = by_residual
+    else:
+        if precision == "float32":
+            index = faiss.IndexFlatL2(dim)
+        elif precision == "pq":
+            index = faiss.IndexPQ(dim, pq_subquantizers(dim, pq_m), pq_nbits)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[precision])
+    if rerank and precision != "float32":
+        index = faiss.IndexRefineFlat(index)
+        index.k_factor = rerank_k_factor
+    return index
+
+
+def base_index(index):
+    """The index doing the (approximate) search, below any IDMap / refine wrapper."""
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexRefine)):
+        inner = index.index if isinstance(index, faiss.IndexIDMap) else index.base_index
+        index = faiss.downcast_index(inner)
+    return index
+
+
+def precision_of(index) -> str:
+    index = base_index(index)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+        if isinstance(storage, faiss.IndexPQ):
+            return "pq"
+        index = storage
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+
+def codec_of(index):
+    """
+    The trained ProductQuantizer / ScalarQuantizer `index` encodes vectors
+    with, or None (float32, untrained, or IVF codes stored as residuals).
+    """
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF) and index.by_residual:
+        return None
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if not index.is_trained:
+        return None
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return index.pq
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return index.sq
+    return None
+
+
+def train_index(index, vectors: np.ndarray, codec=None):
+    """
+    Trains `index` on `vectors`. With a `codec` (see codec_of) of the same
+    precision the index encodes with that quantizer instead, and only an IVF
+    coarse quantizer is trained.
+    """
+    if codec is None:
+        if not index.is_trained:
+            index.train(vectors)
+        return index
+    if isinstance(faiss.downcast_index(index), faiss.IndexRefine):
+        raise ValueError("Train re-ranked indexes on their exact vectors instead.")
+    inner = base_index(index)
+    storage = inner
+    if isinstance(inner, faiss.IndexIVF):
+        if inner.by_residual:
+            raise ValueError(
+                "A shared codec needs an IVF index with by_residual=False."
+            )
+        faiss.Clustering(inner.d, inner.nlist).train(vectors, inner.quantizer)
+    elif isinstance(inner, faiss.IndexHNSW):
+        storage = faiss.downcast_index(inner.storage)
+    if codec.code_size != storage.code_size:
+        raise ValueError("The codec does not match the index's code size.")
+    if isinstance(codec, faiss.ProductQuantizer):
+        storage.pq = codec
+        if isinstance(inner, faiss.IndexHNSW):
+            # HNSW links PQ codes with symmetric distances
+            storage.pq.compute_sdc_table()
+    else:
+        storage.sq = codec
+    storage.is_trained = True
+    inner.is_trained = True
+    return index
+
+
+def index_bytes(index) -> int:
+    return len(faiss.serialize_index(index))
+
+
+def precision_report(
+    vectors: np.ndarray,
+    queries: Optional[np.ndarray] = None,
+    k: int = 10,
+    precisions=PRECISIONS,
+    rerank: bool = False,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = 8,
+) -> List[dict]:
+    """
+    Builds a flat index per precision over `vectors` and measures recall@k of
+    `queries` (default: 100 sampled vectors) against exact float32 search.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if queries is None:
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), min(100, len(vectors)), False)]
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    dim = vectors.shape[1]
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for precision in precisions:
+        if len(vectors) < min_training_size(precision, pq_nbits=pq_nbits):
+            print(f"[Quantization] Skipping {precision}: too few vectors to train")
+            continue
+        index = make_index(dim, precision, pq_m=pq_m, pq_nbits=pq_nbits, rerank=rerank)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        _, found = index.search(queries, k)
+        hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+        size = index_bytes(index)
+        rows.append(
+            {
+                "precision": precision,
+                "rerank": rerank and precision != "float32",
+                f"recall@{k}": hits / (len(queries) * k),
+                "bytes_per_vector": size / len(vectors),
+                "total_mb": size / 2**20,
+            }
+        )
+    return rows
+
+
+def _load_vectors(path: str, limit: Optional[int]) -> np.ndarray:
+    # Reconstruct through any refine wrapper, which holds the exact vectors
+    index = faiss.read_index(path)
+    inner = index
+    if isinstance(inner, faiss.IndexIDMap):
+        inner = faiss.downcast_index(inner.index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()
+    count = min(inner.ntotal, limit or inner.ntotal)
+    return inner.reconstruct_n(0, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k vs memory per precision.")
+    parser.add_argument(
+        "index", help="Saved FAISS index, e.g. <persist_dir>/index.faiss"
+    )
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--limit", type=int, default=None, help="Use the first N vectors"
+    )
+    parser.add_argument("--rerank", action="store_true")
+    parser.add_argument("--pq-m", type=int, default=None)
+    args = parser.parse_args()
+
+    vectors = _load_vectors(args.index, args.limit)
+    print(f"[Quantization] {len(vectors)} vectors of dim {vectors.shape[1]}")
+    rows = precision_report(vectors, k=args.k, rerank=args.rerank, pq_m=args.pq_m)
+    header = list(rows[0]) if rows else []
+    print(" | ".join(f"{name:>16}" for name in header))
+    for row in rows:
+        print(
+            " | ".join(
+                f"{value:>16.4f}" if isinstance(value, float) else f"{value!s:>16}"
+                for value in row.values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
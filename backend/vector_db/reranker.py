@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """
+    Re-orders retrieved candidates with a small cross-encoder on CPU.
+
+    Query/passage pairs are scored in batches of `batch_size` on a worker
+    thread. rerank() waits at most `budget_ms` for the scores; past that it
+    returns the candidates in their original (dense) order and the worker
+    stops at its next batch, so a slow query never holds up the answer.
+    The model is loaded on first use, outside the budget.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANK_MODEL,
+        device: Optional[str] = "cpu",
+        batch_size: int = 16,
+        max_length: int = 512,
+        budget_ms: float = 200.0,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.budget_ms = budget_ms
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cross-encoder"
+        )
+        self._stats = {"queries": 0, "fallbacks": 0, "total_ms": 0.0}
+
+    def __repr__(self):
+        return f"<CrossEncoderReranker model='{self.model_name}' budget_ms={self.budget_ms}>"
+
+    @property
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                print(f"[CrossEncoderReranker] Loading {self.model_name}")
+                self._model = CrossEncoder(
+                    self.model_name, device=self.device, max_length=self.max_length
+                )
+            return self._model
+
+    def _score(self, query: str, texts: List[str], cancel: threading.Event):
+        scores = []
+        for start in range(0, len(texts), self.batch_size):
+            if cancel.is_set():
+                return None
+            pairs = [(query, text) for text in texts[start : start + self.batch_size]]
+            scores.extend(
+                self.model.predict(
+                    pairs, batch_size=self.batch_size, show_progress_bar=False
+                )
+            )
+        return np.asarray(scores, dtype=np.float32)
+
+    def rerank(self, query: str, documents: list, top_n: int = 3) -> list:
+        """Returns the `top_n` best documents (LangChain Documents) for `query`."""
+        if len(documents) <= 1:
+            return documents[:top_n]
+        self.model  # load outside the budget
+        texts = [document.page_content for document in documents]
+        cancel = threading.Event()
+        start = time.perf_counter()
+        future = self._executor.submit(self._score, query, texts, cancel)
+        try:
+            scores = future.result(timeout=self.budget_ms / 1000)
+        except TimeoutError:
+            cancel.set()
+            scores = None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self._stats["queries"] += 1
+        self._stats["total_ms"] += elapsed_ms
+        if scores is None:
+            self._stats["fallbacks"] += 1
+            print(
+                f"[CrossEncoderReranker] Budget of {self.budget_ms:.0f}ms exceeded, "
+                "keeping dense order"
+            )
+            return documents[:top_n]
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return [documents[i] for i in order]
+
+    def stats(self) -> dict:
+        queries = self._stats["queries"]
+        return {
+            "queries": queries,
+            "fallbacks": self._stats["fallbacks"],
+            "mean_ms": self._stats["total_ms"] / queries if queries else 0.0,
+        }
+
+
+def get_reranker(enabled=False, **kwargs) -> Optional[CrossEncoderReranker]:
+    if not enabled:
+        return None
+    return CrossEncoderReranker(**kwargs)
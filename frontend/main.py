@@ -1,7 +1,7 @@
 # main.py - Enhanced MedAgenticSage Dashboard
 import streamlit as st
+import atexit
 import json
-import faiss
 
 # from datetime import datetime, timedelta
 import plotly.express as px
@@ -14,8 +14,28 @@ from frontend.utils.api import CSS_MAIN
 
 from backend.db.api import SqliteDB_Agent
 from backend.llm.api import load_llm_langchain
+from backend.llm.cache import get_prompt_cache
 from backend.vector_db.clients import get_vector_retriever, get_embeddings_model
-from backend.agents.graph import build_graph, serialize_state
+from backend.vector_db.embedding_cache import get_embedding_cache
+from backend.vector_db.embedding_service import EmbeddingService
+from backend.agents.graph import (
+    build_graph,
+    serialize_state,
+    new_run_id,
+    invoke_graph,
+    resume_graph,
+)
+from backend.agents.semantic_cache import get_semantic_cache
+from backend.agents.memory_index import get_memory_index
+from backend.agents.memory import (
+    MemoryStore,
+    get_memory_writer,
+    load_memory,
+    save_memory,
+)
+from backend.agents.context_packer import get_context_packer
+from backend.agents.templates import Runner
+from backend.agents.telemetry import record_spans
 from configs import models, env, settings
 
 
@@ -123,13 +143,70 @@ def initialize_medagentic_components():
     AGENT_DB.create_table()
 
     llm = load_llm_langchain(**llm_selected, config=config_loaded)
+    Runner.configure_concurrency(settings.get("runner", {}).get("max_concurrency"))
+    Runner.configure_cache(
+        get_prompt_cache(**settings.get("cache", {}).get("prompt", {}))
+    )
+    model_config = models.get(llm_selected["source"], {}).get(
+        llm_selected["model_name"], {}
+    )
+    Runner.configure_context_packer(
+        get_context_packer(
+            model_config.get("context_budget"), tokenizer=model_config.get("tokenizer")
+        )
+    )
+    # Retriever and memory share one embedding model, cache and scheduler
+    EmbeddingService.configure_scheduler(
+        settings.get("embeddings", {}).get("scheduler")
+    )
+    embedding_cache = get_embedding_cache(
+        **settings.get("cache", {}).get("embeddings", {})
+    )
     retriever = get_vector_retriever(
         **settings["retriever"],
+        embedding_cache=embedding_cache,
+    )
+    embeddings_model = get_embeddings_model(
+        settings["retriever"].get("embedding_model"),
+        embedding_cache=embedding_cache,
+        device=settings["retriever"].get("device"),
     )
-    embeddings_model = get_embeddings_model()
-    index = faiss.IndexFlatL2(embeddings_model.get_sentence_embedding_dimension())
+    memory_path = settings.get("memory", {}).get("local_path", "data/memory/")
+    index_config = settings.get("memory", {}).get("index", {})
+    retention = settings.get("memory", {}).get("retention", {})
+    try:
+        memory_store = load_memory(
+            memory_path, index_config=index_config, retention=retention
+        )
+    except FileNotFoundError:
+        memory_store = MemoryStore(
+            index=get_memory_index(
+                embeddings_model.get_sentence_embedding_dimension(), **index_config
+            ),
+            **retention,
+        )
+    # Registered before the writer so queued entries are flushed before saving
+    atexit.register(save_memory, memory_path, memory_store=memory_store)
     graph = build_graph(
-        llm=llm, retriever=retriever, embedding_model=embeddings_model, index=index
+        llm=llm,
+        retriever=retriever,
+        parallel=settings.get("graph", {}).get("parallel", False),
+        agent_db=AGENT_DB if settings.get("graph", {}).get("incremental") else None,
+        checkpointer=(
+            AGENT_DB.get_checkpointer()
+            if settings.get("graph", {}).get("checkpoint")
+            else None
+        ),
+        embedding_model=embeddings_model,
+        memory_store=memory_store,
+        semantic_cache=get_semantic_cache(
+            embeddings_model, **settings.get("cache", {}).get("semantic", {})
+        ),
+        memory_writer=get_memory_writer(
+            embeddings_model,
+            memory_store,
+            **settings.get("memory", {}).get("writer", {}),
+        ),
     )
     return AGENT_DB, llm, retriever, graph
 
@@ -404,6 +481,51 @@ def render_dashboard():
 #             st.success("Analysis complete! Results would appear here.")
 
 
+def record_analysis(initial_state: dict, final_state: dict, spans: list = None):
+    """Saves a finished run and appends its findings to the consultation log."""
+    # Serialize states for saving
+    initial_state_serialized = serialize_state(initial_state)
+    final_state_serialized = serialize_state(final_state)
+
+    # Save the run (and its per-agent timing spans) to the database
+    run_id = AGENT_DB.save_run(initial_state_serialized, final_state_serialized)
+    if spans:
+        AGENT_DB.save_spans(run_id, spans)
+
+    st.session_state["messages"].append(
+        {
+            "role": "assistant",
+            "content": "✅ Analysis complete! Here are the findings:",
+        }
+    )
+
+    # Display detailed results in the chat interface
+    for key, value in final_state.items():
+        if value and key not in [
+            "context",
+            "retrievals",
+            "patient_profile",
+        ]:  # Exclude raw context and patient profile for cleaner display
+            st.session_state["messages"].append(
+                {
+                    "role": "assistant",
+                    "content": f"**📌 {key.upper().replace('_', ' ')}:**",
+                }
+            )
+            display_value = value  # Start with the full object
+            if hasattr(value, "content"):
+                # If it's a LangChain message object, extract its content
+                display_value = value.content
+            elif isinstance(value, dict) and "content" in value:
+                # If it's a dictionary that contains a 'content' key
+                display_value = value["content"]
+            # For displaying complex outputs like dicts/lists, convert to string or specific format
+            content_to_display = safe_display_as_string(display_value)
+            st.session_state["messages"].append(
+                {"role": "assistant", "content": content_to_display}
+            )
+
+
 def render_chat_interface():
     st.markdown(
         """
@@ -511,49 +633,15 @@ def render_chat_interface():
             {"role": "user", "content": "Running analysis..."}
         )
 
+        run_id = new_run_id()
         with st.spinner("🧠 MedAgenticSage is analyzing the case..."):
             try:
                 # Invoke the LangGraph agent
-                final_state = graph.invoke(initial_state)
-
-                # Serialize states for saving
-                initial_state_serialized = serialize_state(initial_state)
-                final_state_serialized = serialize_state(final_state)
+                with record_spans() as recorder:
+                    final_state = invoke_graph(graph, initial_state, run_id=run_id)
 
-                # Save the run to the database
-                AGENT_DB.save_run(initial_state_serialized, final_state_serialized)
-
-                st.session_state["messages"].append(
-                    {
-                        "role": "assistant",
-                        "content": "✅ Analysis complete! Here are the findings:",
-                    }
-                )
-
-                # Display detailed results in the chat interface
-                for key, value in final_state.items():
-                    if value and key not in [
-                        "context",
-                        "patient_profile",
-                    ]:  # Exclude raw context and patient profile for cleaner display
-                        st.session_state["messages"].append(
-                            {
-                                "role": "assistant",
-                                "content": f"**📌 {key.upper().replace('_', ' ')}:**",
-                            }
-                        )
-                        display_value = value  # Start with the full object
-                        if hasattr(value, "content"):
-                            # If it's a LangChain message object, extract its content
-                            display_value = value.content
-                        elif isinstance(value, dict) and "content" in value:
-                            # If it's a dictionary that contains a 'content' key
-                            display_value = value["content"]
-                        # For displaying complex outputs like dicts/lists, convert to string or specific format
-                        content_to_display = safe_display_as_string(display_value)
-                        st.session_state["messages"].append(
-                            {"role": "assistant", "content": content_to_display}
-                        )
+                record_analysis(initial_state, final_state, recorder.spans)
+                st.session_state.pop("failed_run", None)
 
             except Exception as e:
                 st.error(f"An error occurred during analysis: {e}")
@@ -563,10 +651,29 @@ def render_chat_interface():
                         "content": f"❌ An error occurred during analysis: {e}",
                     }
                 )
+                if graph.checkpointer is not None:
+                    # Completed agents are checkpointed; keep the run to resume it
+                    st.session_state["failed_run"] = {
+                        "run_id": run_id,
+                        "initial_state": initial_state,
+                    }
 
     elif submit_button and not symptoms:
         st.error("Please describe the patient's symptoms to start the analysis.")
 
+    failed_run = st.session_state.get("failed_run")
+    if failed_run and st.button(f"🔁 Resume failed run {failed_run['run_id'][:8]}"):
+        with st.spinner("🧠 Resuming from the last completed agent..."):
+            try:
+                with record_spans() as recorder:
+                    final_state = resume_graph(graph, failed_run["run_id"])
+                record_analysis(
+                    failed_run["initial_state"], final_state, recorder.spans
+                )
+                st.session_state.pop("failed_run", None)
+            except Exception as e:
+                st.error(f"Resuming the run failed: {e}")
+
     # Display chat messages (both user input and agent responses)
     st.markdown("---")
     st.subheader("Consultation Log")
@@ -599,47 +706,46 @@ def render_analytics():
     with tab1:
         st.markdown("### Performance Overview")
 
-        # Sample performance data
-        performance_data = pd.DataFrame(
-            {
-                "Agent": [
-                    "Symptom Checker",
-                    "Drug Interaction",
-                    "Literature QA",
-                    "Treatment Planner",
-                    "EHR Summarizer",
-                ],
-                "Usage": [45, 38, 52, 33, 28],
-                "Accuracy": [92, 96, 88, 91, 94],
-                "Avg_Time": [3.2, 1.8, 4.5, 5.1, 2.9],
-            }
-        )
+        # Per-agent latency and tokens recorded from real runs
+        performance_data = pd.DataFrame(AGENT_DB.get_span_stats())
 
-        col1, col2 = st.columns(2)
-
-        with col1:
-            fig = px.bar(
-                performance_data,
-                x="Agent",
-                y="Usage",
-                title="Agent Usage Distribution",
-                color="Usage",
-                color_continuous_scale="viridis",
+        if performance_data.empty:
+            st.info("No instrumented runs yet. Run a case from the Chat page first.")
+        else:
+            performance_data = performance_data.rename(
+                columns={
+                    "name": "Agent",
+                    "calls": "Usage",
+                    "p50_ms": "p50 (ms)",
+                    "p95_ms": "p95 (ms)",
+                }
             )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            col1, col2 = st.columns(2)
+
+            with col1:
+                fig = px.bar(
+                    performance_data,
+                    x="Agent",
+                    y=["p50 (ms)", "p95 (ms)"],
+                    barmode="group",
+                    title="Latency per Agent (p50 / p95)",
+                )
+                fig.update_layout(height=400)
+                st.plotly_chart(fig, use_container_width=True)
+
+            with col2:
+                fig = px.scatter(
+                    performance_data,
+                    x="prompt_tokens",
+                    y="p95 (ms)",
+                    size="Usage",
+                    hover_name="Agent",
+                    title="Prompt Tokens vs p95 Latency",
+                )
+                fig.update_layout(height=400)
+                st.plotly_chart(fig, use_container_width=True)
 
-        with col2:
-            fig = px.scatter(
-                performance_data,
-                x="Accuracy",
-                y="Avg_Time",
-                size="Usage",
-                hover_name="Agent",
-                title="Accuracy vs Response Time",
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(performance_data, use_container_width=True)
 
     with tab2:
         st.markdown("### Accuracy Analysis")
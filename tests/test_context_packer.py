@@ -0,0 +1,46 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from backend.agents.context_packer import ContextPacker, get_context_packer
+from backend.agents.templates import Runner
+
+
+def test_pack_keeps_rank_order_and_skips_duplicates():
+    packer = ContextPacker(budget=13, min_chunk_tokens=2)
+    chunks = ["a" * 16, "a" * 16, "b" * 16, "c" * 40]
+    text, report = packer.pack(chunks)
+    # 4 + (1 + 4) tokens for the two distinct chunks, the third is cut to 3
+    assert text.split("\n") == ["a" * 16, "b" * 16, "c" * 12]
+    assert report["chunks_in"] == 4 and report["chunks_kept"] == 3
+    assert report["tokens_out"] <= 13
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"]
+
+
+def test_pack_drops_the_rest_below_min_chunk_tokens():
+    packer = ContextPacker(budget=6, min_chunk_tokens=4)
+    text, report = packer.pack(["a" * 16, "b" * 40])
+    assert text == "a" * 16
+    assert report["chunks_kept"] == 1
+
+
+def test_pack_text_keeps_head_and_tail():
+    packer = ContextPacker(budget=20, tail_ratio=0.5)
+    note = "HEAD" + "x" * 400 + "TAIL"
+    text, report = packer.pack_text(note)
+    assert text.startswith("HEAD") and text.endswith("TAIL") and "[...]" in text
+    assert report["tokens_out"] <= 20 < report["tokens_in"]
+    assert packer.pack_text("short")[0] == "short"
+
+
+def test_no_budget_means_no_packer():
+    assert get_context_packer(None) is None
+    assert get_context_packer(100).budget == 100
+
+
+@pytest.mark.parametrize("budget", [None, 50])
+def test_runner_packs_chat_messages_as_text(monkeypatch, budget):
+    monkeypatch.setattr(Runner, "context_packer", get_context_packer(budget))
+    diagnosis = AIMessage(content="Likely influenza; urgency low.")
+    assert Runner._pack("drug_interactions", diagnosis) == diagnosis.content
+    assert Runner._pack("literature_qa", ["one", "two"]) == "one\ntwo"
+    assert Runner._pack("drug_interactions", "") == ""
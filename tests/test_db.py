@@ -0,0 +1,13 @@
+from backend.db.api import SqliteDB_Agent
+
+
+def test_node_outputs_are_capped(tmp_path):
+    db = SqliteDB_Agent(str(tmp_path), "runs", max_node_outputs=3)
+    db.create_table()
+    for i in range(5):
+        db.save_node_output("literature_qa", f"fp-{i}", {"answer": i})
+    assert db.get_node_output("literature_qa", "fp-0") is None
+    assert db.get_node_output("literature_qa", "fp-1") is None
+    assert db.get_node_output("literature_qa", "fp-4") == {"answer": 4}
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM node_outputs").fetchone()[0] == 3
@@ -0,0 +1,57 @@
+import numpy as np
+
+from backend.vector_db.embedding_cache import EmbeddingCache
+
+
+def encoder(calls):
+    def encode(texts):
+        calls.extend(texts)
+        return np.array([[len(text), ord(text[0]), 0.5, 1.0] for text in texts])
+
+    return encode
+
+
+def test_entries_are_buffered_until_a_batch_is_full(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), write_batch=3)
+    calls = []
+    first = cache.embed("model", ["a", "bb"], encoder(calls))
+    # Buffered entries are served from memory but not on disk yet
+    assert np.array_equal(
+        cache.embed("model", ["bb", "a"], encoder(calls)), first[::-1]
+    )
+    assert calls == ["a", "bb"]
+    assert EmbeddingCache(str(tmp_path)).get_many("model", ["a"]) == [None]
+
+    cache.embed("model", ["ccc"], encoder(calls))
+    stored = EmbeddingCache(str(tmp_path)).get_many("model", ["a", "bb", "ccc"])
+    assert all(vector is not None for vector in stored)
+    assert np.array_equal(np.stack(stored[:2]), first)
+
+
+def test_max_entries_reuses_the_oldest_rows(tmp_path):
+    cache = EmbeddingCache(
+        str(tmp_path), initial_capacity=2, max_entries=4, write_batch=1
+    )
+    calls = []
+    texts = [f"text {i}" for i in range(6)]
+    for text in texts:
+        cache.embed("model", [text], encoder(calls))
+    found = cache.get_many("model", texts)
+    assert [vector is not None for vector in found] == [False, False] + [True] * 4
+    assert cache.stats()["entries"] == {"model": 4}
+    vector_files = [path for path in tmp_path.iterdir() if path.suffix == ".f16"]
+    assert vector_files[0].stat().st_size == 4 * 4 * 2
+
+
+def test_processes_sharing_a_path_do_not_overwrite_each_other(tmp_path):
+    # Two caches on one path stand in for two processes
+    first, second = (EmbeddingCache(str(tmp_path), write_batch=1) for _ in range(2))
+    calls = []
+    first.embed("model", ["warfarin"], encoder(calls))
+    second.get_many("model", ["warfarin"])
+    a = first.embed("model", ["aspirin"], encoder(calls))
+    b = second.embed("model", ["bisoprolol"], encoder(calls))
+    for cache in (first, second, EmbeddingCache(str(tmp_path))):
+        found = cache.get_many("model", ["aspirin", "bisoprolol"])
+        assert np.array_equal(found[0], a[0])
+        assert np.array_equal(found[1], b[0])
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import numpy as np
+
+from backend.vector_db.embedding_scheduler import EmbeddingScheduler
+
+
+class SlowEncoder:
+    """Encodes each text as [len(text), normalize] and records every call."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts, batch_size=None, normalize=False):
+        with self.lock:
+            self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return np.array([[len(text), float(normalize)] for text in texts])
+
+
+def test_concurrent_requests_share_forward_passes():
+    encoder = SlowEncoder()
+    scheduler = EmbeddingScheduler(encoder, max_batch_size=64, max_wait_ms=20)
+    results = {}
+
+    def caller(i):
+        texts = ["x" * (i * 10 + j) for j in range(3)]
+        results[i] = (texts, scheduler.embed(texts))
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    # Every caller gets exactly its own rows back
+    for texts, vectors in results.values():
+        assert vectors[:, 0].tolist() == [len(text) for text in texts]
+    stats = scheduler.stats()
+    assert stats["requests"] == 16 and stats["items"] == 48
+    assert len(encoder.calls) < 16
+
+
+def test_requests_with_different_options_are_encoded_apart():
+    encoder = SlowEncoder(delay=0)
+    scheduler = EmbeddingScheduler(encoder, max_wait_ms=50)
+    plain = scheduler.submit(["a", "bb"])
+    normalized = scheduler.submit(["ccc"], normalize=True)
+    assert plain.result()[:, 1].tolist() == [0.0, 0.0]
+    assert normalized.result().tolist() == [[3.0, 1.0]]
+    scheduler.close()
+
+
+def test_close_drains_the_queue_then_encodes_inline():
+    encoder = SlowEncoder()
+    scheduler = EmbeddingScheduler(encoder, max_batch_size=1, max_wait_ms=0)
+    pending = [scheduler.submit([f"text {i}"]) for i in range(5)]
+    scheduler.close()
+    assert all(future.done() for future in pending)
+    assert not scheduler._worker.is_alive()
+
+    # Late callers (e.g. a memory writer flushing at exit) still get vectors
+    assert scheduler.embed(["late"]).tolist() == [[4.0, 0.0]]
+    scheduler.close()
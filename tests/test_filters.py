@@ -0,0 +1,68 @@
+import faiss
+import numpy as np
+import pytest
+
+from backend.vector_db.filters import MetadataIndex, matches, search_subset
+from backend.vector_db.quantization import make_index
+
+DIM = 16
+DATA = np.random.default_rng(0).random((300, DIM), dtype="float32")
+
+
+def build(precision, tier="flat", rerank=False):
+    index = make_index(DIM, precision, tier, nlist=4, pq_m=4, pq_nbits=4, rerank=rerank)
+    index.train(DATA)
+    index.add(DATA)
+    if tier == "ivf":
+        faiss.extract_index_ivf(index).nprobe = 4
+    return index
+
+
+INDEXES = {
+    "flat": lambda: build("float32"),
+    "int8": lambda: build("int8"),
+    "pq": lambda: build("pq"),
+    "pq-rerank": lambda: build("pq", rerank=True),
+    "ivf": lambda: build("float32", "ivf"),
+    "hnsw": lambda: build("float32", "hnsw"),
+}
+
+
+@pytest.mark.parametrize("name", list(INDEXES))
+def test_results_stay_inside_the_mask(name):
+    index = INDEXES[name]()
+    mask = np.zeros(len(DATA), dtype=bool)
+    mask[::3] = True
+    distances, found = search_subset(index, DATA[:5], 4, mask)
+    assert found.shape == distances.shape == (5, 4)
+    assert mask[found[found >= 0]].all()
+    if name in ("flat", "pq-rerank"):
+        assert found[0, 0] == 0 and found[3, 0] == 3
+
+
+@pytest.mark.parametrize("name", list(INDEXES))
+def test_empty_and_small_masks_pad_to_k(name):
+    index = INDEXES[name]()
+    distances, found = search_subset(index, DATA[:2], 3, np.zeros(len(DATA), bool))
+    assert found.shape == distances.shape == (2, 3)
+    assert (found == -1).all()
+
+    mask = np.zeros(len(DATA), dtype=bool)
+    mask[7] = True
+    _, found = search_subset(index, DATA[:2], 3, mask)
+    assert found.shape == (2, 3)
+    assert found[:, 0].tolist() == [7, 7]
+    assert (found[:, 1:] == -1).all()
+
+
+def test_metadata_index_masks_match_filters():
+    metadatas = [{"source": f"doc{i % 3}.pdf", "page": i} for i in range(30)]
+    index = MetadataIndex()
+    index.add(range(30), metadatas)
+    for filter in (
+        {"source": "doc1.pdf"},
+        {"source": ["doc0.pdf", "doc2.pdf"], "page": {"$gte": 10, "$lt": 20}},
+        {"missing": 1},
+    ):
+        expected = [matches(metadata, filter) for metadata in metadatas]
+        assert index.mask(filter, 30).tolist() == expected
@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import re
+import threading
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+
+pytest.importorskip("langchain_community")
+graph = pytest.importorskip("backend.agents.graph")
+
+from backend.agents import nodes  # noqa: E402
+from backend.agents.memory import MemoryStore  # noqa: E402
+from backend.db.api import SqliteDB_Agent  # noqa: E402
+from backend.vector_db.clients import VectorStoreBase  # noqa: E402
+
+DIM = 32
+AGENT_PROMPTS = {
+    "symptom_checker": "diagnostic medical assistant",
+    "ehr_summarizer": "clinical summarization agent",
+    "literature_qa": "latest PubMed literature",
+    "drug_checker": "medical safety assistant",
+    "treatment_planner": "clinical decision support assistant",
+}
+
+
+class FakeChatLLM:
+    """Deterministic chat model: the answer is a hash of the prompt."""
+
+    model_name = "fake-chat"
+    temperature = 0.0
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = {name: 0 for name in AGENT_PROMPTS}
+        self.lock = threading.Lock()
+
+    def _agent(self, prompt):
+        return next(name for name, marker in AGENT_PROMPTS.items() if marker in prompt)
+
+    def invoke(self, prompt):
+        agent = self._agent(prompt)
+        if agent == self.fail_on:
+            raise RuntimeError(f"{agent} is down")
+        with self.lock:
+            self.calls[agent] += 1
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        return AIMessage(content=f"{agent}:{digest}")
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+class HashEncoder:
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), DIM), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", str(text).lower()):
+                vectors[row, zlib.crc32(word.encode()) % DIM] += 1.0
+        return vectors
+
+
+class CountingStore(VectorStoreBase):
+    """Fixed-corpus store that counts the searches it serves."""
+
+    def __init__(self):
+        self.searches = []
+        self.lock = threading.Lock()
+
+    def add_documents(self, docs, metadata=None):
+        return []
+
+    def get_documents(self, ids):
+        return []
+
+    def iter_documents(self, batch_size=1000):
+        return iter(())
+
+    def similarity_search(self, query, k=3, filter=None):
+        with self.lock:
+            self.searches.append(query)
+        return [Document(page_content=f"evidence {i} on {query}") for i in range(k)]
+
+    def as_retriever(self, k=3):
+        return self
+
+
+SYMPTOMS_CASE = {
+    "symptoms": "fever, cough",
+    "ehr_text": "Discharged after pneumonia, on amoxicillin.",
+    "question": None,
+    "medications": ["amoxicillin", "ibuprofen"],
+    "patient_profile": {"age": 40, "sex": "Female", "comorbidities": []},
+}
+QUESTION_CASE = {**SYMPTOMS_CASE, "question": "Is amoxicillin safe with ibuprofen?"}
+
+
+def build(llm, store=None, **kwargs):
+    return graph.build_graph(
+        llm=llm,
+        retriever=store if store is not None else CountingStore(),
+        embedding_model=HashEncoder(),
+        memory_store=MemoryStore(dim=DIM),
+        **kwargs,
+    )
+
+
+def test_async_graph_rejects_the_sync_checkpointer(tmp_path):
+    checkpointer = SqliteDB_Agent(str(tmp_path), "runs").get_checkpointer()
+    with pytest.raises(ValueError):
+        build(FakeChatLLM(), asynchronous=True, checkpointer=checkpointer)
+
+
+def test_failed_run_resumes_and_finished_runs_are_pruned(tmp_path):
+    checkpointer = SqliteDB_Agent(str(tmp_path), "runs").get_checkpointer()
+    llm = FakeChatLLM(fail_on="drug_checker")
+    app = build(llm, checkpointer=checkpointer)
+    run_id = graph.new_run_id()
+
+    with pytest.raises(RuntimeError):
+        graph.invoke_graph(app, dict(SYMPTOMS_CASE), run_id=run_id)
+    assert checkpointer.get_tuple(graph.run_config(run_id)) is not None
+
+    llm.fail_on = None
+    final_state = graph.resume_graph(app, run_id)
+    assert final_state["treatment_plan"].content.startswith("treatment_planner:")
+    # Agents that completed before the failure are not called again
+    assert llm.calls["symptom_checker"] == 1
+    assert llm.calls["drug_checker"] == 1
+    assert checkpointer.get_tuple(graph.run_config(run_id)) is None
+
+    other_run = graph.new_run_id()
+    graph.invoke_graph(app, dict(SYMPTOMS_CASE), run_id=other_run)
+    assert checkpointer.get_tuple(graph.run_config(other_run)) is None
+
+
+def test_async_incremental_runs_reuse_outputs_off_the_event_loop(tmp_path):
+    agent_db = SqliteDB_Agent(str(tmp_path), "runs")
+    agent_db.create_table()
+    db_threads = []
+    for name in ("get_node_output", "save_node_output"):
+        method = getattr(agent_db, name)
+
+        def recorded(*args, _method=method):
+            db_threads.append(threading.current_thread())
+            return _method(*args)
+
+        setattr(agent_db, name, recorded)
+
+    llm = FakeChatLLM()
+    app = build(llm, asynchronous=True, agent_db=agent_db)
+
+    async def run():
+        return await app.ainvoke(dict(SYMPTOMS_CASE)), threading.current_thread()
+
+    first, loop_thread = asyncio.run(run())
+    second, _ = asyncio.run(run())
+    assert second["diagnosis"].content == first["diagnosis"].content
+    assert llm.calls["symptom_checker"] == 1
+    assert db_threads and loop_thread not in db_threads
+
+
+OUTPUTS = (
+    "diagnosis",
+    "summary",
+    "literature_answer",
+    "interaction_report",
+    "treatment_plan",
+)
+
+
+def run_both_modes(case):
+    results = {}
+    for parallel in (False, True):
+        llm = FakeChatLLM()
+        final_state = build(llm, parallel=parallel).invoke(dict(case))
+        results[parallel] = (final_state, llm.calls)
+    return results
+
+
+def content(final_state, key):
+    value = final_state.get(key)
+    return getattr(value, "content", value)
+
+
+def test_parallel_matches_sequential_for_a_symptoms_case():
+    results = run_both_modes(SYMPTOMS_CASE)
+    (sequential, _), (parallel, calls) = results[False], results[True]
+    for key in OUTPUTS:
+        assert content(parallel, key) == content(sequential, key)
+    # Fanned out agents all reach the join; literature_qa is skipped without a question
+    assert content(parallel, "literature_answer") is None
+    assert calls == {**{name: 1 for name in AGENT_PROMPTS}, "literature_qa": 0}
+
+
+def test_parallel_question_case_also_runs_symptom_and_ehr_agents():
+    results = run_both_modes(QUESTION_CASE)
+    (sequential, sequential_calls), (parallel, parallel_calls) = (
+        results[False],
+        results[True],
+    )
+    for key in ("literature_answer", "treatment_plan"):
+        assert content(parallel, key) == content(sequential, key)
+    # The sequential graph routes a question past symptom_checker/ehr_summarizer
+    assert (
+        sequential_calls["symptom_checker"] == sequential_calls["ehr_summarizer"] == 0
+    )
+    assert content(sequential, "diagnosis") is None
+    assert parallel_calls == {name: 1 for name in AGENT_PROMPTS}
+    assert content(parallel, "diagnosis") and content(parallel, "summary")
+    # so drug_checker sees a diagnosis in parallel mode only
+    assert content(parallel, "interaction_report") != content(
+        sequential, "interaction_report"
+    )
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_a_run_searches_the_corpus_once(parallel):
+    store = CountingStore()
+    final_state = build(FakeChatLLM(), store, parallel=parallel).invoke(
+        dict(QUESTION_CASE)
+    )
+    # inject_context's search is reused by literature_qa
+    assert store.searches == [QUESTION_CASE["question"]]
+    assert list(final_state["retrievals"]) == [
+        nodes.retrieval_key(QUESTION_CASE["question"])
+    ]
+
+
+def test_retrieval_memo_merges_across_parallel_branches():
+    store = CountingStore()
+
+    def searcher(*queries):
+        def node(state):
+            for query in queries:
+                nodes.retrieve_documents(state, store, query)
+            return {"retrievals": state.get("retrievals")}
+
+        return node
+
+    app = graph._build_parallel_graph(
+        {
+            "inject_context": searcher("gout"),
+            "left": searcher("gout", "colchicine"),
+            "right": searcher("allopurinol"),
+            "both": searcher("gout", "colchicine", "allopurinol"),
+        },
+        dependencies={
+            "left": ["inject_context"],
+            "right": ["inject_context"],
+            "both": ["left", "right"],
+        },
+    )
+    final_state = app.invoke({"symptoms": "gout"})
+    assert sorted(store.searches) == ["allopurinol", "colchicine", "gout"]
+    assert len(final_state["retrievals"]) == 3
@@ -0,0 +1,46 @@
+import pytest
+
+for module in ("bs4", "PyPDF2", "docx2txt"):
+    pytest.importorskip(module)
+
+from backend.agents.ingestion import chunk_text, iter_chunks  # noqa: E402
+
+TEXT = "".join(f"Patient {i} on warfarin {i * 3} mg; INR checked. " for i in range(40))
+
+
+def sliced(text, chunk_size, overlap):
+    """The plain slicing chunk_text has always done."""
+    step = chunk_size - overlap
+    return [text[start : start + chunk_size] for start in range(0, len(text), step)]
+
+
+def segmented(text, sizes):
+    segments, start = [], 0
+    while start < len(text):
+        size = sizes[len(segments) % len(sizes)]
+        segments.append(text[start : start + size])
+        start += size
+    return segments
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(500, 50), (300, 50), (64, 0), (7, 6)])
+@pytest.mark.parametrize("sizes", [[1], [13], [450, 3, 1000], [5000]])
+def test_iter_chunks_matches_chunk_text_over_any_segmentation(
+    chunk_size, overlap, sizes
+):
+    expected = chunk_text(TEXT, chunk_size, overlap)
+    assert expected == sliced(TEXT, chunk_size, overlap)
+    streamed = list(iter_chunks(segmented(TEXT, sizes), chunk_size, overlap))
+    assert [chunk for _, chunk in streamed] == expected
+    assert all(
+        TEXT[offset : offset + chunk_size] == chunk for offset, chunk in streamed
+    )
+
+
+def test_iter_chunks_handles_empty_segments_and_text():
+    assert list(iter_chunks(["", "", ""], 10, 2)) == []
+    assert [c for _, c in iter_chunks(["", TEXT[:25], "", TEXT[25:40]], 10, 2)] == (
+        chunk_text(TEXT[:40], 10, 2)
+    )
+    with pytest.raises(ValueError):
+        list(iter_chunks([TEXT], 10, 10))
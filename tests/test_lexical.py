@@ -0,0 +1,59 @@
+import numpy as np
+
+from backend.vector_db.lexical import BM25Index, get_bm25_index, tokenize
+
+
+def test_tokenize_keeps_codes_together():
+    assert tokenize("CYP2C19 and IL-6, HbA1c 5.2mmol/L") == [
+        "cyp2c19",
+        "and",
+        "il-6",
+        "hba1c",
+        "5.2mmol/l",
+    ]
+
+
+def test_search_ranks_rare_terms_first():
+    index = BM25Index()
+    index.add(["a", "b"], ["aspirin for pain", "aspirin and clopidogrel"])
+    index.add(["c"], ["pain relief"])
+    assert [key for key, _ in index.search("clopidogrel pain", k=3)][0] == "b"
+    assert index.search("warfarin") == []
+    assert len(index.search("aspirin", k=1)) == 1
+
+
+def test_incremental_adds_match_a_single_add():
+    texts = ["metformin lowers glucose", "glucose monitoring", "metformin dose"]
+    once, twice = BM25Index(), BM25Index()
+    once.add(["a", "b", "c"], texts)
+    twice.add(["a"], texts[:1])
+    twice.add(["b", "c"], texts[1:])
+    for query in ("metformin", "glucose dose"):
+        assert once.search(query) == twice.search(query)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    index = BM25Index()
+    index.add(["a", "b"], ["statin therapy", "statin myopathy"])
+    index.save(path)
+    loaded = get_bm25_index(path)
+    assert len(loaded) == 2
+    assert loaded.search("myopathy") == index.search("myopathy")
+    assert len(get_bm25_index(str(tmp_path / "missing.npz"))) == 0
+
+
+def test_delta_segment_merges_into_the_same_postings():
+    texts = [f"drug{i % 7} dose {i % 3} interaction drug{i % 5}" for i in range(60)]
+    keys = [str(i) for i in range(60)]
+    once, batched = BM25Index(), BM25Index()
+    once.add(keys, texts)
+    for start in range(0, 60, 4):
+        batched.add(keys[start : start + 4], texts[start : start + 4])
+        if start % 20 == 0:
+            # Searching mid-ingestion merges what has been buffered so far
+            batched.search("drug3 interaction")
+    assert len(once) == len(batched) == 60
+    for name in ("offsets", "doc_ids", "tfs", "doc_lengths", "doc_keys"):
+        assert np.array_equal(getattr(once, name), getattr(batched, name))
+    assert once.search("drug3 dose", k=5) == batched.search("drug3 dose", k=5)
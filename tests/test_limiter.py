@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.agents.templates import Runner
+from backend.llm.limiter import ProcessLimiter
+
+
+class SlowChatModel:
+    """Records how many calls are in flight at once, across every thread."""
+
+    _llm_type = "groq-chat"
+    model_name = "llama3"
+    temperature = 0.7
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    async def ainvoke(self, prompt):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        return prompt
+
+
+@pytest.fixture
+def limits():
+    Runner.configure_concurrency({"groq": 2})
+    yield
+    Runner.configure_concurrency()
+
+
+def test_limit_holds_across_sessions_with_their_own_event_loops(limits):
+    llm = SlowChatModel()
+
+    def session():
+        # Each Streamlit session drives its own loop with asyncio.run
+        async def calls():
+            await asyncio.gather(
+                *(Runner.arun_symptom_checker(f"cough {i}", llm) for i in range(5))
+            )
+
+        asyncio.run(calls())
+
+    threads = [threading.Thread(target=session) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert llm.peak == 2
+    assert Runner._limiter(llm).limit == 2
+
+
+def test_cancelled_waiters_do_not_leak_slots():
+    limiter = ProcessLimiter(1)
+
+    async def run():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        limiter.release()
+
+    asyncio.run(run())
+    assert limiter._active == 0 and not limiter._waiters
+
+
+def test_released_slots_wake_waiters_on_other_loops():
+    limiter = ProcessLimiter(1)
+    acquired = threading.Event()
+
+    async def hold():
+        await limiter.acquire()
+        acquired.set()
+        time.sleep(0.05)
+        limiter.release()
+
+    async def wait():
+        acquired.wait()
+        started = time.perf_counter()
+        async with limiter:
+            return time.perf_counter() - started
+
+    holder = threading.Thread(target=asyncio.run, args=(hold(),))
+    holder.start()
+    waited = asyncio.run(wait())
+    holder.join()
+    assert waited > 0.02
@@ -0,0 +1,154 @@
+import faiss
+import numpy as np
+import pytest
+
+from backend.agents.memory import MemoryStore
+from backend.agents.memory_index import MemoryIndex
+
+DIM = 8
+TIERS = {
+    "flat": {"ivf_threshold": None},
+    "ivf": {"ivf_threshold": 100},
+    "hnsw": {"ivf_threshold": None, "hnsw_threshold": 100},
+}
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype="float32")
+
+
+def make_store(count, index_config, **retention):
+    store = MemoryStore(index=MemoryIndex(DIM, **index_config), **retention)
+    store.add([f"entry {i}" for i in range(count)], [{}] * count, vectors(count))
+    return store
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("tier", list(TIERS))
+def test_save_load_add_across_tiers(tmp_path, tier, mmap):
+    config = dict(TIERS[tier], background=False)
+    store = make_store(200, config)
+    assert store.index.tier == tier
+    store.save(str(tmp_path))
+
+    loaded = MemoryStore.load(str(tmp_path), mmap=mmap, index_config=config)
+    assert loaded.index.tier == tier
+    assert len(loaded) == 200
+
+    new_vector = vectors(1, seed=1)
+    [entry_id] = loaded.add(["new entry"], [{"source": "test"}], new_vector)
+    assert entry_id == 200
+    [hits] = loaded.search(new_vector, k=1)
+    assert hits[0]["text"] == "new entry"
+
+    loaded.save(str(tmp_path))
+    reloaded = MemoryStore.load(str(tmp_path), mmap=mmap, index_config=config)
+    assert len(reloaded) == 201
+    assert reloaded.get(entry_id)["metadata"]["source"] == "test"
+
+
+def test_eviction_runs_in_batches_down_to_low_water_mark():
+    store = make_store(100, {"ivf_threshold": None}, max_entries=100, evict_to=0.9)
+    store.add(["one more"], [{}], vectors(1, seed=1))
+    assert len(store) == 90
+    # The next adds fit under the cap again, so nothing else is evicted
+    for i in range(10):
+        store.add([f"later {i}"], [{}], vectors(1, seed=2 + i))
+    assert len(store) == 100
+    assert 100 in store and 0 not in store
+
+
+def test_lru_eviction_keeps_recently_retrieved_entries():
+    store = make_store(50, {"ivf_threshold": None}, max_entries=50, evict_to=0.5)
+    store.search(vectors(50)[:5], k=1)
+    store.add(["new"], [{}], vectors(1, seed=1))
+    assert len(store) == 25
+    assert all(entry_id in store for entry_id in range(5))
+
+
+def test_delete_evict_compact_stay_consistent(tmp_path):
+    store = make_store(
+        200, {"ivf_threshold": 100, "background": False}, max_entries=150, evict_to=0.8
+    )
+    assert len(store) == 120
+    assert store.delete(range(100, 120)) == 20
+    store.compact()
+    assert store.index.removed == 0
+    assert store.index.ntotal == len(store) == 100
+
+    live = [i for i in range(200) if i in store]
+    assert len(live) == 100
+    found = {hit["id"] for hits in store.search(vectors(200), k=1) for hit in hits}
+    assert found <= set(live)
+
+
+def test_save_drops_tombstones_from_the_index(tmp_path):
+    config = {"ivf_threshold": 100, "background": False}
+    store = make_store(200, config)
+    store.delete(range(50))
+    assert store.index.removed == 50
+    store.save(str(tmp_path))
+    assert store.index.removed == 0
+    assert store.index.ntotal == 150
+
+    loaded = MemoryStore.load(str(tmp_path), index_config=config)
+    assert loaded.index.removed == 0
+    assert loaded.index.ntotal == len(loaded) == 150
+    assert 0 not in loaded and 50 in loaded
+
+
+@pytest.mark.parametrize("precision", ["int8", "pq"])
+def test_rebuilds_keep_the_trained_quantizer(precision):
+    index = MemoryIndex(
+        DIM,
+        ivf_threshold=800,
+        background=False,
+        precision=precision,
+        pq_m=4,
+        pq_nbits=4,
+    )
+    data = vectors(1000)
+    index.add_with_ids(data[:700], np.arange(700))
+    assert index.state == ("flat", precision)
+    stored = index.faiss_index.reconstruct_n(0, 700)
+
+    index.add_with_ids(data[700:], np.arange(700, 1000))
+    assert index.state == ("ivf", precision)
+    index.remove_ids(range(10))
+    index.compact(wait=True)
+    # Re-encoding with the same quantizer adds no error on top of the first pass
+    faiss.downcast_index(index.faiss_index.index).make_direct_map()
+    assert np.allclose(index.faiss_index.reconstruct(15), stored[15])
+    assert np.allclose(index.faiss_index.reconstruct(699), stored[699])
+    _, found = index.search(stored[10:20], k=1)
+    assert found[:, 0].tolist() == list(range(10, 20))
+
+
+def test_pq_memory_stays_exact_until_it_can_train():
+    index = MemoryIndex(DIM, background=False, precision="pq", pq_m=4, pq_nbits=4)
+    index.add_with_ids(vectors(600), np.arange(600))
+    assert index.state == ("flat", "float32")
+    index.add_with_ids(vectors(24, seed=1), np.arange(600, 624))
+    assert index.state == ("flat", "pq")
+
+
+def test_rebuilds_keep_exact_vectors_with_rerank():
+    index = MemoryIndex(
+        DIM,
+        ivf_threshold=800,
+        background=False,
+        precision="pq",
+        pq_m=4,
+        pq_nbits=4,
+        rerank=True,
+    )
+    data = vectors(1000)
+    index.add_with_ids(data[:700], np.arange(700))
+    assert index.state == ("flat", "pq")
+    index.add_with_ids(data[700:], np.arange(700, 1000))
+    assert index.state == ("ivf", "pq")
+    index.remove_ids(range(10))
+    index.compact(wait=True)
+    _, found = index.search(data[10:20], k=1)
+    assert found[:, 0].tolist() == list(range(10, 20))
+    assert np.array_equal(index.faiss_index.reconstruct(15), data[15])
@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+
+from backend.agents import nodes  # noqa: E402
+from backend.vector_db.clients import VectorStoreBase  # noqa: E402
+
+
+class DictCache:
+    """Exact-match stand-in for SemanticCache."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def lookup(self, namespace, text):
+        return self.entries.get((namespace, text))
+
+    def store(self, namespace, text, answer):
+        self.entries[(namespace, text)] = answer
+
+
+class Corpus(VectorStoreBase):
+    """In-memory literature corpus whose version is its size."""
+
+    def __init__(self, *texts):
+        self.texts = list(texts)
+
+    def add_documents(self, docs, metadata=None):
+        self.texts.extend(docs)
+        return list(docs)
+
+    def get_documents(self, ids):
+        return []
+
+    def iter_documents(self, batch_size=1000):
+        return iter(())
+
+    def similarity_search(self, query, k=3, filter=None):
+        return [Document(page_content=text) for text in self.texts[:k]]
+
+    def corpus_version(self):
+        return str(len(self.texts))
+
+    def as_retriever(self, k=3):
+        return self
+
+
+class FakeLLM:
+    temperature = 0.0
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+@pytest.fixture
+def literature_calls(monkeypatch):
+    calls = []
+
+    def run_literature_qa(question, llm, context):
+        calls.append(llm.model_name)
+        return f"{llm.model_name}: {question}"
+
+    async def arun_literature_qa(question, llm, context):
+        return run_literature_qa(question, llm, context)
+
+    monkeypatch.setattr(nodes.Runner, "run_literature_qa", run_literature_qa)
+    monkeypatch.setattr(nodes.Runner, "arun_literature_qa", arun_literature_qa)
+    monkeypatch.setattr(nodes, "retrieve_context", lambda question, **kwargs: [])
+    monkeypatch.setattr(nodes, "add_to_memory", lambda text, **kwargs: None)
+    return calls
+
+
+def test_literature_cache_is_per_model(literature_calls):
+    cache, corpus = DictCache(), Corpus("colchicine for gout")
+    for model in ("model-a", "model-a", "model-b"):
+        state = nodes.literature_node(
+            {"question": "What treats gout?"},
+            FakeLLM(model),
+            retriever=corpus,
+            semantic_cache=cache,
+        )
+        assert state["literature_answer"] == f"{model}: What treats gout?"
+    assert literature_calls == ["model-a", "model-b"]
+
+
+def test_async_literature_node_uses_cache(literature_calls):
+    cache, corpus = DictCache(), Corpus("colchicine for gout")
+    llm = FakeLLM("model-a")
+
+    async def run():
+        for _ in range(2):
+            state = await nodes.aliterature_node(
+                {"question": "What treats gout?"},
+                llm,
+                retriever=corpus,
+                semantic_cache=cache,
+            )
+            assert state["literature_answer"] == "model-a: What treats gout?"
+
+    asyncio.run(run())
+    assert literature_calls == ["model-a"]
+
+
+def test_literature_cache_follows_the_corpus(literature_calls):
+    cache, corpus, llm = DictCache(), Corpus("colchicine for gout"), FakeLLM("model-a")
+
+    def ask(retriever):
+        nodes.literature_node(
+            {"question": "What treats gout?"},
+            llm,
+            retriever=retriever,
+            semantic_cache=cache,
+        )
+
+    ask(corpus)
+    ask(corpus)
+    assert len(literature_calls) == 1
+    # New literature: the cached answer may be outdated
+    corpus.add_documents(["allopurinol lowers urate"])
+    ask(corpus)
+    assert len(literature_calls) == 2
+    # Answers grounded in agent memory are never cached
+    ask(None)
+    ask(None)
+    assert len(literature_calls) == 4
+
+
+def test_literature_fingerprint_follows_retrieved_context():
+    graph = pytest.importorskip("backend.agents.graph")
+
+    def fingerprint(chunks):
+        state = {
+            "question": "What treats gout?",
+            "retrievals": {nodes.retrieval_key("What treats gout?"): chunks},
+        }
+        return graph.fingerprint_inputs(
+            "literature_qa", state, nodes.literature_node.reads, FakeLLM("model-a")
+        )
+
+    assert fingerprint(["colchicine"]) == fingerprint(["colchicine"])
+    assert fingerprint(["colchicine"]) != fingerprint(["colchicine", "allopurinol"])
+
+
+class RecordingChatLLM(FakeLLM):
+    def __init__(self, model_name="chat"):
+        super().__init__(model_name)
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content="No interactions found.")
+
+
+def test_drug_node_accepts_a_chat_message_diagnosis(monkeypatch):
+    monkeypatch.setattr(nodes, "add_to_memory", lambda text, **kwargs: None)
+    llm = RecordingChatLLM()
+    state = nodes.drug_node(
+        {
+            "medications": "warfarin, aspirin",
+            "diagnosis": AIMessage(content="Atrial fibrillation"),
+        },
+        llm,
+    )
+    assert state["interaction_report"].content == "No interactions found."
+    assert "Atrial fibrillation" in llm.prompts[0]
+    assert "warfarin, aspirin" in llm.prompts[0]
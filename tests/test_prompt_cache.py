@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+from langchain_core.messages import AIMessage
+
+from backend.agents.templates import Runner
+from backend.llm.cache import PromptCache
+
+
+class FakeChatModel:
+    _llm_type = "groq-chat"
+    temperature = 0.0
+
+    def __init__(self, model_name="llama3"):
+        self.model_name = model_name
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return AIMessage(content=f"{self.model_name}: {prompt}")
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+def test_keys_depend_on_model_and_prompt(tmp_path):
+    cache = PromptCache(str(tmp_path))
+    a, b = FakeChatModel("llama3"), FakeChatModel("mixtral")
+    assert cache.describe_llm(a) == ("groq", "llama3", 0.0)
+    assert cache.key_for(a, "hi") == cache.key_for(FakeChatModel("llama3"), "hi")
+    assert cache.key_for(a, "hi") != cache.key_for(b, "hi")
+    assert cache.key_for(a, "hi") != cache.key_for(a, "hello")
+    a.temperature = 0.7
+    assert cache.key_for(a, "hi") is None
+
+
+def test_async_invoke_reads_the_cache_off_the_event_loop(tmp_path, monkeypatch):
+    cache = PromptCache(str(tmp_path))
+    threads = []
+    get = cache.get
+
+    def recording_get(key):
+        threads.append(threading.current_thread())
+        return get(key)
+
+    monkeypatch.setattr(cache, "get", recording_get)
+    monkeypatch.setattr(Runner, "cache", cache)
+    llm = FakeChatModel()
+
+    async def run():
+        first = await Runner._ainvoke(llm, "prompt")
+        second = await Runner._ainvoke(llm, "prompt")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.content == second.content == "llama3: prompt"
+    assert llm.calls == 1
+    assert threads and threading.main_thread() not in threads
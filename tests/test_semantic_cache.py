@@ -0,0 +1,33 @@
+import re
+import zlib
+
+import numpy as np
+
+from backend.agents.semantic_cache import SemanticCache
+from backend.agents.telemetry import span
+
+DIM = 64
+
+
+class HashEncoder:
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), DIM), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text):
+                vectors[row, zlib.crc32(word.encode()) % DIM] += 1.0
+        return vectors
+
+
+def test_hit_is_recorded_on_the_current_span():
+    cache = SemanticCache(HashEncoder(), threshold=0.9)
+    cache.store("symptom_checker", "cough, fever", "flu")
+    with span("symptom_checker", "node") as node:
+        assert cache.lookup("symptom_checker", "Fever cough") == "flu"
+    assert node["attributes"]["semantic_similarity"] >= 0.9
+    assert node["attributes"]["semantic_match"] == "cough, fever"
+    assert cache.lookup("symptom_checker", "rash") is None
+    assert cache.lookup("literature_qa", "cough, fever") is None
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,23 @@
+from backend.agents.telemetry import annotate_span, record_spans, span
+
+
+def test_node_span_rolls_up_tokens_and_cache_hits():
+    with record_spans() as recorder:
+        with span("literature_qa", "node") as node:
+            annotate_span(cache_hit=False)
+            with span("llm", "llm") as first:
+                first.update(cache_hit=False, prompt_tokens=10, completion_tokens=5)
+            with span("llm", "llm") as second:
+                second.update(cache_hit=True, prompt_tokens=0, completion_tokens=0)
+            with span("llm", "llm") as third:
+                third.update(cache_hit=False, prompt_tokens=3, completion_tokens=2)
+    assert node["cache_hit"] is True
+    assert (node["prompt_tokens"], node["completion_tokens"]) == (13, 7)
+    assert len(recorder.spans) == 4
+
+
+def test_node_span_without_cached_calls_is_a_miss():
+    with span("ehr_summarizer", "node") as node:
+        with span("llm", "llm") as call:
+            call.update(cache_hit=False)
+    assert node["cache_hit"] is False
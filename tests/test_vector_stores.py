@@ -0,0 +1,168 @@
+import os
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from backend.vector_db import clients  # noqa: E402
+from backend.vector_db.quantization import precision_of  # noqa: E402
+from backend.vector_db.clients import (  # noqa: E402
+    FAISSVectorStore,
+    HybridVectorStore,
+    content_id,
+)
+
+DIM = 64
+
+DOCS = [
+    "Metformin is a first line treatment for type 2 diabetes",
+    "Ibuprofen relieves pain and reduces fever",
+    "Amoxicillin treats bacterial infections such as otitis",
+    "Lisinopril lowers blood pressure in hypertension",
+    "Atorvastatin reduces LDL cholesterol",
+    "Salbutamol relieves bronchospasm in asthma",
+]
+
+
+class HashEmbeddings(Embeddings):
+    """Bag-of-words vectors hashed into DIM buckets: deterministic and offline."""
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), DIM), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % DIM] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+@pytest.fixture(autouse=True)
+def hash_embeddings(monkeypatch):
+    monkeypatch.setattr(
+        clients, "get_embedding_service", lambda *args, **kwargs: HashEmbeddings()
+    )
+
+
+def texts(documents):
+    return [document.page_content for document in documents]
+
+
+def test_faiss_store_saves_on_flush_only(tmp_path):
+    store = FAISSVectorStore(persist_dir=str(tmp_path))
+    store.add_documents(DOCS[:3])
+    store.add_documents(DOCS[3:])
+    assert not os.path.exists(tmp_path / "CURRENT")
+
+    store.flush()
+    assert (tmp_path / "CURRENT").read_text() == "gen-0"
+    store.add_documents(["Warfarin is an anticoagulant"])
+    store.flush()
+    assert (tmp_path / "CURRENT").read_text() == "gen-1"
+    assert sorted(os.listdir(tmp_path)) == ["CURRENT", "gen-1"]
+
+
+def test_faiss_store_reloads_documents_and_dedupes(tmp_path):
+    store = FAISSVectorStore(persist_dir=str(tmp_path))
+    assert store.add_documents(DOCS, [{"n": i} for i in range(len(DOCS))]) == [
+        content_id(text) for text in DOCS
+    ]
+    store.flush()
+
+    loaded = FAISSVectorStore(persist_dir=str(tmp_path))
+    assert loaded.store.index.ntotal == len(DOCS)
+    assert loaded.add_documents(DOCS[:2]) == []
+    assert texts(loaded.similarity_search("ibuprofen fever", k=1)) == [DOCS[1]]
+    assert texts(loaded.similarity_search("treatment", k=1, filter={"n": 0})) == [
+        DOCS[0]
+    ]
+
+
+def test_faiss_store_loads_legacy_layout(tmp_path):
+    store = FAISSVectorStore()
+    store.add_documents(DOCS)
+    legacy = tmp_path / "legacy"
+    store.save(str(tmp_path / "saved"))
+    os.rename(tmp_path / "saved" / "gen-0", legacy)
+
+    loaded = FAISSVectorStore(persist_dir=str(legacy))
+    assert texts(loaded.get_documents([content_id(DOCS[2])])) == [DOCS[2]]
+
+
+def test_hybrid_fusion_surfaces_exact_term_matches():
+    dense = FAISSVectorStore()
+    hybrid = HybridVectorStore(dense, candidates=2)
+    code = "Patient carries the CYP2C19 loss of function allele"
+    hybrid.add_documents(DOCS + [code])
+    assert code in texts(hybrid.similarity_search("CYP2C19", k=2))
+    # RRF: a document ranked first by both retrievers scores highest
+    assert texts(hybrid.similarity_search("ibuprofen fever pain", k=1)) == [DOCS[1]]
+
+
+def test_hybrid_fusion_applies_filter_to_bm25_hits():
+    hybrid = HybridVectorStore(FAISSVectorStore())
+    hybrid.add_documents(DOCS, [{"n": i} for i in range(len(DOCS))])
+    found = hybrid.similarity_search("amoxicillin", k=3, filter={"n": {"$lt": 2}})
+    assert found and all(document.metadata["n"] < 2 for document in found)
+
+
+def test_hybrid_saves_bm25_on_flush_and_backfills(tmp_path):
+    dense = FAISSVectorStore(persist_dir=str(tmp_path))
+    dense.add_documents(DOCS)
+    dense.flush()
+
+    # Hybrid turned on over an existing store: BM25 is built from its documents
+    hybrid = HybridVectorStore(
+        FAISSVectorStore(persist_dir=str(tmp_path)), str(tmp_path)
+    )
+    assert len(hybrid.lexical) == len(DOCS)
+    hybrid.add_documents(["Warfarin is an anticoagulant"])
+    assert not os.path.exists(tmp_path / "bm25.npz")
+    hybrid.flush()
+
+    reloaded = HybridVectorStore(
+        FAISSVectorStore(persist_dir=str(tmp_path)), str(tmp_path)
+    )
+    assert len(reloaded.lexical) == len(DOCS) + 1
+    assert texts(reloaded.similarity_search("warfarin", k=1)) == [
+        "Warfarin is an anticoagulant"
+    ]
+
+
+def test_pq_store_stays_exact_until_it_can_train():
+    store = FAISSVectorStore(precision="pq", pq_m=8, pq_nbits=4)
+    store.add_documents(DOCS)
+    assert precision_of(store.store.index) == "float32"
+    assert texts(store.similarity_search("lisinopril hypertension", k=1)) == [DOCS[3]]
+
+    # 39 training vectors per PQ centroid (2**4 of them)
+    notes = [f"note {i} about dosing interval {i * 7}" for i in range(39 * 16)]
+    store.add_documents(notes[:100])
+    assert precision_of(store.store.index) == "float32"
+    store.add_documents(notes[100:])
+    assert precision_of(store.store.index) == "pq"
+    assert store.store.index.ntotal == len(DOCS) + len(notes)
+    assert texts(store.get_documents([content_id(DOCS[3])])) == [DOCS[3]]
+
+
+def test_corpus_version_changes_only_when_documents_are_added():
+    store = HybridVectorStore(FAISSVectorStore())
+    store.add_documents(DOCS)
+    version = store.corpus_version()
+    store.add_documents(DOCS[:2])
+    assert store.corpus_version() == version
+    store.add_documents(["Colchicine treats gout flares"])
+    assert store.corpus_version() != version